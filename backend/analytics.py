@@ -0,0 +1,227 @@
+"""
+Per-user goal analytics computed with NumPy.
+
+A user's goals, their progress history (`goal_progress`) and statistics are
+read as plain column rows and turned into arrays. Everything is then
+computed in one pass of grouped array operations (`np.bincount` over goal
+and sector indexes) instead of a Python loop per goal:
+
+- completion rate and average progress per sector
+- progress velocity per goal: least-squares slope of its value over time
+- ETA and deadline risk from the remaining distance at that velocity
+- weekly trends for the last ANALYTICS_WEEKS weeks
+
+`/api/analytics` serves the result through the response cache under the
+user's goal and sector tags, so any goal change invalidates it.
+"""
+import os
+from datetime import datetime, timedelta
+from typing import Optional
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+import models
+
+ANALYTICS_WEEKS = int(os.getenv("ANALYTICS_WEEKS", "12"))
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def record_progress(db: Session, goal_id: int, value: Optional[float]):
+    """Append a goal's new current_value to its history, committed with the caller"""
+    if value is not None:
+        db.add(models.GoalProgress(goal_id=goal_id, value=value))
+
+
+def _days(values) -> np.ndarray:
+    """Datetimes as float days since the epoch; NaN where missing"""
+    stamps = np.array(values, dtype="datetime64[s]")
+    return (stamps - np.datetime64(0, "s")) / np.timedelta64(1, "D")
+
+
+def _datetime(days: float) -> Optional[datetime]:
+    return None if np.isnan(days) else EPOCH + timedelta(days=float(days))
+
+
+def _rate(numerator: float, denominator: float) -> Optional[float]:
+    return round(float(numerator / denominator), 4) if denominator else None
+
+
+# ==================== LOADING ====================
+
+def _load(db: Session, user_id: int) -> tuple:
+    owned_sectors = select(models.Sector.id).where(
+        models.Sector.user_id == user_id, models.Sector.deleted_at.is_(None)
+    )
+    owned_goals = select(models.Goal.id).where(models.Goal.sector_id.in_(owned_sectors))
+
+    sectors = db.execute(
+        select(models.Sector.id, models.Sector.name, models.Sector.icon, models.Sector.color)
+        .where(models.Sector.id.in_(owned_sectors))
+        .order_by(models.Sector.id)
+    ).all()
+    goals = db.execute(
+        select(
+            models.Goal.id, models.Goal.sector_id, models.Goal.title, models.Goal.target_value,
+            models.Goal.current_value, models.Goal.deadline, models.Goal.is_completed,
+            models.Goal.completed_at, models.Goal.created_at,
+        )
+        .where(models.Goal.id.in_(owned_goals))
+        .order_by(models.Goal.id)
+    ).all()
+    history = db.execute(
+        select(models.GoalProgress.goal_id, models.GoalProgress.value, models.GoalProgress.recorded_at)
+        .where(models.GoalProgress.goal_id.in_(owned_goals))
+        .order_by(models.GoalProgress.goal_id, models.GoalProgress.recorded_at, models.GoalProgress.id)
+    ).all()
+    statistics = db.scalars(
+        select(models.Statistic.recorded_at).where(models.Statistic.sector_id.in_(owned_sectors))
+    ).all()
+    return sectors, goals, history, statistics
+
+
+# ==================== COMPUTATION ====================
+
+def _velocity(goal_index: np.ndarray, times: np.ndarray, values: np.ndarray, n: int) -> np.ndarray:
+    """Least-squares slope (units per day) of each goal's points, 0 with fewer than two"""
+    counts = np.bincount(goal_index, minlength=n)
+    safe_counts = np.maximum(counts, 1)
+    time_mean = np.bincount(goal_index, times, n) / safe_counts
+    value_mean = np.bincount(goal_index, values, n) / safe_counts
+    dt = times - time_mean[goal_index]
+    dv = values - value_mean[goal_index]
+    sxx = np.bincount(goal_index, dt * dt, n)
+    sxy = np.bincount(goal_index, dt * dv, n)
+    return np.divide(sxy, sxx, out=np.zeros(n), where=sxx > 1e-9)
+
+
+def _weekly(days: np.ndarray, first_week: float, weeks: int, weights: Optional[np.ndarray] = None) -> np.ndarray:
+    index = np.floor((days - first_week) / 7)
+    keep = (index >= 0) & (index < weeks)
+    return np.bincount(
+        index[keep].astype(np.int64), None if weights is None else weights[keep], weeks
+    )
+
+
+def compute(db: Session, user_id: int, now: Optional[datetime] = None, weeks: int = ANALYTICS_WEEKS) -> dict:
+    now = now or datetime.utcnow()
+    today = _days([now])[0]
+    sectors, goals, history, statistics = _load(db, user_id)
+
+    sector_ids = np.array([sector.id for sector in sectors], dtype=np.int64)
+    goal_ids = np.array([goal.id for goal in goals], dtype=np.int64)
+    n, m = len(goals), len(sectors)
+
+    sector_index = np.searchsorted(sector_ids, [goal.sector_id for goal in goals]).astype(np.int64)
+    target = np.array([goal.target_value for goal in goals], dtype=float)
+    current = np.nan_to_num(np.array([goal.current_value for goal in goals], dtype=float))
+    completed = np.array([bool(goal.is_completed) for goal in goals], dtype=bool)
+    created = _days([goal.created_at for goal in goals])
+    completed_at = _days([goal.completed_at for goal in goals])
+    deadline = _days([goal.deadline for goal in goals])
+
+    history_goal = np.searchsorted(goal_ids, [row.goal_id for row in history]).astype(np.int64)
+    history_value = np.array([row.value for row in history], dtype=float)
+    history_time = _days([row.recorded_at for row in history])
+
+    # Velocity: the recorded history plus today's value; goals from before
+    # history was kept are anchored at 0 on their creation day
+    without_history = np.flatnonzero(np.bincount(history_goal, minlength=n) == 0)
+    velocity = _velocity(
+        np.concatenate([history_goal, np.arange(n), without_history]),
+        np.concatenate([history_time, np.full(n, today), np.nan_to_num(created[without_history], nan=today)]),
+        np.concatenate([history_value, current, np.zeros(len(without_history))]),
+        n,
+    )
+
+    has_target = ~np.isnan(target) & (target > 0)
+    safe_target = np.where(has_target, target, 1.0)
+    progress = np.where(completed, 1.0, np.where(has_target, np.clip(current / safe_target, 0, 1), np.nan))
+    remaining = np.where(has_target, target - current, np.nan)
+    moving = velocity > 0
+    eta = np.where(has_target & ~completed & moving,
+                   today + np.maximum(remaining, 0) / np.where(moving, velocity, 1.0), np.nan)
+
+    status = np.select(
+        [
+            completed,
+            ~has_target,
+            remaining <= 0,
+            ~np.isnan(deadline) & (deadline < today),
+            ~moving,
+            ~np.isnan(deadline) & (eta > deadline),
+        ],
+        ["completed", "no_target", "on_track", "overdue", "stalled", "at_risk"],
+        "on_track",
+    )
+    at_risk = np.isin(status, ("at_risk", "overdue"))
+
+    # Per sector
+    tracked = completed | has_target
+    sector_goals = np.bincount(sector_index, minlength=m)
+    sector_completed = np.bincount(sector_index, completed, m)
+    sector_tracked = np.bincount(sector_index, tracked, m)
+    sector_progress = np.bincount(sector_index, np.where(tracked, np.nan_to_num(progress), 0), m)
+    sector_at_risk = np.bincount(sector_index, at_risk, m)
+
+    # Weekly trends, Monday to Sunday; progress gained as percent of each goal's target
+    first_week = np.floor(today) - now.weekday() - 7 * (weeks - 1)
+    same_goal = history_goal[1:] == history_goal[:-1]
+    gained = np.where(same_goal, np.diff(history_value), 0.0)
+    gained_percent = np.where(has_target[history_goal[1:]], np.maximum(gained, 0) / safe_target[history_goal[1:]] * 100, 0.0)
+    week_counts = {
+        "goals_created": _weekly(created, first_week, weeks),
+        "goals_completed": _weekly(completed_at, first_week, weeks),
+        "progress_updates": _weekly(history_time, first_week, weeks),
+        "progress_percent_gained": _weekly(history_time[1:], first_week, weeks, gained_percent),
+        "statistics_recorded": _weekly(_days(statistics), first_week, weeks),
+    }
+
+    return {
+        "generated_at": now,
+        "summary": {
+            "goals": n,
+            "completed": int(completed.sum()),
+            "completion_rate": _rate(completed.sum(), n),
+            "at_risk": int((status == "at_risk").sum()),
+            "overdue": int((status == "overdue").sum()),
+            "stalled": int((status == "stalled").sum()),
+        },
+        "sectors": [
+            {
+                "sector_id": int(sector_ids[i]),
+                "name": sectors[i].name,
+                "icon": sectors[i].icon,
+                "color": sectors[i].color,
+                "goals": int(sector_goals[i]),
+                "completed": int(sector_completed[i]),
+                "completion_rate": _rate(sector_completed[i], sector_goals[i]),
+                "average_progress": _rate(sector_progress[i], sector_tracked[i]),
+                "at_risk": int(sector_at_risk[i]),
+            }
+            for i in range(m)
+        ],
+        "forecasts": [
+            {
+                "goal_id": int(goal_ids[i]),
+                "sector_id": goals[i].sector_id,
+                "title": goals[i].title,
+                "progress": None if np.isnan(progress[i]) else round(float(progress[i]), 4),
+                "velocity_per_day": round(float(velocity[i]), 4),
+                "eta": _datetime(eta[i]),
+                "deadline": goals[i].deadline,
+                "status": str(status[i]),
+            }
+            for i in np.flatnonzero(~completed)
+        ],
+        "weeks": [
+            {
+                "week_start": _datetime(first_week + 7 * week).date(),
+                **{key: round(float(values[week]), 2) if key == "progress_percent_gained" else int(values[week])
+                   for key, values in week_counts.items()},
+            }
+            for week in range(weeks)
+        ],
+    }
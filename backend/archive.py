@@ -0,0 +1,267 @@
+"""
+Cold archive for old chat messages.
+
+Messages older than ARCHIVE_AFTER_DAYS are moved out of `messages` and
+`conversation_messages` into `message_archives`: one row per chunk of up to
+ARCHIVE_CHUNK_MESSAGES messages of a single conversation or sector, stored
+as compressed JSON (zstd when the `zstandard` package is installed, zlib
+otherwise). Each chunk is inserted and its source rows deleted in the same
+transaction, so a message is always in exactly one place.
+
+Reads hydrate archived chunks transparently: `iter_messages` yields the
+archived messages followed by the hot ones, as plain (unsaved) model
+instances, and only touches `message_archives` through its index.
+
+On Postgres the freed space is reused by new rows but only returned to the
+OS by VACUUM FULL; the report counts rows and content bytes moved.
+
+The "archive_messages" job is seeded at startup and re-enqueues itself every
+ARCHIVE_INTERVAL_HOURS; `python archive.py --days 180` runs it by hand.
+"""
+import json
+import os
+import zlib
+from datetime import datetime, timedelta
+from typing import Iterator, Optional
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.orm import Session
+
+import jobs
+import models
+import streaming
+
+try:
+    import zstandard  # optional dependency, better ratio and much faster decompression
+except ImportError:
+    zstandard = None
+
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "180"))
+ARCHIVE_CHUNK_MESSAGES = int(os.getenv("ARCHIVE_CHUNK_MESSAGES", "500"))
+ARCHIVE_INTERVAL_HOURS = float(os.getenv("ARCHIVE_INTERVAL_HOURS", "24"))
+
+
+class ArchiveKind:
+    def __init__(self, name: str, model, parent_model, parent_column: str, columns: tuple):
+        self.name = name
+        self.model = model
+        self.parent_model = parent_model
+        self.parent_column = parent_column  # foreign key to the parent, not stored in the chunk
+        self.columns = columns              # columns kept per message
+
+    @property
+    def parent_id(self):
+        return getattr(self.model, self.parent_column)
+
+
+ARCHIVE_KINDS = {
+    "conversation": ArchiveKind("conversation", models.ConversationMessage, models.Conversation,
+                                "conversation_id", ("id", "role", "content", "model_used", "created_at")),
+    "sector": ArchiveKind("sector", models.Message, models.Sector,
+                          "sector_id", ("id", "content", "is_user", "ai_model", "created_at")),
+}
+
+
+# ==================== ENCODING ====================
+
+def _compress(raw: bytes) -> tuple:
+    if zstandard is not None:
+        return "zstd", zstandard.ZstdCompressor(level=10).compress(raw)
+    return "zlib", zlib.compress(raw, 9)
+
+
+def _decompress(codec: str, blob: bytes) -> bytes:
+    if codec == "zlib":
+        return zlib.decompress(blob)
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("zstd-compressed archive found but the zstandard package is not installed")
+        return zstandard.ZstdDecompressor().decompress(blob)
+    raise ValueError(f"Unknown archive codec '{codec}'")
+
+
+def decode_chunk(chunk: models.MessageArchive) -> list:
+    """The chunk's messages as column dicts, parent id included"""
+    kind = ARCHIVE_KINDS[chunk.kind]
+    rows = json.loads(_decompress(chunk.codec, chunk.blob))
+    for row in rows:
+        row[kind.parent_column] = chunk.parent_id
+        if row.get("created_at"):
+            row["created_at"] = datetime.fromisoformat(row["created_at"])
+    return rows
+
+
+def archived_chunks(kind: str, parent_ids):
+    """Query for the archive chunks of some parents (a list or a subquery), oldest first"""
+    return select(models.MessageArchive).where(
+        models.MessageArchive.kind == kind,
+        models.MessageArchive.parent_id.in_(parent_ids),
+    ).order_by(models.MessageArchive.parent_id, models.MessageArchive.first_message_at, models.MessageArchive.id)
+
+
+# ==================== READS ====================
+
+def iter_messages(db: Session, kind: str, parent_id: int, since: Optional[datetime] = None) -> Iterator:
+    """All messages of a conversation or sector, archived ones hydrated first.
+
+    Chunks are decoded one at a time and hot rows read STREAM_BATCH_ROWS at a
+    time, so a long history can be streamed without holding all of it.
+    `since` (the parent's creation time) lets Postgres skip older partitions.
+    """
+    spec = ARCHIVE_KINDS[kind]
+    for chunk in db.scalars(archived_chunks(kind, [parent_id]).execution_options(yield_per=8)):
+        for row in decode_chunk(chunk):
+            yield spec.model(**row)
+
+    query = db.query(spec.model).filter(spec.parent_id == parent_id)
+    if since is not None:
+        query = query.filter(spec.model.created_at >= since)
+    yield from query.order_by(spec.model.created_at.asc()).yield_per(streaming.STREAM_BATCH_ROWS)
+
+
+def messages_for(db: Session, kind: str, parent_id: int, since: Optional[datetime] = None) -> list:
+    return list(iter_messages(db, kind, parent_id, since))
+
+
+def archived_counts(db: Session, kind: str, parent_ids: list) -> dict:
+    """Number of archived messages per parent id"""
+    if not parent_ids:
+        return {}
+    rows = db.execute(
+        select(models.MessageArchive.parent_id, func.sum(models.MessageArchive.message_count))
+        .where(models.MessageArchive.kind == kind, models.MessageArchive.parent_id.in_(parent_ids))
+        .group_by(models.MessageArchive.parent_id)
+    )
+    return {parent_id: int(count) for parent_id, count in rows}
+
+
+# ==================== ARCHIVING ====================
+
+def hot_table_stats(db: Session) -> dict:
+    """Rows and content bytes per hot table, plus on-disk size on Postgres"""
+    stats = {}
+    for spec in ARCHIVE_KINDS.values():
+        rows, content_bytes = db.execute(
+            select(func.count(spec.model.id), func.coalesce(func.sum(func.length(spec.model.content)), 0))
+        ).one()
+        table = spec.model.__tablename__
+        stats[table] = {"rows": rows, "content_bytes": int(content_bytes)}
+        if db.bind.dialect.name == "postgresql":
+            stats[table]["disk_bytes"] = db.scalar(select(func.pg_total_relation_size(table)))
+    return stats
+
+
+def _archive_parent(db: Session, spec: ArchiveKind, parent_id: int, cutoff: datetime, chunk_size: int) -> dict:
+    moved = {"messages": 0, "chunks": 0, "raw_bytes": 0, "stored_bytes": 0}
+    columns = [getattr(spec.model, name) for name in spec.columns]
+
+    while True:
+        rows = db.execute(
+            select(*columns)
+            .where(spec.parent_id == parent_id, spec.model.created_at < cutoff)
+            .order_by(spec.model.created_at, spec.model.id)
+            .limit(chunk_size)
+        ).all()
+        if not rows:
+            break
+
+        payload = [
+            {key: value.isoformat() if isinstance(value, datetime) else value
+             for key, value in row._mapping.items()}
+            for row in rows
+        ]
+        raw = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode()
+        codec, blob = _compress(raw)
+
+        db.add(models.MessageArchive(
+            kind=spec.name,
+            parent_id=parent_id,
+            codec=codec,
+            message_count=len(rows),
+            first_message_at=rows[0].created_at,
+            last_message_at=rows[-1].created_at,
+            raw_bytes=len(raw),
+            blob=blob,
+        ))
+        db.execute(
+            delete(spec.model).where(spec.model.id.in_([row.id for row in rows])),
+            execution_options={"synchronize_session": False},
+        )
+        db.commit()
+
+        moved["messages"] += len(rows)
+        moved["chunks"] += 1
+        moved["raw_bytes"] += len(raw)
+        moved["stored_bytes"] += len(blob)
+        if len(rows) < chunk_size:
+            break
+    return moved
+
+
+def archive_old_messages(db: Session, days: int = ARCHIVE_AFTER_DAYS,
+                         chunk_size: int = ARCHIVE_CHUNK_MESSAGES) -> dict:
+    """Move messages older than `days` into compressed chunks and report what it saved"""
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    before = hot_table_stats(db)
+    totals = {"messages": 0, "chunks": 0, "raw_bytes": 0, "stored_bytes": 0}
+
+    for spec in ARCHIVE_KINDS.values():
+        # Soft-deleted parents are about to be purged, not archived
+        parent_ids = db.scalars(
+            select(spec.parent_id).distinct()
+            .join(spec.parent_model, spec.parent_model.id == spec.parent_id)
+            .where(spec.model.created_at < cutoff, spec.parent_model.deleted_at.is_(None))
+        ).all()
+        for parent_id in parent_ids:
+            moved = _archive_parent(db, spec, parent_id, cutoff, chunk_size)
+            for key in totals:
+                totals[key] += moved[key]
+
+    after = hot_table_stats(db)
+    content_freed = sum(before[t]["content_bytes"] - after[t]["content_bytes"] for t in before)
+    report = {
+        **totals,
+        "ratio": round(totals["raw_bytes"] / totals["stored_bytes"], 2) if totals["stored_bytes"] else None,
+        "reclaimed_bytes": content_freed - totals["stored_bytes"],
+        "hot_before": before,
+        "hot_after": after,
+    }
+    print(f"🧊 Archived {totals['messages']} messages in {totals['chunks']} chunks: "
+          f"{totals['raw_bytes']} -> {totals['stored_bytes']} bytes, "
+          f"{report['reclaimed_bytes']} bytes reclaimed")
+    return report
+
+
+def schedule_archiving(db: Session, delay_seconds: float = 0):
+    """Queue the archive job unless one is already waiting or running"""
+    pending = db.scalar(
+        select(models.Job.id).where(models.Job.kind == "archive_messages",
+                                    models.Job.status.in_(("queued", "running")))
+    )
+    if pending is None:
+        jobs.enqueue(db, "archive_messages", delay_seconds=delay_seconds)
+
+
+@jobs.handler("archive_messages", concurrency=1)
+def archive_job(db: Session, payload: dict):
+    result = archive_old_messages(db, payload.get("days", ARCHIVE_AFTER_DAYS))
+    jobs.enqueue(db, "archive_messages", delay_seconds=ARCHIVE_INTERVAL_HOURS * 3600)
+    return result
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from database import SessionLocal, engine
+
+    parser = argparse.ArgumentParser(description="Move old chat messages into the compressed archive")
+    parser.add_argument("--days", type=int, default=ARCHIVE_AFTER_DAYS)
+    parser.add_argument("--chunk-size", type=int, default=ARCHIVE_CHUNK_MESSAGES)
+    args = parser.parse_args()
+
+    models.Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        print(json.dumps(archive_old_messages(db, args.days, args.chunk_size), indent=2))
+    finally:
+        db.close()
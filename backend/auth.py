@@ -1,3 +1,4 @@
+from contextvars import ContextVar
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
@@ -17,6 +18,8 @@ load_dotenv()
 SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "43200"))
+# Accounts allowed on /api/admin, comma separated
+ADMIN_EMAILS = {email.strip().lower() for email in os.getenv("ADMIN_EMAILS", "").split(",") if email.strip()}
 
 # Password hashing
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -48,14 +51,28 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+# Set by POST /api/batch so its sub-requests reuse the already authenticated user
+shared_user: ContextVar[Optional[models.User]] = ContextVar("shared_user", default=None)
+
 def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
     """Get current user from JWT token"""
+    user = shared_user.get()
+    if user is not None:
+        return user
+    
+    return user_from_token(db, token)
+
+def user_from_token(db: Session, token: Optional[str]) -> models.User:
+    """Resolve a JWT to its user; 401 if it is missing or invalid"""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
     
+    if not token:
+        raise credentials_exception
+    
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         email: str = payload.get("sub")
@@ -64,8 +81,19 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
     except JWTError:
         raise credentials_exception
     
-    user = db.query(models.User).filter(models.User.email == email).first()
+    # Newer tokens carry the id too (used for shard routing); older ones only the email
+    user_id = payload.get("uid")
+    if user_id is not None:
+        user = db.get(models.User, user_id)
+    else:
+        user = db.query(models.User).filter(models.User.email == email).first()
     if user is None:
         raise credentials_exception
     
     return user
+
+def get_admin_user(current_user: models.User = Depends(get_current_user)) -> models.User:
+    """The current user if their email is in ADMIN_EMAILS; 403 otherwise"""
+    if (current_user.email or "").lower() not in ADMIN_EMAILS:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required")
+    return current_user
@@ -0,0 +1,269 @@
+"""
+Badge rules engine.
+
+Badges are declared once in BADGE_RULES as "metric >= threshold". Each
+metric is a grouped SQL query yielding (user_id, value), which serves both
+ways of awarding:
+
+- `evaluate` runs after an event for one user and only the metrics that
+  event can move, skipping rules the user already holds.
+- `backfill` awards every rule to every qualifying user with one
+  INSERT ... SELECT per rule, no per-user loop.
+
+Inserts use ON CONFLICT DO NOTHING against the (user_id, badge_id) unique
+constraint, so awarding is idempotent and safe to retry.
+
+Run `python badges.py backfill` after adding a rule.
+"""
+from datetime import datetime
+from typing import Iterable, Optional
+
+from sqlalchemy import func, literal, select, union_all, update
+from sqlalchemy.orm import Session
+
+import jobs
+import leaderboard
+import models
+import notifications
+import points
+import sharding
+from database import engine
+
+if engine.dialect.name == "postgresql":
+    from sqlalchemy.dialects.postgresql import insert
+else:
+    from sqlalchemy.dialects.sqlite import insert
+
+
+class BadgeRule:
+    def __init__(self, key: str, name: str, description: str, icon: str,
+                 badge_type: models.BadgeType, points: int, metric: str, threshold: int):
+        self.key = key
+        self.name = name
+        self.description = description
+        self.icon = icon
+        self.badge_type = badge_type
+        self.points = points
+        self.metric = metric
+        self.threshold = threshold
+
+
+# Mirrors the definitions on the frontend BadgesPage. Zone Out and news
+# reading are tracked client-side only, so they have no rule here yet.
+BADGE_RULES = [
+    BadgeRule("profile_complete", "First Steps", "Complete your profile", "🎯",
+              models.BadgeType.BRONZE, 10, "profile_complete", 1),
+    BadgeRule("sectors_created", "Sector Master", "Create 5 sectors", "📊",
+              models.BadgeType.SILVER, 50, "sectors_created", 5),
+    BadgeRule("goals_completed", "Goal Crusher", "Complete 10 goals", "💪",
+              models.BadgeType.GOLD, 100, "goals_completed", 10),
+    BadgeRule("streak_days", "Streak Legend", "Maintain 30-day streak", "🔥",
+              models.BadgeType.PLATINUM, 300, "streak_days", 30),
+    BadgeRule("ai_conversations", "AI Conversationalist", "Have 50 AI conversations", "🤖",
+              models.BadgeType.SILVER, 75, "ai_conversations", 50),
+    BadgeRule("user_level", "Level 10 Human", "Reach level 10", "🏆",
+              models.BadgeType.PLATINUM, 500, "user_level", 10),
+]
+
+# A conversation counts towards ai_conversations once it has this many messages
+AI_CONVERSATION_MIN_MESSAGES = 5
+
+
+# ==================== METRICS ====================
+
+def _metric_query(metric: str):
+    """Select (user_id, value) rows for a metric, one per user"""
+    if metric == "profile_complete":
+        return select(models.User.id.label("user_id"), literal(1).label("value"))
+
+    if metric == "sectors_created":
+        return select(
+            models.Sector.user_id.label("user_id"),
+            func.count(models.Sector.id).label("value"),
+        ).where(models.Sector.deleted_at.is_(None)).group_by(models.Sector.user_id)
+
+    if metric == "goals_completed":
+        return select(
+            models.Sector.user_id.label("user_id"),
+            func.count(models.Goal.id).label("value"),
+        ).join(models.Goal, models.Goal.sector_id == models.Sector.id).where(
+            models.Sector.deleted_at.is_(None),
+            models.Goal.is_completed == True,
+        ).group_by(models.Sector.user_id)
+
+    if metric == "ai_conversations":
+        # Messages moved to the cold archive still count
+        per_conversation = union_all(
+            select(
+                models.ConversationMessage.conversation_id.label("conversation_id"),
+                literal(1).label("messages"),
+            ),
+            select(
+                models.MessageArchive.parent_id.label("conversation_id"),
+                models.MessageArchive.message_count.label("messages"),
+            ).where(models.MessageArchive.kind == "conversation"),
+        ).subquery()
+        long_conversations = select(per_conversation.c.conversation_id).group_by(
+            per_conversation.c.conversation_id
+        ).having(func.sum(per_conversation.c.messages) >= AI_CONVERSATION_MIN_MESSAGES).subquery()
+        return select(
+            models.Conversation.user_id.label("user_id"),
+            func.count(models.Conversation.id).label("value"),
+        ).join(
+            long_conversations, long_conversations.c.conversation_id == models.Conversation.id
+        ).where(models.Conversation.deleted_at.is_(None)).group_by(models.Conversation.user_id)
+
+    if metric == "streak_days":
+        return select(models.User.id.label("user_id"), models.User.streak_days.label("value"))
+
+    if metric == "user_level":
+        return select(models.User.id.label("user_id"), models.User.human_level.label("value"))
+
+    raise ValueError(f"Unknown badge metric '{metric}'")
+
+
+def metric_value(db: Session, user_id: int, metric: str) -> int:
+    query = _metric_query(metric).subquery()
+    value = db.scalar(select(query.c.value).where(query.c.user_id == user_id))
+    return value or 0
+
+
+def metric_values(db: Session, user_id: int) -> dict:
+    return {metric: metric_value(db, user_id, metric) for metric in {r.metric for r in BADGE_RULES}}
+
+
+# ==================== AWARDING ====================
+
+_badge_ids = {}  # shard -> {rule key: Badge.id}; ids differ between shards
+
+
+def badge_ids(db: Session) -> dict:
+    """Map rule key -> Badge.id, creating or updating Badge rows on first use"""
+    shard = sharding.shard_of(db)
+    if shard in _badge_ids:
+        return _badge_ids[shard]
+
+    existing = {badge.key: badge for badge in db.query(models.Badge).filter(models.Badge.key.isnot(None))}
+    for rule in BADGE_RULES:
+        badge = existing.get(rule.key) or models.Badge(key=rule.key)
+        badge.name = rule.name
+        badge.description = rule.description
+        badge.icon = rule.icon
+        badge.badge_type = rule.badge_type
+        badge.points_value = rule.points
+        db.add(badge)
+    db.commit()
+
+    _badge_ids[shard] = {
+        badge.key: badge.id for badge in db.query(models.Badge).filter(models.Badge.key.isnot(None))
+    }
+    return _badge_ids[shard]
+
+
+def earned_keys(db: Session, user_id: int) -> set:
+    rows = db.query(models.Badge.key).join(
+        models.UserBadge, models.UserBadge.badge_id == models.Badge.id
+    ).filter(models.UserBadge.user_id == user_id)
+    return {key for (key,) in rows}
+
+
+def _award(db: Session, user_id: int, rule: BadgeRule) -> bool:
+    inserted = db.execute(
+        insert(models.UserBadge)
+        .values(user_id=user_id, badge_id=badge_ids(db)[rule.key], earned_at=datetime.utcnow())
+        .on_conflict_do_nothing(index_elements=["user_id", "badge_id"])
+        .returning(models.UserBadge.id)
+    ).first()
+    if inserted is None:
+        return False
+
+    points.award_points(db, user_id, rule.points)
+    notifications.notify(db, user_id, "badge_earned", f"{rule.icon} Badge earned: {rule.name}",
+                         rule.description, {"badge": rule.key, "points": rule.points})
+    print(f"🏅 User {user_id} earned badge {rule.name}")
+    return True
+
+
+def evaluate(db: Session, user_id: int, metrics: Optional[Iterable[str]] = None) -> list:
+    """Award the badges a user now qualifies for. Returns the new badge keys"""
+    metrics = set(metrics) if metrics else {r.metric for r in BADGE_RULES}
+    held = earned_keys(db, user_id)
+    candidates = [r for r in BADGE_RULES if r.metric in metrics and r.key not in held]
+
+    values = {}
+    awarded = []
+    for rule in candidates:
+        if rule.metric not in values:
+            values[rule.metric] = metric_value(db, user_id, rule.metric)
+        if values[rule.metric] >= rule.threshold and _award(db, user_id, rule):
+            awarded.append(rule.key)
+
+    db.commit()
+    return awarded
+
+
+def queue_evaluation(db: Session, user_id: int, metrics: Iterable[str]):
+    """Evaluate badges off-request once the caller commits"""
+    jobs.enqueue(db, "evaluate_badges", {"user_id": user_id, "metrics": sorted(metrics)}, user_id=user_id)
+
+
+@jobs.handler("evaluate_badges")
+def evaluate_job(db: Session, payload: dict):
+    return {"awarded": evaluate(db, payload["user_id"], payload.get("metrics"))}
+
+
+def backfill(db: Session) -> dict:
+    """Award every rule to all qualifying users with set-based SQL, with the points,
+    leaderboard updates and notifications _award would give"""
+    ids = badge_ids(db)
+    awarded = {}
+    for rule in BADGE_RULES:
+        metric = _metric_query(rule.metric).subquery()
+        qualifying = select(
+            metric.c.user_id,
+            literal(ids[rule.key]),
+            literal(datetime.utcnow()),
+        ).where(metric.c.value >= rule.threshold)
+
+        user_ids = db.scalars(
+            insert(models.UserBadge)
+            .from_select(["user_id", "badge_id", "earned_at"], qualifying)
+            .on_conflict_do_nothing(index_elements=["user_id", "badge_id"])
+            .returning(models.UserBadge.user_id)
+        ).all()
+
+        # The same side effects as _award, in bulk
+        if user_ids and rule.points:
+            totals = db.execute(
+                update(models.User)
+                .where(models.User.id.in_(user_ids))
+                .values(total_points=models.User.total_points + rule.points)
+                .returning(models.User.id, models.User.total_points),
+                execution_options={"synchronize_session": False},
+            ).all()
+            for user_id, total in totals:
+                leaderboard.stage(db, user_id, total)
+        notifications.fan_out(db, user_ids, "badge_earned", f"{rule.icon} Badge earned: {rule.name}",
+                              rule.description, {"badge": rule.key, "points": rule.points})
+        db.commit()
+        awarded[rule.key] = len(user_ids)
+
+    return awarded
+
+
+if __name__ == "__main__":
+    import sys
+
+    if sys.argv[1:] != ["backfill"]:
+        print("Usage: python badges.py backfill")
+        sys.exit(1)
+
+    models.Base.metadata.create_all(bind=engine)
+    sharding.create_all()
+    for shard, session_factory in sharding.session_factories().items():
+        db = session_factory()
+        try:
+            for key, count in backfill(db).items():
+                print(f"🏅 {shard} {key}: awarded to {count} users")
+        finally:
+            db.close()
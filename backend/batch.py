@@ -0,0 +1,180 @@
+"""
+Request batching: run several API calls in one HTTP round trip.
+
+`POST /api/batch` takes a list of sub-requests and dispatches each one to
+the app's router in-process, so they go through the normal routes,
+validation and exception handlers. All of them share the batch's
+authenticated user and DB session (through the `shared_user` and
+`shared_session` context variables), so the token is decoded and the user
+loaded once.
+
+Sub-requests run one after another, in order. A Session must not be used
+from two threads at once, and handlers hand work to the threadpool
+(run_in_executor, streamed bodies), so interleaving them on the shared
+session is not safe. For the same reason `streaming.buffered` is set: a
+large list is encoded in full inside its sub-request instead of being
+streamed after the handler returned, when the next one is using the session.
+
+Sub-requests skip the HTTP middleware, so before anything runs each item
+is charged to its route's rate-limit budget (rate_limit.charge) and the
+batch is refused with 429 if any budget is short. The batch size is capped
+at BATCH_MAX_REQUESTS, and no budget may get more items than its burst.
+
+Items have no headers of their own, so If-Match and Idempotency-Key cannot
+be used inside a batch: writes are unconditional and not deduplicated.
+"""
+import asyncio
+import json
+import math
+import os
+from contextlib import AsyncExitStack
+from typing import List
+
+from fastapi import HTTPException, Request
+from sqlalchemy.orm import Session
+
+import auth
+import database
+import models
+import rate_limit
+import schemas
+import streaming
+
+BATCH_MAX_REQUESTS = int(os.getenv("BATCH_MAX_REQUESTS", "20"))
+
+# Routes that must not run inside a batch: recursion, auth, streaming bodies
+EXCLUDED_PREFIXES = ("/api/batch", "/api/auth/", "/api/export", "/api/import", "/api/events")
+ALLOWED_METHODS = {"GET", "POST", "PUT", "PATCH", "DELETE"}
+
+
+def validate(items: List[schemas.BatchItem]):
+    if len(items) > BATCH_MAX_REQUESTS:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_REQUESTS} requests per batch")
+    for item in items:
+        if item.method.upper() not in ALLOWED_METHODS:
+            raise HTTPException(status_code=400, detail=f"Method {item.method} is not allowed in a batch")
+        path = item.path.split("?", 1)[0]
+        if not path.startswith("/api/") or path.startswith(EXCLUDED_PREFIXES):
+            raise HTTPException(status_code=400, detail=f"{path} cannot be batched")
+
+    # More items than a bucket holds could never be charged
+    counts = {}
+    for item in items:
+        budget = rate_limit.match_budget(item.method.upper(), item.path.split("?", 1)[0])
+        if budget is not None:
+            counts[budget.name] = counts.get(budget.name, 0) + 1
+            if counts[budget.name] > budget.burst:
+                raise HTTPException(
+                    status_code=400, detail=f"At most {budget.burst} {budget.name} requests per batch"
+                )
+
+
+def _error_response(request: Request, exc: Exception):
+    """Render an exception with the app's own handlers, as the HTTP stack would"""
+    for cls in type(exc).__mro__:
+        handler = request.app.exception_handlers.get(cls)
+        if handler is not None:
+            return handler
+    return None
+
+
+async def _dispatch(request: Request, db: Session, item: schemas.BatchItem) -> schemas.BatchItemResult:
+    path, _, query = item.path.partition("?")
+    body = b"" if item.body is None else json.dumps(item.body).encode()
+    headers = [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+    authorization = request.headers.get("authorization")
+    if authorization:
+        headers.append((b"authorization", authorization.encode()))
+
+    scope = {
+        "type": "http",
+        "asgi": request.scope.get("asgi", {"version": "3.0"}),
+        "http_version": request.scope.get("http_version", "1.1"),
+        "method": item.method.upper(),
+        "scheme": request.scope.get("scheme", "http"),
+        "server": request.scope.get("server"),
+        "client": request.scope.get("client"),
+        "root_path": request.scope.get("root_path", ""),
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": query.encode(),
+        "headers": headers,
+        "app": request.app,
+    }
+
+    sent_body = False
+    finished = asyncio.Event()
+
+    async def receive():
+        nonlocal sent_body
+        if not sent_body:
+            sent_body = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        # The client is the batch, which stays for the whole response; a
+        # StreamingResponse listening for a disconnect must not stop early
+        await finished.wait()
+        return {"type": "http.disconnect"}
+
+    response = {"status": 500, "headers": {}, "body": b""}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+            response["headers"] = {
+                key.decode().lower(): value.decode() for key, value in message.get("headers", [])
+            }
+        elif message["type"] == "http.response.body":
+            response["body"] += message.get("body", b"")
+
+    try:
+        # Normally provided by FastAPI's middleware; closes dependencies with `yield`
+        async with AsyncExitStack() as stack:
+            scope["fastapi_astack"] = stack
+            await request.app.router(scope, receive, send)
+    except Exception as exc:
+        handler = _error_response(request, exc)
+        if handler is None:
+            db.rollback()
+            print(f"❌ Batch sub-request {item.method} {item.path} failed: {exc!r}")
+            return schemas.BatchItemResult(id=item.id, status=500, body={"detail": "Internal Server Error"})
+        rendered = await handler(Request(scope, receive), exc)
+        await rendered(scope, receive, send)
+    finally:
+        finished.set()
+
+    result_headers = {
+        key: value for key, value in response["headers"].items()
+        if key not in ("content-length", "content-type")
+    }
+    content = response["body"]
+    if response["headers"].get("content-type", "").startswith("application/json") and content:
+        content = json.loads(content)
+    elif content:
+        content = content.decode(errors="replace")
+    else:
+        content = None
+    return schemas.BatchItemResult(id=item.id, status=response["status"], headers=result_headers, body=content)
+
+
+async def run(request: Request, user: models.User, db: Session,
+              items: List[schemas.BatchItem]) -> List[schemas.BatchItemResult]:
+    """Run the sub-requests one at a time, results in request order"""
+    validate(items)
+    retry_after = await rate_limit.charge(
+        f"user:{user.email}", [(item.method.upper(), item.path.split("?", 1)[0]) for item in items]
+    )
+    if retry_after:
+        raise HTTPException(
+            status_code=429, detail="Rate limit exceeded",
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+        )
+
+    user_token = auth.shared_user.set(user)
+    session_token = database.shared_session.set(db)
+    buffered_token = streaming.buffered.set(True)
+    try:
+        return [await _dispatch(request, db, item) for item in items]
+    finally:
+        auth.shared_user.reset(user_token)
+        database.shared_session.reset(session_token)
+        streaming.buffered.reset(buffered_token)
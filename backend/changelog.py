@@ -0,0 +1,221 @@
+"""
+Per-user change log for delta sync.
+
+Every mutation calls `record()` inside its transaction. The per-user
+sequence number comes from `UPDATE users SET change_seq = change_seq + 1
+... RETURNING`, which also row-locks the user until commit, so sequence
+numbers become visible in commit order and a client polling with
+`since=<seq>` can never skip a change.
+
+Sync protocol for clients:
+1. Call /api/sync with no `since` and keep the returned `seq`.
+2. Load the full collections once.
+3. Poll /api/sync?since=<seq> and apply `changes` (upserts) and
+   `deleted` (ids). Whenever `reset` is true, go back to step 1.
+
+Recording a change also invalidates the user's cached responses for that
+entity type (see response_cache.py) when the transaction commits.
+
+Compaction drops entries superseded by a newer one for the same entity,
+which is lossless, and expires entries past the retention window by
+raising the user's `sync_floor`. Clients behind the floor get `reset`.
+The compact_changelog job is seeded at startup and re-enqueues itself every
+CHANGELOG_COMPACT_HOURS.
+"""
+import os
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, delete, exists, func, select, update
+from sqlalchemy.orm import Session, aliased
+
+import jobs
+import models
+import response_cache
+import schemas
+
+CHANGELOG_RETENTION_DAYS = int(os.getenv("CHANGELOG_RETENTION_DAYS", "30"))
+SYNC_PAGE_SIZE = int(os.getenv("SYNC_PAGE_SIZE", "500"))
+CHANGELOG_COMPACT_HOURS = float(os.getenv("CHANGELOG_COMPACT_HOURS", "24"))
+
+
+def _next_seq(db: Session, user_id: int) -> int:
+    return db.execute(
+        update(models.User)
+        .where(models.User.id == user_id)
+        .values(change_seq=models.User.change_seq + 1)
+        .returning(models.User.change_seq),
+        execution_options={"synchronize_session": False},
+    ).scalar_one()
+
+
+def record(db: Session, user_id: int, entity_type: str, entity_id: int, op: str = "upsert") -> int:
+    """Append a change to the user's log in the caller's transaction"""
+    seq = _next_seq(db, user_id)
+    db.add(models.ChangeLog(user_id=user_id, seq=seq, entity_type=entity_type, entity_id=entity_id, op=op))
+    response_cache.stage_invalidation(db, user_id, entity_type)
+    return seq
+
+
+def force_resync(db: Session, user_id: int) -> int:
+    """Make every client of this user reload in full, e.g. after a bulk import"""
+    seq = _next_seq(db, user_id)
+    db.execute(
+        update(models.User).where(models.User.id == user_id).values(sync_floor=seq),
+        execution_options={"synchronize_session": False},
+    )
+    response_cache.stage_invalidation(db, user_id)
+    return seq
+
+
+# ==================== SYNC ====================
+
+def _owned_sector_ids(user_id: int):
+    return select(models.Sector.id).where(models.Sector.user_id == user_id)
+
+
+def _owned_conversation_ids(user_id: int):
+    return select(models.Conversation.id).where(models.Conversation.user_id == user_id)
+
+
+# entity type -> (response key, model, schema, ownership filter, soft-delete column)
+SYNC_ENTITIES = {
+    "sector": ("sectors", models.Sector, schemas.SectorResponse,
+               lambda uid: models.Sector.user_id == uid, models.Sector.deleted_at),
+    "goal": ("goals", models.Goal, schemas.GoalResponse,
+             lambda uid: models.Goal.sector_id.in_(_owned_sector_ids(uid)), None),
+    "message": ("messages", models.Message, schemas.MessageResponse,
+                lambda uid: models.Message.sector_id.in_(_owned_sector_ids(uid)), None),
+    "conversation": ("conversations", models.Conversation, schemas.ConversationResponse,
+                     lambda uid: models.Conversation.user_id == uid, models.Conversation.deleted_at),
+    "conversation_message": ("conversation_messages", models.ConversationMessage,
+                             schemas.ConversationMessageResponse,
+                             lambda uid: models.ConversationMessage.conversation_id.in_(_owned_conversation_ids(uid)),
+                             None),
+    "saved_news": ("saved_news", models.SavedNews, schemas.SavedNewsResponse,
+                   lambda uid: models.SavedNews.user_id == uid, None),
+}
+
+
+def changes_since(db: Session, user: models.User, since: int = None, limit: int = SYNC_PAGE_SIZE) -> dict:
+    """Collect the net changes after `since`, loading each entity type in one query"""
+    if since is None or since <= 0 or since < user.sync_floor:
+        return {"reset": True, "seq": user.change_seq, "has_more": False, "changes": {}, "deleted": {}}
+
+    entries = db.execute(
+        select(models.ChangeLog.seq, models.ChangeLog.entity_type, models.ChangeLog.entity_id, models.ChangeLog.op)
+        .where(models.ChangeLog.user_id == user.id, models.ChangeLog.seq > since)
+        .order_by(models.ChangeLog.seq)
+        .limit(limit + 1)
+    ).all()
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+
+    # Only the latest operation per entity matters
+    latest = {}
+    for entry in entries:
+        latest[(entry.entity_type, entry.entity_id)] = entry.op
+
+    upserts = {}
+    deleted = {}
+    for (entity_type, entity_id), op in latest.items():
+        if entity_type not in SYNC_ENTITIES:
+            continue
+        target = upserts if op == "upsert" else deleted
+        target.setdefault(entity_type, set()).add(entity_id)
+
+    changes = {}
+    for entity_type, ids in upserts.items():
+        key, model, schema, owned, deleted_column = SYNC_ENTITIES[entity_type]
+        query = db.query(model).filter(model.id.in_(ids), owned(user.id))
+        if deleted_column is not None:
+            query = query.filter(deleted_column.is_(None))
+        rows = query.all()
+        changes[key] = [schema.model_validate(row).model_dump(mode="json") for row in rows]
+        # Rows purged or deleted since the entry was written count as deletions
+        missing = ids - {row.id for row in rows}
+        if missing:
+            deleted.setdefault(entity_type, set()).update(missing)
+
+    return {
+        "reset": False,
+        "seq": entries[-1].seq if entries else since,
+        "has_more": has_more,
+        "changes": changes,
+        "deleted": {SYNC_ENTITIES[t][0]: sorted(ids) for t, ids in deleted.items()},
+    }
+
+
+# ==================== COMPACTION ====================
+
+def compact(db: Session, retention_days: int = CHANGELOG_RETENTION_DAYS) -> dict:
+    """Drop superseded entries, then expire old ones behind each user's sync floor"""
+    newer = aliased(models.ChangeLog)
+    superseded = db.execute(
+        delete(models.ChangeLog).where(exists().where(and_(
+            newer.user_id == models.ChangeLog.user_id,
+            newer.entity_type == models.ChangeLog.entity_type,
+            newer.entity_id == models.ChangeLog.entity_id,
+            newer.seq > models.ChangeLog.seq,
+        ))),
+        execution_options={"synchronize_session": False},
+    ).rowcount
+    db.commit()
+
+    cutoff = datetime.utcnow() - timedelta(days=retention_days)
+    expired_seq = select(func.max(models.ChangeLog.seq)).where(
+        models.ChangeLog.user_id == models.User.id,
+        models.ChangeLog.created_at < cutoff,
+    ).scalar_subquery()
+    db.execute(
+        update(models.User)
+        .where(exists().where(
+            models.ChangeLog.user_id == models.User.id,
+            models.ChangeLog.created_at < cutoff,
+        ))
+        .values(sync_floor=func.max(models.User.sync_floor, expired_seq)
+                if db.bind.dialect.name == "sqlite"
+                else func.greatest(models.User.sync_floor, expired_seq)),
+        execution_options={"synchronize_session": False},
+    )
+    expired = db.execute(
+        delete(models.ChangeLog).where(models.ChangeLog.created_at < cutoff),
+        execution_options={"synchronize_session": False},
+    ).rowcount
+    db.commit()
+
+    print(f"🗜️ Change log compacted: {superseded} superseded, {expired} expired")
+    return {"superseded": superseded, "expired": expired}
+
+
+def schedule_compaction(db: Session, delay_seconds: float = 0):
+    """Queue the compaction job unless one is already waiting or running"""
+    pending = db.scalar(
+        select(models.Job.id).where(models.Job.kind == "compact_changelog",
+                                    models.Job.status.in_(("queued", "running")))
+    )
+    if pending is None:
+        jobs.enqueue(db, "compact_changelog", delay_seconds=delay_seconds)
+
+
+@jobs.handler("compact_changelog", concurrency=1)
+def compact_job(db: Session, payload: dict):
+    result = compact(db, payload.get("retention_days", CHANGELOG_RETENTION_DAYS))
+    jobs.enqueue(db, "compact_changelog", delay_seconds=CHANGELOG_COMPACT_HOURS * 3600)
+    return result
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from database import SessionLocal, engine
+
+    parser = argparse.ArgumentParser(description="Compact the sync change log")
+    parser.add_argument("--days", type=int, default=CHANGELOG_RETENTION_DAYS)
+    args = parser.parse_args()
+
+    models.Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        compact(db, args.days)
+    finally:
+        db.close()
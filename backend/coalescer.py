@@ -0,0 +1,268 @@
+"""
+Write coalescing for chat message inserts.
+
+With MESSAGE_COALESCING=true, `create_sector_message` and
+`add_conversation_message` hand their row to `messages_for(db).submit()` instead of
+committing it themselves. Rows arriving within COALESCE_WINDOW_MS of each
+other (or COALESCE_MAX_BATCH of them) are written by one worker thread in
+a single transaction: one multi-row INSERT ... RETURNING per table, the
+change-log entries, the conversations' updated_at and the AI badge check.
+Every request then gets its own row back. One commit, so one fsync, per
+batch instead of per message.
+
+Batches are written one at a time. If a batch fails, its
+rows are retried one by one so a single bad row only fails its own request.
+
+Run `python coalescer.py` to compare messages/sec and transactions with
+and without coalescing.
+"""
+import asyncio
+import os
+import threading
+from datetime import datetime
+from typing import Callable, Optional
+
+from sqlalchemy import func, insert, select, update
+
+import badges
+import changelog
+import models
+import sharding
+from database import SessionLocal
+
+MESSAGE_COALESCING = os.getenv("MESSAGE_COALESCING", "false").lower() == "true"
+COALESCE_WINDOW_MS = float(os.getenv("COALESCE_WINDOW_MS", "5"))
+COALESCE_MAX_BATCH = int(os.getenv("COALESCE_MAX_BATCH", "200"))
+
+
+class PendingWrite:
+    __slots__ = ("kind", "user_id", "values", "future")
+
+    def __init__(self, kind: str, user_id: int, values: dict, future: asyncio.Future):
+        self.kind = kind
+        self.user_id = user_id
+        self.values = values
+        self.future = future
+
+
+# ==================== BATCH WRITE ====================
+
+def _insert_rows(db, model, items: list) -> list:
+    rows = db.execute(
+        insert(model).returning(*model.__table__.columns, sort_by_parameter_order=True),
+        [item.values for item in items],
+    ).all()
+    return [dict(row._mapping) for row in rows]
+
+
+def write_messages(db, items: list) -> list:
+    """Insert a batch of message writes in the caller's transaction.
+
+    Returns (row, queued_job) per item, in order.
+    """
+    results = [None] * len(items)
+    positions = {"message": [], "conversation_message": []}
+    for position, item in enumerate(items):
+        positions[item.kind].append(position)
+
+    sector_items = [items[p] for p in positions["message"]]
+    if sector_items:
+        for position, item, row in zip(positions["message"], sector_items,
+                                       _insert_rows(db, models.Message, sector_items)):
+            changelog.record(db, item.user_id, "message", row["id"])
+            results[position] = (row, False)
+
+    conversation_items = [items[p] for p in positions["conversation_message"]]
+    if conversation_items:
+        rows = _insert_rows(db, models.ConversationMessage, conversation_items)
+        added = {}
+        for position, item, row in zip(positions["conversation_message"], conversation_items, rows):
+            changelog.record(db, item.user_id, "conversation_message", row["id"])
+            added.setdefault(row["conversation_id"], [item.user_id, 0])[1] += 1
+            results[position] = (row, False)
+
+        db.execute(
+            update(models.Conversation)
+            .where(models.Conversation.id.in_(list(added)))
+            .values(updated_at=datetime.utcnow()),
+            execution_options={"synchronize_session": False},
+        )
+        counts = dict(db.execute(
+            select(models.ConversationMessage.conversation_id, func.count(models.ConversationMessage.id))
+            .where(models.ConversationMessage.conversation_id.in_(list(added)))
+            .group_by(models.ConversationMessage.conversation_id)
+        ).all())
+
+        badge_conversations = set()
+        for conversation_id, (user_id, count) in added.items():
+            changelog.record(db, user_id, "conversation", conversation_id)
+            # The conversation starts counting towards the AI badge once it reaches this size
+            total = counts.get(conversation_id, 0)
+            if total - count < badges.AI_CONVERSATION_MIN_MESSAGES <= total:
+                badges.queue_evaluation(db, user_id, ["ai_conversations"])
+                badge_conversations.add(conversation_id)
+
+        for position in positions["conversation_message"]:
+            row = results[position][0]
+            results[position] = (row, row["conversation_id"] in badge_conversations)
+
+    return results
+
+
+# ==================== COALESCER ====================
+
+class WriteCoalescer:
+    def __init__(self, write: Callable = write_messages, session_factory=SessionLocal,
+                 window_ms: float = COALESCE_WINDOW_MS, max_batch: int = COALESCE_MAX_BATCH):
+        self.write = write
+        self.session_factory = session_factory
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self.stats = {"writes": 0, "transactions": 0, "retried_batches": 0}
+        self._pending = []
+        self._timer = None
+        self._pending_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+
+    async def submit(self, kind: str, user_id: int, values: dict):
+        """Queue one row and wait for the batch holding it to commit"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self._pending_lock:
+            self._pending.append(PendingWrite(kind, user_id, values, future))
+            if len(self._pending) >= self.max_batch:
+                batch = self._take()
+            else:
+                batch = None
+                if self._timer is None:
+                    self._timer = loop.call_later(self.window, self._flush_due)
+        if batch:
+            loop.create_task(self._flush(batch))
+        return await future
+
+    def _take(self) -> list:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        return batch
+
+    def _flush_due(self):
+        with self._pending_lock:
+            batch = self._take()
+        if batch:
+            asyncio.get_running_loop().create_task(self._flush(batch))
+
+    def _commit(self, items: list) -> list:
+        with self._write_lock:
+            db = self.session_factory()
+            try:
+                results = self.write(db, items)
+                db.commit()
+                self.stats["writes"] += len(items)
+                self.stats["transactions"] += 1
+                return results
+            except Exception:
+                db.rollback()
+                raise
+            finally:
+                db.close()
+
+    @staticmethod
+    def _resolve(item: PendingWrite, result=None, error: Optional[Exception] = None):
+        # Requests may be served by different event loops (e.g. TestClient)
+        def settle():
+            if item.future.done():
+                return  # the request was cancelled
+            if error is not None:
+                item.future.set_exception(error)
+            else:
+                item.future.set_result(result)
+        item.future.get_loop().call_soon_threadsafe(settle)
+
+    async def _flush(self, batch: list):
+        loop = asyncio.get_running_loop()
+        try:
+            results = await loop.run_in_executor(None, self._commit, batch)
+        except Exception as e:
+            print(f"⚠️ Coalesced batch of {len(batch)} failed, retrying one by one: {e}")
+            self.stats["retried_batches"] += 1
+            for item in batch:
+                try:
+                    result = (await loop.run_in_executor(None, self._commit, [item]))[0]
+                except Exception as item_error:
+                    self._resolve(item, error=item_error)
+                else:
+                    self._resolve(item, result)
+            return
+
+        for item, result in zip(batch, results):
+            self._resolve(item, result)
+
+
+# One coalescer per shard: a batch is one transaction on one database
+writers = {name: WriteCoalescer(session_factory=session_factory)
+           for name, session_factory in sharding.session_factories().items()}
+
+
+def messages_for(db) -> WriteCoalescer:
+    """The coalescer for the shard the request's session is bound to"""
+    return writers[sharding.shard_of(db)]
+
+
+if __name__ == "__main__":
+    import tempfile
+    import time
+
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+
+    n, clients = 2000, 50
+    path = os.path.join(tempfile.mkdtemp(), "coalesce.db")
+    bench_engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+    models.Base.metadata.create_all(bind=bench_engine)
+    BenchSession = sessionmaker(autocommit=False, autoflush=False, bind=bench_engine)
+
+    setup = BenchSession()
+    user = models.User(email="bench@example.com", full_name="Bench")
+    setup.add(user)
+    setup.flush()
+    conversation = models.Conversation(user_id=user.id, title="bench")
+    setup.add(conversation)
+    setup.commit()
+    user_id, conversation_id = user.id, conversation.id
+    setup.close()
+
+    def values(i):
+        return {"conversation_id": conversation_id, "role": "user", "content": f"message {i}",
+                "created_at": datetime.utcnow()}
+
+    direct = WriteCoalescer(session_factory=BenchSession)
+
+    async def run_direct():
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(clients)
+
+        async def one(i):
+            async with semaphore:
+                item = PendingWrite("conversation_message", user_id, values(i), None)
+                await loop.run_in_executor(None, direct._commit, [item])
+        await asyncio.gather(*(one(i) for i in range(n)))
+
+    coalesced = WriteCoalescer(session_factory=BenchSession)
+
+    async def run_coalesced():
+        semaphore = asyncio.Semaphore(clients)
+
+        async def one(i):
+            async with semaphore:
+                await coalesced.submit("conversation_message", user_id, values(i))
+        await asyncio.gather(*(one(i) for i in range(n)))
+
+    for label, runner, stats in (("one commit per message", run_direct, direct.stats),
+                                 ("coalesced", run_coalesced, coalesced.stats)):
+        started = time.perf_counter()
+        asyncio.run(runner())
+        elapsed = time.perf_counter() - started
+        print(f"⏱️ {label}: {n / elapsed:,.0f} messages/s, {stats['transactions']} transactions "
+              f"({n - stats['transactions']} fsyncs saved)")
@@ -0,0 +1,252 @@
+"""
+Admin cohort reports computed from the columnar snapshot (snapshot.py).
+
+Every report is a handful of vectorized group-bys over whole columns: rows
+are joined to their parent table with a sorted-key lookup (`np.searchsorted`)
+and grouped by integer codes with `np.unique(..., return_inverse=True)` and
+`np.bincount`, so the cost is a few passes over the arrays whatever the
+number of users.
+
+- sector-types: live sectors per SectorType, with distinct users and share
+- goal-completion: goals, completion rate, days to complete and overdue
+  goals per SectorType
+- message-volume: sector and conversation messages per day, with the
+  messages users sent and how many users were active
+
+Each report can be split by a cohort of the owning user: the month they
+signed up (`signup_month`) or their current `level`. Rows whose user is no
+longer in the snapshot fall in the "unknown" cohort.
+
+Results are cached per snapshot generation, so repeated queries cost
+nothing until the next export.
+
+    python cohorts.py goal-completion --cohort signup_month
+"""
+import threading
+import time
+from typing import Optional
+
+import numpy as np
+
+import snapshot
+
+COHORTS = ("all", "signup_month", "level")
+UNKNOWN = "unknown"
+DAY = np.timedelta64(1, "D")
+
+_cache = {}  # (generation, report, cohort, days) -> rows
+_cache_lock = threading.Lock()
+
+
+class ReportError(ValueError):
+    pass
+
+
+# ==================== ARRAY HELPERS ====================
+
+def _lookup(keys: np.ndarray, wanted: np.ndarray) -> np.ndarray:
+    """Index in `keys` of each wanted key, -1 where it is missing"""
+    if not len(keys):
+        return np.full(len(wanted), -1, dtype=np.int64)
+    order = np.argsort(keys, kind="stable")
+    position = np.minimum(np.searchsorted(keys, wanted, sorter=order), len(keys) - 1)
+    index = order[position]
+    return np.where(keys[index] == wanted, index, -1)
+
+
+def _groups(*codes: np.ndarray) -> tuple:
+    """(distinct code tuples, group index of each row) for equal-length integer code arrays"""
+    stacked = np.stack([np.asarray(c, dtype=np.int64) for c in codes], axis=1)
+    groups, inverse = np.unique(stacked, axis=0, return_inverse=True)
+    return groups, inverse.reshape(-1)
+
+
+def _distinct(inverse: np.ndarray, values: np.ndarray, groups: int, mask: Optional[np.ndarray] = None) -> np.ndarray:
+    """Number of distinct `values` per group, counting only rows in `mask`"""
+    if mask is not None:
+        inverse, values = inverse[mask], values[mask]
+    pairs = np.unique(np.stack([inverse, values], axis=1), axis=0)
+    return np.bincount(pairs[:, 0], minlength=groups)
+
+
+def _category(table: snapshot.Table, column: str, codes: np.ndarray) -> list:
+    labels = table.categories.get(column, [])
+    return [labels[code] if code >= 0 else UNKNOWN for code in codes]
+
+
+def _cohorts(snap: snapshot.Snapshot, cohort: str, user_keys: np.ndarray) -> tuple:
+    """(cohort code of each row, cohort labels) for rows owned by `user_keys`"""
+    if cohort == "all":
+        return np.zeros(len(user_keys), dtype=np.int64), ["all"]
+    users = snap.table("users")
+    if cohort == "signup_month":
+        values = np.datetime_as_string(users["created_at"].astype("datetime64[M]"))
+    else:
+        values = users["human_level"].astype(str)
+    labels, user_codes = np.unique(values, return_inverse=True)
+    index = _lookup(users.keys, user_keys)
+    codes = np.where(index >= 0, user_codes[np.maximum(index, 0)], len(labels))
+    return codes, labels.tolist() + [UNKNOWN]
+
+
+def _ratio(numerator: np.ndarray, denominator: np.ndarray) -> np.ndarray:
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(denominator > 0, numerator / np.maximum(denominator, 1), np.nan)
+
+
+def _number(value) -> Optional[float]:
+    return None if np.isnan(value) else round(float(value), 4)
+
+
+# ==================== REPORTS ====================
+
+def sector_types(snap: snapshot.Snapshot, cohort: str = "all", days: int = 0) -> list:
+    """Live sectors per cohort and SectorType"""
+    sectors = snap.table("sectors")
+    live = np.isnat(sectors["deleted_at"])
+    types = sectors["sector_type"][live]
+    owners = sectors.refs("user_id")[live]
+    if not len(types):
+        return []
+
+    cohort_codes, labels = _cohorts(snap, cohort, owners)
+    groups, inverse = _groups(cohort_codes, types)
+    counts = np.bincount(inverse, minlength=len(groups))
+    users = _distinct(inverse, owners, len(groups))
+    per_cohort = np.bincount(cohort_codes, minlength=len(labels))
+    share = counts / per_cohort[groups[:, 0]]
+    type_labels = _category(sectors, "sector_type", groups[:, 1])
+    return [
+        {"cohort": labels[group[0]], "sector_type": type_labels[i], "sectors": int(counts[i]),
+         "users": int(users[i]), "share": _number(share[i])}
+        for i, group in enumerate(groups)
+    ]
+
+
+def goal_completion(snap: snapshot.Snapshot, cohort: str = "all", days: int = 0) -> list:
+    """Goals of live sectors per cohort and SectorType: completion rate, days to complete, overdue"""
+    sectors, goals = snap.table("sectors"), snap.table("goals")
+    sector = _lookup(sectors.keys, goals.refs("sector_id"))
+    keep = sector >= 0
+    keep[keep] = np.isnat(sectors["deleted_at"][sector[keep]])
+    sector = sector[keep]
+    if not len(sector):
+        return []
+
+    completed = goals["is_completed"][keep] == 1
+    created_at, completed_at = goals["created_at"][keep], goals["completed_at"][keep]
+    took = (completed_at - created_at) / DAY  # NaN where either is missing
+    finished = completed & ~np.isnan(took)
+    deadline = goals["deadline"][keep]
+    overdue = ~completed & ~np.isnat(deadline) & (deadline < np.datetime64(snap.exported_at, "us"))
+
+    cohort_codes, labels = _cohorts(snap, cohort, sectors.refs("user_id")[sector])
+    groups, inverse = _groups(cohort_codes, sectors["sector_type"][sector])
+    total = np.bincount(inverse, minlength=len(groups))
+    done = np.bincount(inverse, weights=completed, minlength=len(groups))
+    timed = np.bincount(inverse, weights=finished, minlength=len(groups))
+    took_sum = np.bincount(inverse[finished], weights=took[finished], minlength=len(groups))
+    late = np.bincount(inverse, weights=overdue, minlength=len(groups))
+    rate, average = _ratio(done, total), _ratio(took_sum, timed)
+    type_labels = _category(sectors, "sector_type", groups[:, 1])
+    return [
+        {"cohort": labels[group[0]], "sector_type": type_labels[i], "goals": int(total[i]),
+         "completed": int(done[i]), "completion_rate": _number(rate[i]),
+         "avg_days_to_complete": _number(average[i]), "overdue": int(late[i])}
+        for i, group in enumerate(groups)
+    ]
+
+
+def message_volume(snap: snapshot.Snapshot, cohort: str = "all", days: int = 30) -> list:
+    """Sector and conversation messages per cohort and day, over the `days` days up to the export"""
+    sectors, messages = snap.table("sectors"), snap.table("messages")
+    conversations, replies = snap.table("conversations"), snap.table("conversation_messages")
+    until = np.datetime64(snap.exported_at, "D")
+    since = until - np.timedelta64(days - 1, "D")
+
+    def owners(parents: snapshot.Table, refs: np.ndarray) -> np.ndarray:
+        index = _lookup(parents.keys, refs)
+        return np.where(index >= 0, parents.refs("user_id")[np.maximum(index, 0)], -1) if len(parents) else index
+
+    user_roles = [code for code, role in enumerate(replies.categories.get("role", [])) if role == "user"]
+    day = np.concatenate([messages["created_at"].astype("datetime64[D]"),
+                          replies["created_at"].astype("datetime64[D]")])
+    user = np.concatenate([owners(sectors, messages.refs("sector_id")),
+                           owners(conversations, replies.refs("conversation_id"))])
+    from_sector = np.arange(len(day)) < len(messages)
+    sent = np.concatenate([messages["is_user"] == 1, np.isin(replies["role"], user_roles)])
+
+    window = (day >= since) & (day <= until)
+    day, user, from_sector, sent = day[window], user[window], from_sector[window], sent[window]
+    if not len(day):
+        return []
+
+    cohort_codes, labels = _cohorts(snap, cohort, user)
+    groups, inverse = _groups(cohort_codes, day.astype(np.int64))
+    total = np.bincount(inverse, minlength=len(groups))
+    sector_messages = np.bincount(inverse, weights=from_sector, minlength=len(groups))
+    user_messages = np.bincount(inverse, weights=sent, minlength=len(groups))
+    active = _distinct(inverse, user, len(groups), sent & (user >= 0))
+    dates = np.datetime_as_string(groups[:, 1].astype("datetime64[D]")).tolist()
+    return [
+        {"cohort": labels[group[0]], "day": dates[i], "sector_messages": int(sector_messages[i]),
+         "conversation_messages": int(total[i] - sector_messages[i]),
+         "user_messages": int(user_messages[i]), "active_users": int(active[i])}
+        for i, group in enumerate(groups)
+    ]
+
+
+REPORTS = {
+    "sector-types": sector_types,
+    "goal-completion": goal_completion,
+    "message-volume": message_volume,
+}
+
+
+def run(snap: snapshot.Snapshot, report: str, cohort: str = "all", days: int = 30) -> list:
+    """Rows of a report, cached for the snapshot's generation"""
+    if report not in REPORTS:
+        raise ReportError(f"Unknown report '{report}', expected one of {', '.join(REPORTS)}")
+    if cohort not in COHORTS:
+        raise ReportError(f"Unknown cohort '{cohort}', expected one of {', '.join(COHORTS)}")
+    if days < 1:
+        raise ReportError("days must be at least 1")
+
+    key = (snap.generation, report, cohort, days if report == "message-volume" else 0)
+    with _cache_lock:
+        if key in _cache:
+            return _cache[key]
+
+    started = time.perf_counter()
+    rows = REPORTS[report](snap, cohort, days)
+    print(f"📊 Cohort report {report} by {cohort} on snapshot {snap.generation}: "
+          f"{len(rows)} rows in {(time.perf_counter() - started) * 1000:.1f}ms")
+
+    with _cache_lock:
+        for stale in [k for k in _cache if k[0] != snap.generation]:
+            del _cache[stale]
+        _cache[key] = rows
+    return rows
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Print a cohort report from the analytics snapshot")
+    parser.add_argument("report", choices=list(REPORTS))
+    parser.add_argument("--cohort", choices=COHORTS, default="all")
+    parser.add_argument("--days", type=int, default=30, help="message-volume: days up to the export")
+    parser.add_argument("--directory", default=snapshot.SNAPSHOT_DIR)
+    args = parser.parse_args()
+
+    snap = snapshot.load(args.directory)
+    if snap is None:
+        raise SystemExit("No snapshot yet, run `python snapshot.py export` first")
+    rows = run(snap, args.report, args.cohort, args.days)
+    if rows:
+        columns = list(rows[0])
+        widths = [max(len(column), *(len(str(row[column])) for row in rows)) for column in columns]
+        print("  ".join(column.ljust(width) for column, width in zip(columns, widths)))
+        for row in rows:
+            print("  ".join(str(row[column]).ljust(width) for column, width in zip(columns, widths)))
+    print(f"Snapshot {snap.generation}, exported {snap.exported_at:%Y-%m-%d %H:%M:%S} UTC")
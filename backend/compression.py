@@ -0,0 +1,150 @@
+"""
+Negotiated response compression.
+
+Responses are compressed with brotli or gzip, whichever the client's
+Accept-Encoding prefers (brotli on a tie, and only when the `brotli`
+package is installed). A response that arrives in one piece is compressed
+when it is at least COMPRESSION_MIN_BYTES; smaller ones are not worth the
+CPU. A streamed response (see streaming.py) is compressed as it goes: each
+chunk is flushed so the client can decode rows as soon as they arrive.
+
+Only text-like content types are compressed; event streams, responses that
+already carry a Content-Encoding and anything else pass through untouched.
+Chunks of COMPRESSION_THREAD_BYTES or more are compressed in the threadpool
+so large lists do not stall the event loop.
+"""
+import os
+import zlib
+from typing import Optional
+
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import MutableHeaders
+
+try:
+    import brotli  # optional dependency; without it only gzip is offered
+except ImportError:
+    brotli = None
+
+COMPRESSION_ENABLED = os.getenv("COMPRESSION_ENABLED", "true").lower() == "true"
+COMPRESSION_MIN_BYTES = int(os.getenv("COMPRESSION_MIN_BYTES", "1024"))
+COMPRESSION_THREAD_BYTES = int(os.getenv("COMPRESSION_THREAD_BYTES", str(256 * 1024)))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "4"))  # 11 is far too slow for dynamic responses
+
+COMPRESSIBLE_TYPES = ("application/json", "application/javascript", "application/xml", "image/svg+xml")
+UNCOMPRESSIBLE_TYPES = ("text/event-stream",)
+
+
+class GzipEncoder:
+    def __init__(self):
+        self._compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def encode(self, data: bytes, final: bool) -> bytes:
+        output = self._compressor.compress(data)
+        return output + self._compressor.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+
+class BrotliEncoder:
+    def __init__(self):
+        self._compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+
+    def encode(self, data: bytes, final: bool) -> bytes:
+        output = self._compressor.process(data)
+        return output + (self._compressor.finish() if final else self._compressor.flush())
+
+
+ENCODERS = {"br": BrotliEncoder, "gzip": GzipEncoder} if brotli is not None else {"gzip": GzipEncoder}
+
+
+def negotiate(accept_encoding: str) -> Optional[str]:
+    """The supported encoding the client weighs highest, preferring the order of ENCODERS; None for identity"""
+    weights = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        weights[name.strip().lower()] = quality
+
+    best, best_quality = None, 0.0
+    for name in ENCODERS:
+        quality = weights.get(name, weights.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = name, quality
+    return best
+
+
+def _compressible(headers: MutableHeaders) -> bool:
+    if "content-encoding" in headers:
+        return False
+    content_type = headers.get("content-type", "").split(";")[0].strip().lower()
+    if content_type in UNCOMPRESSIBLE_TYPES:
+        return False
+    return content_type.startswith("text/") or content_type in COMPRESSIBLE_TYPES
+
+
+async def _encode(encoder, data: bytes, final: bool) -> bytes:
+    if len(data) >= COMPRESSION_THREAD_BYTES:
+        return await run_in_threadpool(encoder.encode, data, final)
+    return encoder.encode(data, final)
+
+
+class CompressionMiddleware:
+    """ASGI middleware compressing responses with the client's preferred encoding"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not COMPRESSION_ENABLED:
+            await self.app(scope, receive, send)
+            return
+        accept_encoding = dict(scope["headers"]).get(b"accept-encoding", b"").decode("latin-1")
+        encoding = negotiate(accept_encoding) if accept_encoding else None
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+        encoder = None  # set once the response is being compressed
+        passthrough = False
+
+        async def compress(message):
+            nonlocal start, encoder, passthrough
+            if message["type"] == "http.response.start":
+                start = message  # held until the first body chunk shows whether to compress
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if encoder is None:
+                headers = MutableHeaders(raw=list(start.get("headers", [])))
+                if not _compressible(headers) or (not more_body and len(body) < COMPRESSION_MIN_BYTES):
+                    passthrough = True
+                    await send(start)
+                    await send(message)
+                    return
+
+                encoder = ENCODERS[encoding]()
+                headers.add_vary_header("Accept-Encoding")
+                headers["content-encoding"] = encoding
+                if "content-length" in headers:
+                    del headers["content-length"]
+                body = await _encode(encoder, body, final=not more_body)
+                if not more_body:
+                    headers["content-length"] = str(len(body))
+                await send({**start, "headers": headers.raw})
+                await send({"type": "http.response.body", "body": body, "more_body": more_body})
+                return
+
+            await send({"type": "http.response.body", "body": await _encode(encoder, body, final=not more_body),
+                        "more_body": more_body})
+
+        await self.app(scope, receive, compress)
@@ -0,0 +1,274 @@
+"""
+Streaming NDJSON export and import of a user's data.
+
+Every line is `{"type": <entity>, "data": {...columns}}`, parents before
+children. Export reads each table with `yield_per` (a server-side cursor on
+Postgres) and plain column rows, so nothing accumulates in the session and
+memory stays flat however long the history is. Archived messages are
+exported as ordinary rows. Import parses the body as it arrives and
+bulk-inserts in chunks, remapping sector and conversation ids to the newly
+created rows.
+"""
+import base64
+import enum
+import json
+import os
+import zlib
+from datetime import datetime
+from typing import AsyncIterator, Iterator
+
+from sqlalchemy import DateTime, Enum as SQLEnum, LargeBinary, insert, select
+from sqlalchemy.orm import Session
+
+import archive
+import changelog
+import models
+
+EXPORT_YIELD_PER = int(os.getenv("EXPORT_YIELD_PER", "1000"))
+IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", "1000"))
+GZIP_FLUSH_BYTES = 64 * 1024
+
+
+class Entity:
+    def __init__(self, name: str, model, parent_column: str = None, parent: str = None,
+                 archive_kind: str = None):
+        self.name = name
+        self.model = model
+        self.parent_column = parent_column  # foreign key remapped on import
+        self.parent = parent                # entity that owns the foreign key
+        self.archive_kind = archive_kind    # older rows may live in archive.ARCHIVE_KINDS[...]
+
+
+# Export order; parents always come before their children
+ENTITIES = [
+    Entity("sector", models.Sector),
+    Entity("goal", models.Goal, "sector_id", "sector"),
+    Entity("habit_year", models.HabitYear, "goal_id", "goal"),
+    Entity("goal_progress", models.GoalProgress, "goal_id", "goal"),
+    Entity("statistic", models.Statistic, "sector_id", "sector"),
+    Entity("message", models.Message, "sector_id", "sector", archive_kind="sector"),
+    Entity("conversation", models.Conversation),
+    Entity("conversation_message", models.ConversationMessage, "conversation_id", "conversation",
+           archive_kind="conversation"),
+    Entity("saved_news", models.SavedNews),
+]
+ENTITIES_BY_NAME = {entity.name: entity for entity in ENTITIES}
+
+# Columns that belong to this database rather than to the user's data
+SKIPPED_COLUMNS = {"id", "user_id", "deleted_at"}
+
+
+def _owned_sectors(user_id: int):
+    return select(models.Sector.id).where(
+        models.Sector.user_id == user_id, models.Sector.deleted_at.is_(None)
+    )
+
+
+def _owned_conversations(user_id: int):
+    return select(models.Conversation.id).where(
+        models.Conversation.user_id == user_id, models.Conversation.deleted_at.is_(None)
+    )
+
+
+def _owned_filter(entity: Entity, user_id: int):
+    sectors = _owned_sectors(user_id)
+    conversations = _owned_conversations(user_id)
+    model = entity.model
+    if model is models.Sector:
+        return model.id.in_(sectors)
+    if model is models.Conversation:
+        return model.id.in_(conversations)
+    if entity.parent == "sector":
+        return getattr(model, entity.parent_column).in_(sectors)
+    if entity.parent == "conversation":
+        return getattr(model, entity.parent_column).in_(conversations)
+    if entity.parent == "goal":
+        goals = select(models.Goal.id).where(models.Goal.sector_id.in_(sectors))
+        return getattr(model, entity.parent_column).in_(goals)
+    return model.user_id == user_id
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, enum.Enum):
+        return value.name
+    if isinstance(value, bytes):
+        return base64.b64encode(value).decode()
+    return value
+
+
+# ==================== EXPORT ====================
+
+def _line(entity: Entity, data: dict) -> bytes:
+    return (json.dumps({"type": entity.name, "data": data}, ensure_ascii=False) + "\n").encode()
+
+
+def export_lines(db: Session, user_id: int) -> Iterator[bytes]:
+    """Yield one NDJSON line per row, streaming each table from the database"""
+    for entity in ENTITIES:
+        if entity.archive_kind:
+            # Archived messages come first, they are the oldest; one chunk in memory at a time
+            parents = _owned_sectors(user_id) if entity.parent == "sector" else _owned_conversations(user_id)
+            chunks = db.scalars(archive.archived_chunks(entity.archive_kind, parents).execution_options(yield_per=1))
+            for chunk in chunks:
+                for row in archive.decode_chunk(chunk):
+                    yield _line(entity, {key: _encode(value) for key, value in row.items()})
+
+        columns = entity.model.__table__.columns
+        stmt = select(*columns).where(_owned_filter(entity, user_id)).order_by(entity.model.id)
+        result = db.execute(stmt.execution_options(yield_per=EXPORT_YIELD_PER))
+        for row in result:
+            yield _line(entity, {key: _encode(value) for key, value in row._mapping.items()})
+
+
+def gzip_stream(lines: Iterator[bytes]) -> Iterator[bytes]:
+    """Gzip a byte stream, emitting a compressed chunk every ~64KB of input"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    pending = 0
+    for line in lines:
+        chunk = compressor.compress(line)
+        pending += len(line)
+        if pending >= GZIP_FLUSH_BYTES:
+            chunk += compressor.flush(zlib.Z_SYNC_FLUSH)
+            pending = 0
+        if chunk:
+            yield chunk
+    yield compressor.flush()
+
+
+# ==================== IMPORT ====================
+
+def _decode_row(entity: Entity, data: dict) -> dict:
+    row = {}
+    for column in entity.model.__table__.columns:
+        if column.name in SKIPPED_COLUMNS or column.name not in data:
+            continue
+        value = data[column.name]
+        if value is not None and isinstance(column.type, DateTime):
+            value = datetime.fromisoformat(value)
+        elif value is not None and isinstance(column.type, SQLEnum):
+            value = column.type.enum_class[value]
+        elif value is not None and isinstance(column.type, LargeBinary):
+            value = base64.b64decode(value)
+        row[column.name] = value
+    return row
+
+
+class Importer:
+    """Buffers decoded rows per entity and bulk-inserts them in chunks"""
+
+    def __init__(self, db: Session, user_id: int, chunk_size: int = IMPORT_CHUNK_SIZE):
+        self.db = db
+        self.user_id = user_id
+        self.chunk_size = chunk_size
+        self.id_maps = {"sector": {}, "goal": {}, "conversation": {}}
+        self.counts = {entity.name: 0 for entity in ENTITIES}
+        self.skipped = 0
+        self.saved_urls = set(db.scalars(
+            select(models.SavedNews.url).where(models.SavedNews.user_id == user_id)
+        ))
+        self._entity = None
+        self._buffer = []
+
+    def add(self, record: dict):
+        if not isinstance(record, dict):
+            raise ValueError("record is not a JSON object")
+        entity = ENTITIES_BY_NAME.get(record.get("type"))
+        if entity is None:
+            self.skipped += 1
+            return
+
+        # Parents must be inserted before rows that reference them
+        if entity is not self._entity:
+            self.flush()
+            self._entity = entity
+
+        data = record.get("data") or {}
+        if not isinstance(data, dict):
+            raise ValueError(f"{entity.name} data is not a JSON object")
+        row = _decode_row(entity, data)
+        if entity.parent:
+            parent_id = self.id_maps[entity.parent].get(data.get(entity.parent_column))
+            if parent_id is None:
+                self.skipped += 1
+                return
+            row[entity.parent_column] = parent_id
+        if "user_id" in entity.model.__table__.columns:
+            row["user_id"] = self.user_id
+        if entity.model is models.SavedNews:
+            if row.get("url") in self.saved_urls:
+                self.skipped += 1
+                return
+            self.saved_urls.add(row.get("url"))
+
+        self._buffer.append((data.get("id"), row))
+        if len(self._buffer) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if not self._buffer:
+            return
+        entity, buffer = self._entity, self._buffer
+        self._buffer = []
+
+        # Parameter sets can differ in shape; bulk insert wants uniform rows
+        columns = set().union(*(row.keys() for _, row in buffer))
+        rows = [{column: row.get(column) for column in columns} for _, row in buffer]
+
+        if entity.name in self.id_maps:
+            new_ids = self.db.scalars(
+                insert(entity.model).returning(entity.model.id, sort_by_parameter_order=True),
+                rows,
+            ).all()
+            for (old_id, _), new_id in zip(buffer, new_ids):
+                self.id_maps[entity.name][old_id] = new_id
+        else:
+            self.db.execute(insert(entity.model), rows)
+
+        self.counts[entity.name] += len(rows)
+
+
+def _add_line(importer: Importer, line: bytes, number: int):
+    """Decode one NDJSON line into the importer; errors name the line"""
+    try:
+        importer.add(json.loads(line))
+    except ValueError as e:
+        raise ValueError(f"line {number}: {e}") from e
+
+
+async def import_stream(db: Session, user_id: int, chunks: AsyncIterator[bytes]) -> dict:
+    """Import an NDJSON (optionally gzip) body as it streams in; one transaction"""
+    importer = Importer(db, user_id)
+    decompressor = None
+    pending = b""
+    first = True
+    number = 0
+
+    async for chunk in chunks:
+        if first and chunk:
+            first = False
+            if chunk[:2] == b"\x1f\x8b":
+                decompressor = zlib.decompressobj(31)
+        if decompressor:
+            chunk = decompressor.decompress(chunk)
+
+        lines = (pending + chunk).split(b"\n")
+        pending = lines.pop()
+        for line in lines:
+            number += 1
+            if line.strip():
+                _add_line(importer, line, number)
+
+    if decompressor:
+        pending += decompressor.flush()
+    for line in pending.split(b"\n"):
+        number += 1
+        if line.strip():
+            _add_line(importer, line, number)
+
+    importer.flush()
+    # Bulk inserts are not in the change log; have clients reload in full
+    changelog.force_resync(db, user_id)
+    db.commit()
+    return {"imported": importer.counts, "skipped": importer.skipped}
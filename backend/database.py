@@ -1,7 +1,10 @@
 import os
+from contextvars import ContextVar
+from typing import Optional
+from fastapi import Request
 from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
 
 # Get database URL from environment
 SQLALCHEMY_DATABASE_URL = os.getenv(
@@ -26,9 +29,22 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
 
-def get_db():
+# User data split across several databases, see sharding.py
+SHARDED = bool(os.getenv("SHARD_URLS", "").strip())
+
+# Set by POST /api/batch so its sub-requests share one session
+shared_session: ContextVar[Optional[Session]] = ContextVar("shared_session", default=None)
+
+def get_db(request: Request):
+    shared = shared_session.get()
+    if shared is not None:
+        yield shared
+        return
     db = SessionLocal()
     try:
+        if SHARDED:
+            import sharding  # imports this module
+            sharding.route_request(db, request)
         yield db
     finally:
         db.close()
@@ -0,0 +1,177 @@
+"""
+Realtime events for connected clients.
+
+`publish(user_id, event)` delivers a JSON event to every open
+`GET /api/events` Server-Sent Events stream of that user. It may be called
+from any thread. `publish_after_commit` stages the event on a session and
+sends it only if the transaction commits.
+
+Streams are held per worker process; with several workers set
+EVENTS_BACKEND=redis so an event published by one worker reaches the
+streams held by the others. A worker that is shutting down ends its
+streams (`hub.close_all()`) so they do not hold up the drain; clients
+reconnect on their own.
+"""
+import asyncio
+import json
+import os
+import threading
+from typing import AsyncIterator
+
+from fastapi import Request
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+EVENTS_BACKEND = os.getenv("EVENTS_BACKEND", "memory")
+EVENTS_KEEPALIVE_SECONDS = float(os.getenv("EVENTS_KEEPALIVE_SECONDS", "15"))
+EVENTS_QUEUE_SIZE = 100  # per stream; a client that falls this far behind misses events
+CLOSE = None  # queued to end a stream
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+
+class Hub:
+    """Open streams of this process, by user"""
+
+    def __init__(self):
+        self._subscribers = {}  # user_id -> {queue: loop}
+        self._lock = threading.Lock()
+
+    def subscribe(self, user_id: int) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=EVENTS_QUEUE_SIZE)
+        with self._lock:
+            self._subscribers.setdefault(user_id, {})[queue] = asyncio.get_running_loop()
+        return queue
+
+    def unsubscribe(self, user_id: int, queue: asyncio.Queue):
+        with self._lock:
+            queues = self._subscribers.get(user_id, {})
+            queues.pop(queue, None)
+            if not queues:
+                self._subscribers.pop(user_id, None)
+
+    def deliver(self, user_id: int, payload: dict):
+        with self._lock:
+            targets = list(self._subscribers.get(user_id, {}).items())
+        for queue, loop in targets:
+            loop.call_soon_threadsafe(_offer, queue, payload)
+
+    def connections(self) -> int:
+        with self._lock:
+            return sum(len(queues) for queues in self._subscribers.values())
+
+    def close_all(self):
+        """End every open stream, e.g. when the worker is shutting down"""
+        with self._lock:
+            targets = [item for queues in self._subscribers.values() for item in queues.items()]
+        for queue, loop in targets:
+            loop.call_soon_threadsafe(_close, queue)
+
+
+def _offer(queue: asyncio.Queue, payload: dict):
+    if not queue.full():
+        queue.put_nowait(payload)
+
+
+def _close(queue: asyncio.Queue):
+    while queue.full():
+        queue.get_nowait()  # make room; the stream is ending anyway
+    queue.put_nowait(CLOSE)
+
+
+hub = Hub()
+
+
+class MemoryBackend:
+    """Single worker: publishing is delivering"""
+
+    def publish(self, user_id: int, payload: dict):
+        hub.deliver(user_id, payload)
+
+    def start(self):
+        pass
+
+
+class RedisBackend:
+    """Fan out through a Redis channel that every worker listens to"""
+
+    def __init__(self, url: str = REDIS_URL, channel: str = "events"):
+        import redis  # optional dependency, only needed for multi-worker deployments
+
+        self.channel = channel
+        self._client = redis.Redis.from_url(url)
+        self._listener = None
+        self.start()
+
+    def start(self):
+        """Start listening; again in a forked worker, where the parent's thread does not exist"""
+        if self._listener is None or not self._listener.is_alive():
+            self._listener = threading.Thread(target=self._listen, name="events-redis", daemon=True)
+            self._listener.start()
+
+    def publish(self, user_id: int, payload: dict):
+        self._client.publish(self.channel, json.dumps({"user_id": user_id, "event": payload}, default=str))
+
+    def _listen(self):
+        pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(self.channel)
+        for message in pubsub.listen():
+            envelope = json.loads(message["data"])
+            hub.deliver(envelope["user_id"], envelope["event"])
+
+
+def create_backend():
+    if EVENTS_BACKEND == "redis":
+        return RedisBackend()
+    return MemoryBackend()
+
+
+backend = create_backend()
+
+
+# ==================== PUBLISHING ====================
+
+def publish(user_id: int, event_type: str, data: dict):
+    backend.publish(user_id, {"type": event_type, "data": data})
+
+
+def publish_after_commit(db: Session, user_id: int, event_type: str, data: dict):
+    """Publish once the session's transaction commits; dropped on rollback"""
+    db.info.setdefault("events", []).append((user_id, event_type, data))
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_staged(session):
+    for user_id, event_type, data in session.info.pop("events", ()):
+        try:
+            publish(user_id, event_type, data)
+        except Exception as e:
+            print(f"⚠️ Failed to publish {event_type} event for user {user_id}: {e}")
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_staged(session):
+    session.info.pop("events", None)
+
+
+# ==================== STREAMING ====================
+
+def _format(payload: dict) -> str:
+    return f"event: {payload['type']}\ndata: {json.dumps(payload['data'], default=str)}\n\n"
+
+
+async def stream(request: Request, user_id: int) -> AsyncIterator[str]:
+    """Server-Sent Events for one client until it disconnects"""
+    queue = hub.subscribe(user_id)
+    try:
+        yield ": connected\n\n"
+        while not await request.is_disconnected():
+            try:
+                payload = await asyncio.wait_for(queue.get(), EVENTS_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            if payload is CLOSE:
+                break  # the client's EventSource reconnects, to another worker
+            yield _format(payload)
+    finally:
+        hub.unsubscribe(user_id, queue)
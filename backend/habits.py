@@ -0,0 +1,133 @@
+"""
+Daily habit check-ins stored as one bitmap per goal per year.
+
+A year is 366 bits (46 bytes) in `habit_checkins.bits`; bit `day_of_year - 1`
+is set when the habit was done that day. Checking in flips one bit of one
+row. Streaks, longest run and completion rate are computed with NumPy over
+the unpacked bits of every year at once, and the heatmap endpoint returns
+the raw bitmap, base64-encoded: a whole year in about 60 characters.
+"""
+import base64
+from datetime import date, datetime
+from typing import Optional
+
+import numpy as np
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+
+import analytics
+import models
+
+YEAR_BYTES = 46  # 366 bits, rounded up
+
+
+def _days_in_year(year: int) -> int:
+    return (date(year + 1, 1, 1) - date(year, 1, 1)).days
+
+
+def _year_row(db: Session, goal_id: int, year: int) -> models.HabitYear:
+    row = db.scalars(
+        select(models.HabitYear)
+        .where(models.HabitYear.goal_id == goal_id, models.HabitYear.year == year)
+        .with_for_update()
+    ).first()
+    if row is None:
+        row = models.HabitYear(goal_id=goal_id, year=year, bits=bytes(YEAR_BYTES), checkin_count=0)
+        db.add(row)
+    return row
+
+
+def set_checkin(db: Session, goal_id: int, day: date, done: bool = True) -> bool:
+    """Set or clear one day's bit. Returns True if the bitmap changed"""
+    row = _year_row(db, goal_id, day.year)
+    index = day.timetuple().tm_yday - 1
+    byte, mask = index >> 3, 1 << (index & 7)
+
+    bits = bytearray(row.bits)
+    if bool(bits[byte] & mask) == done:
+        return False
+
+    bits[byte] ^= mask
+    row.bits = bytes(bits)
+    row.checkin_count += 1 if done else -1
+
+    # Habit goals count check-ins as progress
+    current_value = db.scalar(
+        update(models.Goal)
+        .where(models.Goal.id == goal_id)
+        .values(
+            current_value=models.Goal.current_value + (1 if done else -1),
+            version=models.Goal.version + 1
+        )
+        .returning(models.Goal.current_value),
+        execution_options={"synchronize_session": False},
+    )
+    analytics.record_progress(db, goal_id, current_value)
+    return True
+
+
+# ==================== STATS ====================
+
+def _timeline(rows: list, created: date, today: date) -> np.ndarray:
+    """One boolean per day from creation (or the first earlier check-in) to today"""
+    by_year = {row.year: row.bits for row in rows}
+    first_year = min([created.year, today.year] + list(by_year))
+    years = []
+    for year in range(first_year, today.year + 1):
+        raw = np.frombuffer(by_year.get(year, bytes(YEAR_BYTES)), dtype=np.uint8)
+        years.append(np.unpackbits(raw, bitorder="little")[:_days_in_year(year)])
+    days = np.concatenate(years).astype(bool)
+
+    origin = date(first_year, 1, 1)
+    start = min((created - origin).days, (today - origin).days)
+    if days.any():
+        start = min(start, int(np.argmax(days)))
+    return days[start:(today - origin).days + 1]
+
+
+def _longest_run(days: np.ndarray) -> int:
+    if not days.any():
+        return 0
+    edges = np.diff(np.concatenate(([0], days.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    return int((ends - starts).max())
+
+
+def _current_streak(days: np.ndarray) -> int:
+    # Today still counts as in progress, so a streak through yesterday is alive
+    if len(days) and not days[-1]:
+        days = days[:-1]
+    misses = np.flatnonzero(~days)
+    return int(len(days) - (misses[-1] + 1 if len(misses) else 0))
+
+
+def stats(db: Session, goal: models.Goal, today: Optional[date] = None) -> dict:
+    today = today or datetime.utcnow().date()
+    rows = db.scalars(select(models.HabitYear).where(models.HabitYear.goal_id == goal.id)).all()
+
+    created = goal.created_at.date() if goal.created_at else today
+    days = _timeline(rows, created, today)
+
+    return {
+        "goal_id": goal.id,
+        "checkins": int(days.sum()),
+        "current_streak": _current_streak(days),
+        "longest_streak": _longest_run(days),
+        "completion_rate": round(float(days.mean()), 4) if len(days) else 0.0,
+    }
+
+
+def heatmap(db: Session, goal: models.Goal, year: int, today: Optional[date] = None) -> dict:
+    row = db.scalars(
+        select(models.HabitYear).where(models.HabitYear.goal_id == goal.id, models.HabitYear.year == year)
+    ).first()
+    bits = row.bits if row else bytes(YEAR_BYTES)
+
+    return {
+        **stats(db, goal, today),
+        "checkins": row.checkin_count if row else 0,
+        "year": year,
+        "days": _days_in_year(year),
+        "bits": base64.b64encode(bits).decode(),
+    }
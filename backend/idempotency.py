@@ -0,0 +1,235 @@
+"""
+Idempotency-Key support for POST requests.
+
+A client that may retry a POST (flaky network, timeouts) sends an
+`Idempotency-Key: <uuid>` header and reuses it on every retry. The first
+request runs normally and its response (status, headers, body) is stored
+for IDEMPOTENCY_TTL_SECONDS. Retries with the same key get the stored
+response back without the handler running again, marked
+`Idempotent-Replayed: true`. A retry that arrives while the first request
+is still running waits for it instead of running alongside it.
+
+Keys are scoped to the caller (their Authorization header), method and
+path. Reusing a key with a different body is rejected with 422. 5xx
+responses are not stored, so those retries run again. Bodies over
+IDEMPOTENCY_MAX_BODY_BYTES (streamed imports) pass through without
+idempotency.
+
+The in-memory backend covers a single worker; with several workers set
+IDEMPOTENCY_BACKEND=redis so they share keys.
+"""
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+IDEMPOTENCY_ENABLED = os.getenv("IDEMPOTENCY_ENABLED", "true").lower() == "true"
+IDEMPOTENCY_BACKEND = os.getenv("IDEMPOTENCY_BACKEND", "memory")
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+IDEMPOTENCY_LOCK_SECONDS = int(os.getenv("IDEMPOTENCY_LOCK_SECONDS", "60"))  # a crashed request frees its key
+IDEMPOTENCY_MAX_ENTRIES = int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", "100000"))
+IDEMPOTENCY_MAX_BODY_BYTES = int(os.getenv("IDEMPOTENCY_MAX_BODY_BYTES", str(1024 * 1024)))
+IDEMPOTENCY_MAX_RESPONSE_BYTES = int(os.getenv("IDEMPOTENCY_MAX_RESPONSE_BYTES", str(1024 * 1024)))
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+IDEMPOTENT_METHODS = {"POST"}
+MAX_KEY_LENGTH = 255
+POLL_SECONDS = 0.02
+
+PENDING = "pending"
+
+
+class MemoryBackend:
+    """Bounded LRU of key -> (expires_at, record or PENDING) for a single worker"""
+
+    def __init__(self, max_entries: int = IDEMPOTENCY_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    async def begin(self, key: str) -> Optional[object]:
+        """Claim `key`; None if claimed, else what is there (PENDING or the stored record)"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                return entry[1]
+            self._entries[key] = (now + IDEMPOTENCY_LOCK_SECONDS, PENDING)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            return None
+
+    async def get(self, key: str) -> Optional[object]:
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry[1] if entry is not None and entry[0] > time.monotonic() else None
+
+    async def finish(self, key: str, record: dict):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + IDEMPOTENCY_TTL_SECONDS, record)
+
+    async def release(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+class RedisBackend:
+    """Keys shared by every worker through Redis"""
+
+    def __init__(self, url: str = REDIS_URL, prefix: str = "idem:"):
+        import redis.asyncio  # optional dependency, only needed for multi-worker deployments
+
+        self.prefix = prefix
+        self._client = redis.asyncio.Redis.from_url(url)
+
+    async def begin(self, key: str) -> Optional[object]:
+        if await self._client.set(self.prefix + key, PENDING, nx=True, ex=IDEMPOTENCY_LOCK_SECONDS):
+            return None
+        return await self.get(key) or PENDING
+
+    async def get(self, key: str) -> Optional[object]:
+        value = await self._client.get(self.prefix + key)
+        if value is None or value == PENDING.encode():
+            return None if value is None else PENDING
+        return json.loads(value)
+
+    async def finish(self, key: str, record: dict):
+        await self._client.set(self.prefix + key, json.dumps(record), ex=IDEMPOTENCY_TTL_SECONDS)
+
+    async def release(self, key: str):
+        await self._client.delete(self.prefix + key)
+
+
+def create_backend():
+    if IDEMPOTENCY_BACKEND == "redis":
+        return RedisBackend()
+    return MemoryBackend()
+
+
+# ==================== MIDDLEWARE ====================
+
+async def _read_body(receive) -> bytes:
+    chunks = []
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            break
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            break
+    return b"".join(chunks)
+
+
+async def _send_json(send, status: int, detail: str):
+    body = json.dumps({"detail": detail}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _replay(send, record: dict):
+    await send({
+        "type": "http.response.start",
+        "status": record["status"],
+        "headers": [(name.encode("latin-1"), value.encode("latin-1")) for name, value in record["headers"]]
+                   + [(b"idempotent-replayed", b"true")],
+    })
+    await send({"type": "http.response.body", "body": base64.b64decode(record["body"])})
+
+
+class IdempotencyMiddleware:
+    """ASGI middleware storing and replaying responses to keyed POST requests"""
+
+    def __init__(self, app, backend=None):
+        self.app = app
+        self.backend = backend or create_backend()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not IDEMPOTENCY_ENABLED or scope["method"] not in IDEMPOTENT_METHODS:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        idempotency_key = headers.get(b"idempotency-key", b"").decode("latin-1").strip()
+        length = headers.get(b"content-length")
+        if not idempotency_key or length is None or int(length) > IDEMPOTENCY_MAX_BODY_BYTES:
+            await self.app(scope, receive, send)
+            return
+        if len(idempotency_key) > MAX_KEY_LENGTH:
+            await _send_json(send, 400, f"Idempotency-Key must be at most {MAX_KEY_LENGTH} characters")
+            return
+
+        body = await _read_body(receive)
+        caller = hashlib.sha256(headers.get(b"authorization", b"")).hexdigest()[:32]
+        key = f"{caller}:{scope['method']}:{scope['path']}:{idempotency_key}"
+        fingerprint = hashlib.sha256(scope.get("query_string", b"") + b"\0" + body).hexdigest()
+
+        deadline = time.monotonic() + IDEMPOTENCY_LOCK_SECONDS
+        while True:
+            existing = await self.backend.begin(key)
+            if existing is None:
+                break  # ours to run
+            if existing != PENDING:
+                if existing["fingerprint"] != fingerprint:
+                    await _send_json(send, 422, "Idempotency-Key was already used with a different request")
+                else:
+                    await _replay(send, existing)
+                return
+            if time.monotonic() > deadline:
+                await _send_json(send, 409, "A request with this Idempotency-Key is still in progress")
+                return
+            await asyncio.sleep(POLL_SECONDS)  # the first request is still running; wait for its response
+
+        await self._run(scope, body, send, key, fingerprint)
+
+    async def _run(self, scope, body: bytes, send, key: str, fingerprint: str):
+        delivered = False
+
+        async def receive():
+            nonlocal delivered
+            if delivered:
+                return {"type": "http.disconnect"}
+            delivered = True
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        response = {"status": None, "headers": [], "body": [], "size": 0, "stored": False}
+
+        async def capture(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                response["headers"] = [(name.decode("latin-1"), value.decode("latin-1"))
+                                       for name, value in message.get("headers", [])]
+            elif message["type"] == "http.response.body" and response["size"] <= IDEMPOTENCY_MAX_RESPONSE_BYTES:
+                chunk = message.get("body", b"")
+                response["body"].append(chunk)
+                response["size"] += len(chunk)
+                if not message.get("more_body"):
+                    # Store before background tasks run so waiting retries are answered right away
+                    await self._store(key, fingerprint, response)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, capture)
+        finally:
+            if not response["stored"]:
+                await self.backend.release(key)
+
+    async def _store(self, key: str, fingerprint: str, response: dict):
+        if response["status"] >= 500 or response["size"] > IDEMPOTENCY_MAX_RESPONSE_BYTES:
+            return
+        await self.backend.finish(key, {
+            "fingerprint": fingerprint,
+            "status": response["status"],
+            "headers": response["headers"],
+            "body": base64.b64encode(b"".join(response["body"])).decode(),
+        })
+        response["stored"] = True
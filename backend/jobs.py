@@ -0,0 +1,330 @@
+"""
+Durable background job queue backed by the `jobs` table.
+
+Handlers enqueue work in their own transaction and return; a worker
+claims jobs with `FOR UPDATE SKIP LOCKED` on Postgres (a process lock plus
+a single conditional UPDATE on SQLite), runs them with retries and
+exponential backoff, and records the result for the job-status API.
+
+JOB_WORKER_MODE=inline (default) drains the queue in-process after each
+response, which is all a single instance needs. With JOB_WORKER_MODE=worker
+the API only enqueues and `python jobs.py --concurrency 4` does the work,
+as many processes as you like.
+"""
+import os
+import random
+import signal
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from importlib import import_module
+from typing import Callable, Optional
+
+from fastapi import BackgroundTasks
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+
+import models
+import sharding
+from database import SessionLocal, engine
+
+JOB_WORKER_MODE = os.getenv("JOB_WORKER_MODE", "inline")
+JOB_LOCK_TIMEOUT_SECONDS = int(os.getenv("JOB_LOCK_TIMEOUT_SECONDS", "300"))
+JOB_BACKOFF_BASE_SECONDS = float(os.getenv("JOB_BACKOFF_BASE_SECONDS", "2"))
+JOB_BACKOFF_MAX_SECONDS = float(os.getenv("JOB_BACKOFF_MAX_SECONDS", "600"))
+
+# Modules that register handlers; imported lazily to avoid import cycles
+HANDLER_MODULES = ("purge", "badges", "changelog", "archive", "partitions", "snapshot")
+
+_handlers = {}
+_kind_limits = {}
+_running = {}
+_running_lock = threading.Lock()
+_sqlite_claim_lock = threading.Lock()
+_last_requeue = [0.0]
+
+
+def handler(kind: str, concurrency: Optional[int] = None):
+    """Register `fn(db, payload) -> result` as the handler for a job kind.
+
+    `concurrency` caps how many jobs of this kind one process runs at once.
+    """
+    def register(fn: Callable):
+        _handlers[kind] = fn
+        if concurrency:
+            _kind_limits[kind] = concurrency
+        return fn
+    return register
+
+
+def load_handlers():
+    for module in HANDLER_MODULES:
+        import_module(module)
+
+
+def enqueue(
+    db: Session,
+    kind: str,
+    payload: Optional[dict] = None,
+    user_id: Optional[int] = None,
+    max_attempts: int = 5,
+    delay_seconds: float = 0,
+) -> models.Job:
+    """Add a job to the caller's session; it becomes visible when they commit"""
+    job = models.Job(
+        kind=kind,
+        payload=payload or {},
+        user_id=user_id,
+        max_attempts=max_attempts,
+        run_at=datetime.utcnow() + timedelta(seconds=delay_seconds),
+    )
+    db.add(job)
+    return job
+
+
+def kick(background_tasks: BackgroundTasks):
+    """Drain the queue after the response when no separate worker is running"""
+    if JOB_WORKER_MODE == "inline":
+        background_tasks.add_task(run_pending)
+
+
+# ==================== CLAIMING ====================
+
+def _busy_kinds() -> list:
+    with _running_lock:
+        return [kind for kind, limit in _kind_limits.items() if _running.get(kind, 0) >= limit]
+
+
+def claim(db: Session, worker_id: str, limit: int) -> list:
+    """Lock up to `limit` due jobs for this worker and mark them running"""
+    now = datetime.utcnow()
+    due = select(models.Job.id).where(
+        models.Job.status == "queued",
+        models.Job.run_at <= now,
+    )
+    busy = _busy_kinds()
+    if busy:
+        due = due.where(models.Job.kind.notin_(busy))
+    due = due.order_by(models.Job.run_at).limit(limit)
+
+    if db.get_bind().dialect.name == "postgresql":
+        job_ids = db.scalars(due.with_for_update(skip_locked=True)).all()
+        if job_ids:
+            db.execute(
+                update(models.Job)
+                .where(models.Job.id.in_(job_ids))
+                .values(status="running", locked_by=worker_id, locked_at=now)
+            )
+        db.commit()
+    else:
+        # SQLite has no row locks; the UPDATE runs under its database write
+        # lock and the claim token tells us which rows we actually won
+        with _sqlite_claim_lock:
+            claim_token = f"{worker_id}:{uuid.uuid4().hex}"
+            db.execute(
+                update(models.Job)
+                .where(models.Job.id.in_(due.scalar_subquery()), models.Job.status == "queued")
+                .values(status="running", locked_by=claim_token, locked_at=now),
+                execution_options={"synchronize_session": False},
+            )
+            db.commit()
+            job_ids = db.scalars(
+                select(models.Job.id).where(models.Job.locked_by == claim_token)
+            ).all()
+
+    return list(job_ids)
+
+
+def requeue_stale(db: Session) -> int:
+    """Give jobs from crashed workers back to the queue"""
+    cutoff = datetime.utcnow() - timedelta(seconds=JOB_LOCK_TIMEOUT_SECONDS)
+    result = db.execute(
+        update(models.Job)
+        .where(models.Job.status == "running", models.Job.locked_at < cutoff)
+        .values(status="queued", locked_by=None, locked_at=None),
+        execution_options={"synchronize_session": False},
+    )
+    db.commit()
+    return result.rowcount
+
+
+# ==================== RUNNING ====================
+
+def _backoff(attempts: int) -> float:
+    delay = min(JOB_BACKOFF_MAX_SECONDS, JOB_BACKOFF_BASE_SECONDS * 2 ** (attempts - 1))
+    return delay * random.uniform(0.5, 1.0)
+
+
+def run_job(job_id: int, session_factory=SessionLocal):
+    """Run one claimed job in its own session on the job's shard and record the outcome"""
+    db = session_factory()
+    job = db.get(models.Job, job_id)
+    with _running_lock:
+        at_limit = _running.get(job.kind, 0) >= _kind_limits.get(job.kind, float("inf"))
+        if not at_limit:
+            _running[job.kind] = _running.get(job.kind, 0) + 1
+    if at_limit:
+        # Claimed alongside another job of a capped kind; hand it back
+        job.status = "queued"
+        job.run_at = datetime.utcnow() + timedelta(seconds=1)
+        job.locked_by = None
+        job.locked_at = None
+        db.commit()
+        db.close()
+        return
+
+    try:
+        fn = _handlers.get(job.kind)
+        if fn is None:
+            raise LookupError(f"No handler registered for job kind '{job.kind}'")
+        result = fn(db, job.payload or {})
+        job.status = "done"
+        job.result = result
+        job.last_error = None
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        job.attempts += 1
+        job.last_error = str(e)
+        if job.attempts >= job.max_attempts:
+            job.status = "failed"
+            print(f"❌ Job {job.id} ({job.kind}) failed permanently: {e}")
+        else:
+            job.status = "queued"
+            job.run_at = datetime.utcnow() + timedelta(seconds=_backoff(job.attempts))
+            print(f"⚠️ Job {job.id} ({job.kind}) failed, retry {job.attempts}/{job.max_attempts}: {e}")
+        job.locked_by = None
+        job.locked_at = None
+        db.commit()
+    finally:
+        with _running_lock:
+            _running[job.kind] -= 1
+        db.close()
+
+
+def run_pending(limit: int = 100) -> int:
+    """Requeue stale jobs, then claim and run due jobs in the current thread,
+    including jobs they enqueue, up to `limit`. Returns how many ran"""
+    load_handlers()
+    # Inline mode has no worker loop, so stale locks are checked here at the same pace
+    requeue = time.monotonic() - _last_requeue[0] > JOB_LOCK_TIMEOUT_SECONDS
+    if requeue:
+        _last_requeue[0] = time.monotonic()
+    ran = 0
+    for session_factory in sharding.session_factories().values():
+        if requeue:
+            db = session_factory()
+            try:
+                requeue_stale(db)
+            finally:
+                db.close()
+        while ran < limit:
+            db = session_factory()
+            try:
+                job_ids = claim(db, f"inline-{os.getpid()}", limit - ran)
+            finally:
+                db.close()
+            if not job_ids:
+                break
+
+            for job_id in job_ids:
+                run_job(job_id, session_factory)
+            ran += len(job_ids)
+    return ran
+
+
+def run_worker(concurrency: int = 4, poll_interval: float = 1.0):
+    """Poll the queue and run jobs on a thread pool until SIGTERM/SIGINT"""
+    load_handlers()
+    worker_id = f"worker-{os.uname().nodename}-{os.getpid()}"
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stopping.set())
+    signal.signal(signal.SIGINT, lambda *_: stopping.set())
+
+    in_flight = [0]
+    in_flight_lock = threading.Lock()
+
+    def run(job_id, session_factory):
+        try:
+            run_job(job_id, session_factory)
+        finally:
+            with in_flight_lock:
+                in_flight[0] -= 1
+
+    print(f"👷 {worker_id} started with concurrency {concurrency}")
+    last_requeue = 0.0
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        while not stopping.is_set():
+            requeue = time.monotonic() - last_requeue > JOB_LOCK_TIMEOUT_SECONDS
+            if requeue:
+                last_requeue = time.monotonic()
+            claimed = 0
+            for session_factory in sharding.session_factories().values():
+                db = session_factory()
+                try:
+                    if requeue:
+                        requeue_stale(db)
+                    with in_flight_lock:
+                        free = concurrency - in_flight[0]
+                    job_ids = claim(db, worker_id, free) if free else []
+                finally:
+                    db.close()
+
+                for job_id in job_ids:
+                    with in_flight_lock:
+                        in_flight[0] += 1
+                    pool.submit(run, job_id, session_factory)
+                claimed += len(job_ids)
+
+            if not claimed:
+                stopping.wait(poll_interval)
+
+    print(f"👋 {worker_id} stopped")
+
+
+# ==================== HANDLERS ====================
+
+DEFAULT_SECTORS = [
+    {"name": "Health & Fitness", "sector_type": "HEALTH", "icon": "💪", "color": "#10b981"},
+    {"name": "Finance & Money", "sector_type": "FINANCE", "icon": "💰", "color": "#f59e0b"},
+    {"name": "Career & Work", "sector_type": "CAREER", "icon": "🚀", "color": "#8b5cf6"},
+    {"name": "Learning & Skills", "sector_type": "LEARNING", "icon": "📚", "color": "#06b6d4"},
+    {"name": "Mental Wellness", "sector_type": "MENTAL_HEALTH", "icon": "🧘", "color": "#ec4899"},
+]
+
+
+@handler("create_default_sectors")
+def create_default_sectors(db: Session, payload: dict):
+    user_id = payload["user_id"]
+    # Retried jobs must not create a second set
+    existing = db.scalar(select(models.Sector.id).where(models.Sector.user_id == user_id).limit(1))
+    if existing:
+        return {"created": 0}
+
+    sectors = [models.Sector(user_id=user_id, **sector_data) for sector_data in DEFAULT_SECTORS]
+    db.add_all(sectors)
+    db.flush()
+    import changelog  # changelog registers jobs itself, so import lazily
+    for sector in sectors:
+        changelog.record(db, user_id, "sector", sector.id)
+    enqueue(db, "evaluate_badges", {"user_id": user_id, "metrics": ["profile_complete", "sectors_created"]},
+            user_id=user_id)
+    db.commit()
+
+    print(f"✅ Created {len(DEFAULT_SECTORS)} default sectors for user {user_id}")
+    return {"created": len(DEFAULT_SECTORS)}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run the HUMAN background job worker")
+    parser.add_argument("--concurrency", type=int, default=int(os.getenv("JOB_CONCURRENCY", "4")))
+    parser.add_argument("--poll-interval", type=float, default=1.0)
+    args = parser.parse_args()
+
+    models.Base.metadata.create_all(bind=engine)
+    sharding.create_all()
+    run_worker(args.concurrency, args.poll_interval)
@@ -0,0 +1,327 @@
+"""
+Global points leaderboard.
+
+An in-process order-statistics index over `User.total_points`:
+
+- a Fenwick tree over point values counts users at or below each score,
+  giving a user's rank and the user at a given rank in O(log max_points)
+- per-score buckets of user ids (sorted, ties broken by lower id first)
+  and a sorted list of distinct scores let top-N and neighbour queries
+  walk outwards from any rank without touching the database
+
+The index is rebuilt from the users table (of every shard) on startup. Point awards made
+through `points.award_points` are applied when their transaction commits,
+and each process also pulls rows changed by other workers (by
+`users.updated_at`) at most every LEADERBOARD_REFRESH_SECONDS.
+
+Run `python leaderboard.py` to benchmark with 1M users.
+"""
+import bisect
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+
+import models
+import sharding
+from database import SessionLocal
+
+LEADERBOARD_REFRESH_SECONDS = float(os.getenv("LEADERBOARD_REFRESH_SECONDS", "30"))
+
+
+def _rows(db: Session, stmt):
+    """Rows of `stmt` from `db`, or from every shard when user data is sharded"""
+    if not sharding.ENABLED:
+        yield from db.execute(stmt)
+        return
+    for session_factory in sharding.session_factories().values():
+        shard_db = session_factory()
+        try:
+            yield from shard_db.execute(stmt)
+        finally:
+            shard_db.close()
+
+
+def display_names(db: Session, user_ids: list) -> dict:
+    """user_id -> full_name, each looked up on the shard the directory places the user on"""
+    stmt = select(models.User.id, models.User.full_name)
+    if not sharding.ENABLED:
+        return dict(db.execute(stmt.where(models.User.id.in_(user_ids))).all())
+
+    directory = SessionLocal()
+    try:
+        placed = directory.execute(
+            select(models.UserShard.user_id, models.UserShard.shard).where(models.UserShard.user_id.in_(user_ids))
+        ).all()
+    finally:
+        directory.close()
+    by_shard = {}
+    for user_id, shard in placed:
+        by_shard.setdefault(shard, []).append(user_id)
+
+    names = {}
+    for shard, ids in by_shard.items():
+        shard_db = sharding.session_factories()[shard]()
+        try:
+            names.update(shard_db.execute(stmt.where(models.User.id.in_(ids))).all())
+        finally:
+            shard_db.close()
+    return names
+
+
+class Fenwick:
+    """Binary indexed tree of counts over scores 0..size-1"""
+
+    def __init__(self, counts: list):
+        self.size = len(counts)
+        self.tree = [0] + counts
+        for i in range(1, self.size + 1):
+            parent = i + (i & -i)
+            if parent <= self.size:
+                self.tree[parent] += self.tree[i]
+        self._top_bit = 1 << self.size.bit_length()
+
+    def add(self, score: int, delta: int):
+        i = score + 1
+        while i <= self.size:
+            self.tree[i] += delta
+            i += i & -i
+
+    def prefix(self, score: int) -> int:
+        """Number of users with a score <= `score`"""
+        i = min(score + 1, self.size)
+        total = 0
+        while i > 0:
+            total += self.tree[i]
+            i -= i & -i
+        return total
+
+    def lower_bound(self, count: int) -> int:
+        """Smallest score whose prefix count reaches `count` (1-based)"""
+        position = 0
+        step = self._top_bit
+        while step:
+            nxt = position + step
+            if nxt <= self.size and self.tree[nxt] < count:
+                position = nxt
+                count -= self.tree[nxt]
+            step >>= 1
+        return position  # 0-based score
+
+
+class Leaderboard:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._reset()
+        self._watermark = None
+        self._last_refresh = 0.0
+
+    def _reset(self, max_score: int = 1023):
+        self.scores = {}
+        self.buckets = {}
+        self.distinct = []
+        self.tree = Fenwick([0] * (max_score + 1))
+
+    @property
+    def total(self) -> int:
+        return len(self.scores)
+
+    # ==================== BUILDING ====================
+
+    def load(self, pairs):
+        """Replace the index with (user_id, points) pairs"""
+        with self._lock:
+            scores = {user_id: max(0, points or 0) for user_id, points in pairs}
+            max_score = max(scores.values(), default=0)
+            counts = [0] * (max(1023, max_score) + 1)
+            buckets = {}
+            for user_id, score in scores.items():
+                counts[score] += 1
+                buckets.setdefault(score, []).append(user_id)
+            for bucket in buckets.values():
+                bucket.sort()
+
+            self.scores = scores
+            self.buckets = buckets
+            self.distinct = sorted(buckets)
+            self.tree = Fenwick(counts)
+
+    def load_from_db(self, db: Session):
+        started = time.perf_counter()
+        watermark = datetime.utcnow()
+        rows = _rows(db, select(models.User.id, models.User.total_points).execution_options(yield_per=10_000))
+        self.load((user_id, points) for user_id, points in rows)
+        self._watermark = watermark
+        self._last_refresh = time.monotonic()
+        print(f"🏆 Leaderboard loaded {self.total} users in {time.perf_counter() - started:.2f}s")
+
+    def refresh(self, db: Session, force: bool = False):
+        """Apply point changes made by other processes since the last refresh"""
+        if self._watermark is None:
+            self.load_from_db(db)
+            return
+        if not force and time.monotonic() - self._last_refresh < LEADERBOARD_REFRESH_SECONDS:
+            return
+
+        # Overlap a little so rows committed with slightly older timestamps are not missed
+        since = self._watermark - timedelta(seconds=LEADERBOARD_REFRESH_SECONDS)
+        self._watermark = datetime.utcnow()
+        self._last_refresh = time.monotonic()
+        rows = _rows(db, select(models.User.id, models.User.total_points).where(models.User.updated_at >= since))
+        for user_id, points in rows:
+            self.update(user_id, points)
+
+    # ==================== UPDATES ====================
+
+    def _grow(self, score: int):
+        size = self.tree.size
+        while size <= score:
+            size *= 2
+        counts = [0] * size
+        for value, bucket in self.buckets.items():
+            counts[value] = len(bucket)
+        self.tree = Fenwick(counts)
+
+    def _remove(self, user_id: int, score: int):
+        bucket = self.buckets[score]
+        del bucket[bisect.bisect_left(bucket, user_id)]
+        if not bucket:
+            del self.buckets[score]
+            del self.distinct[bisect.bisect_left(self.distinct, score)]
+        self.tree.add(score, -1)
+
+    def _insert(self, user_id: int, score: int):
+        if score >= self.tree.size:
+            self._grow(score)
+        bucket = self.buckets.get(score)
+        if bucket is None:
+            bucket = self.buckets[score] = []
+            bisect.insort(self.distinct, score)
+        bisect.insort(bucket, user_id)
+        self.tree.add(score, 1)
+
+    def update(self, user_id: int, points: int):
+        score = max(0, points or 0)
+        with self._lock:
+            current = self.scores.get(user_id)
+            if current == score:
+                return
+            if current is not None:
+                self._remove(user_id, current)
+            self._insert(user_id, score)
+            self.scores[user_id] = score
+
+    def remove(self, user_id: int):
+        with self._lock:
+            score = self.scores.pop(user_id, None)
+            if score is not None:
+                self._remove(user_id, score)
+
+    # ==================== QUERIES ====================
+
+    def rank(self, user_id: int):
+        """1-based rank, or None if the user is not indexed"""
+        with self._lock:
+            score = self.scores.get(user_id)
+            if score is None:
+                return None
+            higher = self.total - self.tree.prefix(score)
+            return higher + bisect.bisect_left(self.buckets[score], user_id) + 1
+
+    def _locate(self, rank: int):
+        """(score, index in bucket) of the user at a 1-based rank"""
+        from_bottom = self.total - rank + 1
+        score = self.tree.lower_bound(from_bottom)
+        below = self.tree.prefix(score - 1) if score > 0 else 0
+        bucket = self.buckets[score]
+        # Buckets are ascending by id but higher ids rank lower
+        return score, len(bucket) - (from_bottom - below)
+
+    def _walk(self, rank: int, count: int) -> list:
+        """`count` entries (rank, user_id, points) starting at `rank`"""
+        entries = []
+        if count <= 0 or rank > self.total:
+            return entries
+        score, index = self._locate(rank)
+        score_position = bisect.bisect_left(self.distinct, score)
+        while len(entries) < count:
+            bucket = self.buckets[score]
+            for user_id in bucket[index:index + count - len(entries)]:
+                entries.append((rank, user_id, score))
+                rank += 1
+            score_position -= 1
+            if score_position < 0:
+                break
+            score = self.distinct[score_position]
+            index = 0
+        return entries
+
+    def top(self, limit: int = 10) -> list:
+        with self._lock:
+            return self._walk(1, min(limit, self.total))
+
+    def around(self, user_id: int, radius: int = 5) -> list:
+        with self._lock:
+            rank = self.rank(user_id)
+            if rank is None:
+                return []
+            start = max(1, rank - radius)
+            return self._walk(start, rank + radius - start + 1)
+
+
+board = Leaderboard()
+
+
+# ==================== COMMIT HOOK ====================
+
+def stage(db: Session, user_id: int, points: int):
+    """Remember a new point total; applied to the index only if the transaction commits"""
+    db.info.setdefault("leaderboard", {})[user_id] = points
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_staged(session):
+    staged = session.info.pop("leaderboard", None)
+    if staged and board._watermark is not None:
+        for user_id, points in staged.items():
+            board.update(user_id, points)
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_staged(session):
+    session.info.pop("leaderboard", None)
+
+
+if __name__ == "__main__":
+    import random
+
+    n = 1_000_000
+    random.seed(7)
+    pairs = [(user_id, int(random.paretovariate(1.2) * 10)) for user_id in range(1, n + 1)]
+
+    started = time.perf_counter()
+    board.load(pairs)
+    print(f"⏱️ load {n:,} users: {time.perf_counter() - started:.2f}s "
+          f"({len(board.distinct):,} distinct scores, max {board.distinct[-1]:,})")
+
+    def bench(label, fn, repeat=10_000):
+        started = time.perf_counter()
+        for i in range(repeat):
+            fn(i)
+        print(f"⏱️ {label}: {(time.perf_counter() - started) / repeat * 1e6:.1f} µs")
+
+    bench("top 10", lambda i: board.top(10))
+    bench("top 100", lambda i: board.top(100), repeat=2_000)
+    bench("rank", lambda i: board.rank(random.randint(1, n)))
+    bench("around ±5", lambda i: board.around(random.randint(1, n), 5))
+    bench("update", lambda i: board.update(random.randint(1, n), random.randint(0, 5_000)))
+
+    # Cross-check against a full sort
+    ordered = sorted(board.scores.items(), key=lambda item: (-item[1], item[0]))
+    for rank in (1, 2, 1000, n // 2, n):
+        assert board._walk(rank, 1)[0][1] == ordered[rank - 1][0]
+        assert board.rank(ordered[rank - 1][0]) == rank
+    print("✅ ranks match a full sort")
@@ -0,0 +1,122 @@
+"""
+Process lifecycle: one-time setup, per-worker warm-up and graceful shutdown.
+
+`prepare()` does the work that is the same for every worker: create and
+upgrade the tables on every shard (see migrations.py), make sure the
+partitions exist, seed the badge catalog and the periodic maintenance jobs, load the leaderboard, and warm up bcrypt and JWT (the first hash
+loads passlib's bcrypt backend, the first token imports the crypto
+backends). server.py calls it once in the master before forking, so
+workers inherit the result instead of each repeating it and racing on the
+same rows. Under a plain `uvicorn main:app` the lifespan calls it instead.
+
+`lifespan` is the app's FastAPI lifespan handler. On startup each worker
+opens WARM_POOL_CONNECTIONS connections per shard so the first requests do
+not pay for connecting, then starts its reminder schedulers and events
+listener. Shutdown runs after the server has drained in-flight requests:
+it stops the schedulers and disposes of every shard's pool, so connections
+are closed instead of dropped when the process exits.
+"""
+import os
+import time
+from contextlib import asynccontextmanager
+
+import archive
+import auth
+import badges
+import changelog
+import events
+import leaderboard
+import migrations
+import models
+import partitions
+import reminders
+import sharding
+from database import SessionLocal, engine
+
+WARM_POOL_CONNECTIONS = int(os.getenv("WARM_POOL_CONNECTIONS", "2"))
+
+_prepared = False
+
+
+# ==================== ONE-TIME SETUP ====================
+
+def prepare_database():
+    """Tables, partitions, the badge catalog and the periodic jobs on every shard"""
+    models.Base.metadata.create_all(bind=engine)
+    migrations.upgrade(engine)
+    sharding.create_all()
+
+    for shard in sharding.shards.values():
+        partitions.ensure_partitions(shard.engine)
+        db = shard.session_factory()
+        try:
+            partitions.schedule_maintenance(db)
+            changelog.schedule_compaction(db)
+            archive.schedule_archiving(db)
+            db.commit()
+            badges.badge_ids(db)
+        finally:
+            db.close()
+
+
+def _warm_auth():
+    try:
+        auth.get_password_hash("warm-up")
+        token = auth.create_access_token({"sub": "warm-up"})
+        auth.jwt.decode(token, auth.SECRET_KEY, algorithms=[auth.ALGORITHM])
+    except Exception as e:
+        print(f"⚠️ Auth warm-up failed: {e}")
+
+
+def prepare():
+    """Everything workers share; done once per process tree"""
+    global _prepared
+    if _prepared:
+        return
+    started = time.perf_counter()
+    prepare_database()
+
+    db = SessionLocal()
+    try:
+        leaderboard.board.load_from_db(db)
+    finally:
+        db.close()
+
+    _warm_auth()
+    _prepared = True
+    print(f"🚀 Prepared in {time.perf_counter() - started:.2f}s")
+
+
+def release_connections():
+    """Close every pooled connection; the master does this before forking so no socket is shared"""
+    for shard in sharding.shards.values():
+        shard.engine.dispose()
+
+
+# ==================== WORKER LIFESPAN ====================
+
+def prime_pools(connections: int = WARM_POOL_CONNECTIONS):
+    """Open `connections` connections per shard and return them to the pool"""
+    for shard in sharding.shards.values():
+        pool = shard.engine.pool
+        count = min(connections, pool.size()) if hasattr(pool, "size") else connections
+        opened = []
+        try:
+            for _ in range(count):
+                opened.append(shard.engine.connect())
+        finally:
+            for connection in opened:
+                connection.close()
+
+
+@asynccontextmanager
+async def lifespan(app):
+    prepare()
+    prime_pools()
+    events.backend.start()
+    reminders.start()
+    print(f"✅ Worker {os.getpid()} ready")
+    yield
+    reminders.stop()
+    release_connections()
+    print(f"👋 Worker {os.getpid()} stopped")
@@ -1,24 +1,61 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, status, BackgroundTasks, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from typing import List
+from sqlalchemy import func, delete, select
+from typing import List, Optional
+from datetime import datetime
 import os
 import models
 import schemas
+import analytics
+import archive
 import auth
-from database import engine, get_db
-
-# Create tables
-models.Base.metadata.create_all(bind=engine)
+import badges
+import changelog
+import coalescer
+import jobs
+import lifecycle
+import mutations
+import points
+import reminders
+import purge
+import response_cache
+import shaping
+import sharding
+import streaming
+from database import get_db
+from rate_limit import RateLimitMiddleware
+from idempotency import IdempotencyMiddleware
+from compression import CompressionMiddleware
+from routers import admin as admin_routes
+from routers import analytics as analytics_routes
+from routers import batch as batch_routes
+from routers import cache as cache_routes
+from routers import data_export as data_export_routes
+from routers import events as events_routes
+from routers import habits as habits_routes
+from routers import jobs as jobs_routes
+from routers import leaderboard as leaderboard_routes
+from routers import notifications as notifications_routes
+from routers import prompt_context as prompt_context_routes
+from routers import related as related_routes
+from routers import sync as sync_routes
+
+ENV = os.getenv("ENVIRONMENT", "development")
+
+# Tables, caches and warm-up run in the lifespan (see lifecycle.py); serverless
+# platforms may never send lifespan events, so create the tables up front there
+if os.getenv("VERCEL"):
+    lifecycle.prepare_database()
 
 # Initialize FastAPI
 app = FastAPI(
     title="HUMAN API",
     docs_url="/api/docs",
     redoc_url="/api/redoc",
-    openapi_url="/api/openapi.json"
+    openapi_url="/api/openapi.json",
+    lifespan=lifecycle.lifespan,
 )
 
 # CORS - CRITICAL FIX FOR YOUR DEPLOYMENT
@@ -30,26 +67,60 @@ origins = [
     "https://*.vercel.app",  # All Vercel preview deployments
 ]
 
+# Idempotency-Key replays - inside rate limiting, so retries still count against the budget
+app.add_middleware(IdempotencyMiddleware)
+
+# gzip/brotli - outside idempotency, so stored responses stay uncompressed and replays are negotiated per client
+app.add_middleware(CompressionMiddleware)
+
+# Rate limiting - added before CORS so 429 responses still carry CORS headers
+app.add_middleware(RateLimitMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],  # ← TEMPORARILY ALLOW ALL (we'll fix this after testing)
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "Retry-After", "X-Cache", "X-Unread-Count", "Idempotent-Replayed"],
 )
 
+app.include_router(jobs_routes.router, prefix="/api/jobs", tags=["jobs"])
+app.include_router(data_export_routes.router, prefix="/api", tags=["data"])
+app.include_router(sync_routes.router, prefix="/api", tags=["sync"])
+app.include_router(leaderboard_routes.router, prefix="/api/leaderboard", tags=["leaderboard"])
+app.include_router(habits_routes.router, prefix="/api/goals", tags=["habits"])
+app.include_router(cache_routes.router, prefix="/api/cache", tags=["cache"])
+app.include_router(batch_routes.router, prefix="/api", tags=["batch"])
+app.include_router(analytics_routes.router, prefix="/api/analytics", tags=["analytics"])
+app.include_router(events_routes.router, prefix="/api/events", tags=["events"])
+app.include_router(notifications_routes.router, prefix="/api/notifications", tags=["notifications"])
+app.include_router(related_routes.router, prefix="/api/related", tags=["related"])
+app.include_router(prompt_context_routes.router, prefix="/api/sectors", tags=["sectors"])
+app.include_router(admin_routes.router, prefix="/api/admin", tags=["admin"])
+
 
 # ==================== AUTH ENDPOINTS ====================
 
 @app.post("/api/auth/signup", response_model=schemas.UserResponse)
-async def signup(user: schemas.UserCreate, db: Session = Depends(get_db)):
+async def signup(
+    user: schemas.UserCreate,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db)
+):
     """Create a new user"""
-    existing_user = db.query(models.User).filter(models.User.email == user.email).first()
-    if existing_user:
+    user_id = None
+    if sharding.ENABLED:
+        # The directory allocates the id and checks the email across shards; db moves to the new user's shard
+        user_id = sharding.register(db, user.email)
+        if user_id is None:
+            raise HTTPException(status_code=400, detail="Email already registered")
+    elif db.query(models.User).filter(models.User.email == user.email).first():
         raise HTTPException(status_code=400, detail="Email already registered")
     
     hashed_password = auth.get_password_hash(user.password)
     db_user = models.User(
+        id=user_id,
         email=user.email,
         full_name=user.full_name,
         hashed_password=hashed_password
@@ -60,27 +131,10 @@ async def signup(user: schemas.UserCreate, db: Session = Depends(get_db)):
     
     print(f"✅ User created: {db_user.email}")
     
-    # Create default sectors
-    default_sectors = [
-        {"name": "Health & Fitness", "sector_type": "HEALTH", "icon": "💪", "color": "#10b981"},
-        {"name": "Finance & Money", "sector_type": "FINANCE", "icon": "💰", "color": "#f59e0b"},
-        {"name": "Career & Work", "sector_type": "CAREER", "icon": "🚀", "color": "#8b5cf6"},
-        {"name": "Learning & Skills", "sector_type": "LEARNING", "icon": "📚", "color": "#06b6d4"},
-        {"name": "Mental Wellness", "sector_type": "MENTAL_HEALTH", "icon": "🧘", "color": "#ec4899"},
-    ]
-    
-    for sector_data in default_sectors:
-        sector = models.Sector(
-            user_id=db_user.id,
-            name=sector_data["name"],
-            sector_type=sector_data["sector_type"],
-            icon=sector_data["icon"],
-            color=sector_data["color"]
-        )
-        db.add(sector)
-    
+    # Default sectors are created off-request
+    jobs.enqueue(db, "create_default_sectors", {"user_id": db_user.id}, user_id=db_user.id)
     db.commit()
-    print(f"✅ Created 5 default sectors for user {db_user.email}")
+    jobs.kick(background_tasks)
     
     return db_user
 
@@ -88,6 +142,7 @@ async def signup(user: schemas.UserCreate, db: Session = Depends(get_db)):
 @app.post("/api/auth/login")
 async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
     """Login user"""
+    sharding.route_email(db, form_data.username)
     user = db.query(models.User).filter(models.User.email == form_data.username).first()
     if not user or not auth.verify_password(form_data.password, user.hashed_password):
         raise HTTPException(
@@ -95,7 +150,7 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session =
             detail="Incorrect email or password"
         )
     
-    access_token = auth.create_access_token(data={"sub": user.email})
+    access_token = auth.create_access_token(data={"sub": user.email, "uid": user.id})
     print(f"✅ User logged in: {user.email}")
     
     return {"access_token": access_token, "token_type": "bearer"}
@@ -111,41 +166,59 @@ async def get_current_user_info(current_user: models.User = Depends(auth.get_cur
 
 @app.get("/api/sectors", response_model=List[schemas.SectorResponse])
 async def get_all_sectors(
+    request: Request,
+    fields: Optional[str] = None,
+    include: Optional[str] = None,
     current_user: models.User = Depends(auth.get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Get all sectors for the current user"""
-    sectors = db.query(models.Sector).filter(
-        models.Sector.user_id == current_user.id,
-        models.Sector.is_active == True
-    ).order_by(models.Sector.created_at.desc()).all()
-    
-    print(f"✅ Fetched {len(sectors)} sectors for user {current_user.id}")
+    """Get all sectors for the current user (`?fields=`, `?include=goals`)"""
+    shape = shaping.parse(shaping.SECTORS, fields, include)
+    
+    def build():
+        sectors = shape.apply(db.query(models.Sector)).filter(
+            models.Sector.user_id == current_user.id,
+            models.Sector.is_active == True,
+            models.Sector.deleted_at.is_(None)
+        ).order_by(models.Sector.created_at.desc()).all()
+        
+        print(f"✅ Fetched {len(sectors)} sectors for user {current_user.id}")
+        return sectors
     
-    return sectors
+    return await response_cache.cached_response(
+        request, current_user.id, shape.resources(), shape.response_type(), build
+    )
 
 
 @app.get("/api/sectors/{sector_id}", response_model=schemas.SectorResponse)
 async def get_sector(
     sector_id: int,
+    request: Request,
     current_user: models.User = Depends(auth.get_current_user),
     db: Session = Depends(get_db)
 ):
     """Get a specific sector"""
-    sector = db.query(models.Sector).filter(
-        models.Sector.id == sector_id,
-        models.Sector.user_id == current_user.id
-    ).first()
-    
-    if not sector:
-        raise HTTPException(status_code=404, detail="Sector not found")
+    def build():
+        sector = db.query(models.Sector).filter(
+            models.Sector.id == sector_id,
+            models.Sector.user_id == current_user.id,
+            models.Sector.deleted_at.is_(None)
+        ).first()
+        
+        if not sector:
+            raise HTTPException(status_code=404, detail="Sector not found")
+        return sector
     
-    return sector
+    return await response_cache.cached_response(
+        request, current_user.id, ("sectors",), schemas.SectorResponse, build,
+        headers=lambda sector: {"ETag": mutations.etag(sector.version)}
+    )
 
 
 @app.post("/api/sectors", response_model=schemas.SectorResponse)
 async def create_sector(
     sector: schemas.SectorCreate,
+    background_tasks: BackgroundTasks,
     current_user: models.User = Depends(auth.get_current_user),
     db: Session = Depends(get_db)
 ):
@@ -155,8 +228,12 @@ async def create_sector(
         **sector.dict()
     )
     db.add(db_sector)
+    db.flush()
+    changelog.record(db, current_user.id, "sector", db_sector.id)
+    badges.queue_evaluation(db, current_user.id, ["sectors_created"])
     db.commit()
     db.refresh(db_sector)
+    jobs.kick(background_tasks)
     
     print(f"✅ Sector created: {db_sector.name} for user {current_user.id}")
     
@@ -167,45 +244,57 @@ async def create_sector(
 async def update_sector(
     sector_id: int,
     sector: schemas.SectorUpdate,
+    request: Request,
+    response: Response,
     current_user: models.User = Depends(auth.get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Update a sector"""
-    db_sector = db.query(models.Sector).filter(
-        models.Sector.id == sector_id,
-        models.Sector.user_id == current_user.id
-    ).first()
-    
-    if not db_sector:
-        raise HTTPException(status_code=404, detail="Sector not found")
-    
-    for key, value in sector.dict(exclude_unset=True).items():
-        setattr(db_sector, key, value)
-    
+    """Update a sector (send If-Match with its version to avoid lost updates)"""
+    db_sector = mutations.update_owned(
+        db, models.Sector,
+        [
+            models.Sector.id == sector_id,
+            models.Sector.user_id == current_user.id,
+            models.Sector.deleted_at.is_(None)
+        ],
+        sector.dict(exclude_unset=True),
+        mutations.parse_if_match(request),
+        "Sector not found"
+    )
+    changelog.record(db, current_user.id, "sector", sector_id)
     db.commit()
-    db.refresh(db_sector)
     
+    mutations.set_etag(response, db_sector.version)
     return db_sector
 
 
 @app.delete("/api/sectors/{sector_id}")
 async def delete_sector(
     sector_id: int,
+    request: Request,
+    background_tasks: BackgroundTasks,
     current_user: models.User = Depends(auth.get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Delete a sector"""
-    db_sector = db.query(models.Sector).filter(
-        models.Sector.id == sector_id,
-        models.Sector.user_id == current_user.id
-    ).first()
-    
-    if not db_sector:
-        raise HTTPException(status_code=404, detail="Sector not found")
-    
-    db_sector.is_active = False
+    """Soft-delete a sector; its messages, goals and statistics are purged in the background"""
+    mutations.update_owned(
+        db, models.Sector,
+        [
+            models.Sector.id == sector_id,
+            models.Sector.user_id == current_user.id,
+            models.Sector.deleted_at.is_(None)
+        ],
+        {"is_active": False, "deleted_at": datetime.utcnow()},
+        mutations.parse_if_match(request),
+        "Sector not found"
+    )
+    changelog.record(db, current_user.id, "sector", sector_id, "delete")
+    purge.schedule(db, current_user.id, "sector", sector_id)
+    jobs.enqueue(db, "purge", user_id=current_user.id)
     db.commit()
     
+    jobs.kick(background_tasks)
+    
     return {"message": "Sector deleted successfully"}
 
 
@@ -218,17 +307,16 @@ async def get_sector_messages(
     """Get messages for a sector"""
     sector = db.query(models.Sector).filter(
         models.Sector.id == sector_id,
-        models.Sector.user_id == current_user.id
+        models.Sector.user_id == current_user.id,
+        models.Sector.deleted_at.is_(None)
     ).first()
     
     if not sector:
         raise HTTPException(status_code=404, detail="Sector not found")
     
-    messages = db.query(models.Message).filter(
-        models.Message.sector_id == sector_id
-    ).order_by(models.Message.created_at.asc()).all()
-    
-    return messages
+    return streaming.json_response(streaming.encode_rows(
+        archive.iter_messages(db, "sector", sector_id, since=sector.created_at), schemas.MessageResponse
+    ))
 
 
 @app.post("/api/sectors/{sector_id}/messages", response_model=schemas.MessageResponse)
@@ -241,17 +329,28 @@ async def create_sector_message(
     """Create a message in a sector"""
     sector = db.query(models.Sector).filter(
         models.Sector.id == sector_id,
-        models.Sector.user_id == current_user.id
+        models.Sector.user_id == current_user.id,
+        models.Sector.deleted_at.is_(None)
     ).first()
     
     if not sector:
         raise HTTPException(status_code=404, detail="Sector not found")
     
+    if coalescer.MESSAGE_COALESCING:
+        user_id = current_user.id
+        db.commit()  # don't hold the read transaction while the batch is written
+        row, _ = await coalescer.messages_for(db).submit("message", user_id, {
+            "sector_id": sector_id, "created_at": datetime.utcnow(), **message.dict()
+        })
+        return row
+    
     db_message = models.Message(
         sector_id=sector_id,
         **message.dict()
     )
     db.add(db_message)
+    db.flush()
+    changelog.record(db, current_user.id, "message", db_message.id)
     db.commit()
     db.refresh(db_message)
     
@@ -262,49 +361,71 @@ async def create_sector_message(
 
 @app.get("/api/goals", response_model=List[schemas.GoalResponse])
 async def get_all_goals(
+    request: Request,
+    fields: Optional[str] = None,
+    include: Optional[str] = None,
     current_user: models.User = Depends(auth.get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Get all goals for the current user"""
-    sectors = db.query(models.Sector).filter(
-        models.Sector.user_id == current_user.id
-    ).all()
-    
-    sector_ids = [s.id for s in sectors]
-    
-    if not sector_ids:
-        print(f"⚠️ No sectors found for user {current_user.id}")
-        return []
-    
-    goals = db.query(models.Goal).filter(
-        models.Goal.sector_id.in_(sector_ids)
-    ).order_by(models.Goal.created_at.desc()).all()
-    
-    print(f"✅ Fetched {len(goals)} goals for user {current_user.id}")
-    
-    return goals
+    """Get all goals for the current user (`?fields=`, `?include=sector`)"""
+    shape = shaping.parse(shaping.GOALS, fields, include)
+    
+    def rows():
+        sectors = db.query(models.Sector).filter(
+            models.Sector.user_id == current_user.id,
+            models.Sector.deleted_at.is_(None)
+        ).all()
+        
+        sector_ids = [s.id for s in sectors]
+        
+        if not sector_ids:
+            print(f"⚠️ No sectors found for user {current_user.id}")
+            return
+        
+        goals = shape.apply(db.query(models.Goal)).filter(
+            models.Goal.sector_id.in_(sector_ids)
+        ).order_by(models.Goal.created_at.desc())
+        
+        count = 0
+        for goal in goals.yield_per(streaming.STREAM_BATCH_ROWS):
+            count += 1
+            yield goal
+        print(f"✅ Fetched {count} goals for user {current_user.id}")
+    
+    return await response_cache.cached_stream(
+        request, current_user.id, shape.resources(), shape.response_type(), rows
+    )
 
 
 @app.get("/api/sectors/{sector_id}/goals", response_model=List[schemas.GoalResponse])
 async def get_sector_goals(
     sector_id: int,
+    request: Request,
+    fields: Optional[str] = None,
+    include: Optional[str] = None,
     current_user: models.User = Depends(auth.get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Get goals for a specific sector"""
-    sector = db.query(models.Sector).filter(
-        models.Sector.id == sector_id,
-        models.Sector.user_id == current_user.id
-    ).first()
-    
-    if not sector:
-        raise HTTPException(status_code=404, detail="Sector not found")
-    
-    goals = db.query(models.Goal).filter(
-        models.Goal.sector_id == sector_id
-    ).all()
+    """Get goals for a specific sector (`?fields=`, `?include=sector`)"""
+    shape = shaping.parse(shaping.GOALS, fields, include)
+    
+    def build():
+        sector = db.query(models.Sector).filter(
+            models.Sector.id == sector_id,
+            models.Sector.user_id == current_user.id,
+            models.Sector.deleted_at.is_(None)
+        ).first()
+        
+        if not sector:
+            raise HTTPException(status_code=404, detail="Sector not found")
+        
+        return shape.apply(db.query(models.Goal)).filter(
+            models.Goal.sector_id == sector_id
+        ).all()
     
-    return goals
+    return await response_cache.cached_response(
+        request, current_user.id, ("sectors",) + shape.resources(), shape.response_type(), build
+    )
 
 
 @app.post("/api/sectors/{sector_id}/goals", response_model=schemas.GoalResponse)
@@ -317,7 +438,8 @@ async def create_goal(
     """Create a new goal"""
     sector = db.query(models.Sector).filter(
         models.Sector.id == sector_id,
-        models.Sector.user_id == current_user.id
+        models.Sector.user_id == current_user.id,
+        models.Sector.deleted_at.is_(None)
     ).first()
     
     if not sector:
@@ -325,12 +447,17 @@ async def create_goal(
     
     db_goal = models.Goal(
         sector_id=sector_id,
+        remind_at=reminders.remind_at_for(goal.deadline),
         **goal.dict()
     )
     db.add(db_goal)
+    db.flush()
+    analytics.record_progress(db, db_goal.id, db_goal.current_value)
+    reminders.stage(db, db_goal.id, db_goal.remind_at)
+    changelog.record(db, current_user.id, "goal", db_goal.id)
     
     # Award points
-    current_user.total_points += 5
+    points.award_points(db, current_user.id, 5)
     
     db.commit()
     db.refresh(db_goal)
@@ -344,74 +471,115 @@ async def create_goal(
 async def update_goal(
     goal_id: int,
     goal: schemas.GoalUpdate,
+    request: Request,
+    response: Response,
     current_user: models.User = Depends(auth.get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Update a goal"""
-    db_goal = db.query(models.Goal).join(models.Sector).filter(
-        models.Goal.id == goal_id,
-        models.Sector.user_id == current_user.id
-    ).first()
-    
-    if not db_goal:
-        raise HTTPException(status_code=404, detail="Goal not found")
-    
-    for key, value in goal.dict(exclude_unset=True).items():
-        setattr(db_goal, key, value)
-    
+    """Update a goal (send If-Match with its version to avoid lost updates)"""
+    changes = goal.dict(exclude_unset=True)
+    if "deadline" in changes:
+        changes["remind_at"] = reminders.remind_at_for(changes["deadline"])
+    if changes.get("is_completed"):
+        changes["remind_at"] = None
+    db_goal = mutations.update_owned(
+        db, models.Goal,
+        [
+            models.Goal.id == goal_id,
+            models.Goal.sector_id.in_(mutations.owned_sector_ids(current_user.id))
+        ],
+        changes,
+        mutations.parse_if_match(request),
+        "Goal not found"
+    )
+    if "current_value" in changes:
+        analytics.record_progress(db, goal_id, db_goal.current_value)
+    if "remind_at" in changes:
+        reminders.stage(db, goal_id, db_goal.remind_at)
+    changelog.record(db, current_user.id, "goal", goal_id)
     db.commit()
-    db.refresh(db_goal)
     
+    mutations.set_etag(response, db_goal.version)
     return db_goal
 
 
 @app.put("/api/goals/{goal_id}/complete", response_model=schemas.GoalResponse)
 async def complete_goal(
     goal_id: int,
+    request: Request,
+    response: Response,
+    background_tasks: BackgroundTasks,
     current_user: models.User = Depends(auth.get_current_user),
     db: Session = Depends(get_db)
 ):
     """Mark a goal as complete"""
-    db_goal = db.query(models.Goal).join(models.Sector).filter(
+    owned = [
         models.Goal.id == goal_id,
-        models.Sector.user_id == current_user.id
-    ).first()
+        models.Goal.sector_id.in_(mutations.owned_sector_ids(current_user.id))
+    ]
+    expected_version = mutations.parse_if_match(request)
+    
+    try:
+        db_goal = mutations.update_owned(
+            db, models.Goal,
+            owned + [models.Goal.is_completed == False],
+            {"is_completed": True, "completed_at": datetime.utcnow(), "remind_at": None},
+            expected_version,
+            "Goal not found"
+        )
+    except HTTPException as e:
+        if e.status_code != 404:
+            raise
+        # Either missing or already completed; completing twice is a no-op
+        db_goal = db.query(models.Goal).filter(*owned).first()
+        if not db_goal:
+            raise
+        mutations.set_etag(response, db_goal.version)
+        return db_goal
+    
+    changelog.record(db, current_user.id, "goal", goal_id)
+    reminders.stage(db, goal_id, None)
     
-    if not db_goal:
-        raise HTTPException(status_code=404, detail="Goal not found")
+    # Award points
+    points.award_points(db, current_user.id, 10)
+    badges.queue_evaluation(db, current_user.id, ["goals_completed"])
     
-    if not db_goal.is_completed:
-        db_goal.is_completed = True
-        from datetime import datetime
-        db_goal.completed_at = datetime.utcnow()
-        
-        # Award points
-        current_user.total_points += 10
-        
-        db.commit()
-        db.refresh(db_goal)
-        
-        print(f"✅ Goal completed: {db_goal.title}")
+    db.commit()
+    jobs.kick(background_tasks)
     
+    print(f"✅ Goal completed: {db_goal.title}")
+    
+    mutations.set_etag(response, db_goal.version)
     return db_goal
 
 
 @app.delete("/api/goals/{goal_id}")
 async def delete_goal(
     goal_id: int,
+    request: Request,
     current_user: models.User = Depends(auth.get_current_user),
     db: Session = Depends(get_db)
 ):
     """Delete a goal"""
-    db_goal = db.query(models.Goal).join(models.Sector).filter(
+    owned = [
         models.Goal.id == goal_id,
-        models.Sector.user_id == current_user.id
-    ).first()
-    
-    if not db_goal:
-        raise HTTPException(status_code=404, detail="Goal not found")
-    
-    db.delete(db_goal)
+        models.Goal.sector_id.in_(mutations.owned_sector_ids(current_user.id))
+    ]
+    for child in (models.HabitYear, models.GoalProgress):
+        db.execute(
+            delete(child).where(
+                child.goal_id.in_(select(models.Goal.id).where(*owned))
+            ),
+            execution_options={"synchronize_session": False}
+        )
+    mutations.delete_owned(
+        db, models.Goal,
+        owned,
+        mutations.parse_if_match(request),
+        "Goal not found"
+    )
+    changelog.record(db, current_user.id, "goal", goal_id, "delete")
+    reminders.stage(db, goal_id, None)
     db.commit()
     
     return {"message": "Goal deleted successfully"}
@@ -421,31 +589,38 @@ async def delete_goal(
 
 @app.get("/api/conversations", response_model=List[schemas.ConversationListResponse])
 async def get_conversations(
+    request: Request,
+    fields: Optional[str] = None,
     current_user: models.User = Depends(auth.get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Get all conversations for the current user"""
-    conversations = db.query(models.Conversation).filter(
-        models.Conversation.user_id == current_user.id
-    ).order_by(models.Conversation.updated_at.desc()).all()
-    
-    result = []
-    for conv in conversations:
-        message_count = db.query(func.count(models.ConversationMessage.id)).filter(
-            models.ConversationMessage.conversation_id == conv.id
-        ).scalar()
+    """Get all conversations for the current user (`?fields=`)"""
+    shape = shaping.parse(shaping.CONVERSATIONS, fields)
+    
+    def build():
+        conversations = shape.apply(db.query(models.Conversation)).filter(
+            models.Conversation.user_id == current_user.id,
+            models.Conversation.deleted_at.is_(None)
+        ).order_by(models.Conversation.updated_at.desc()).all()
         
-        conv_dict = schemas.ConversationListResponse(
-            id=conv.id,
-            title=conv.title,
-            created_at=conv.created_at,
-            updated_at=conv.updated_at,
-            is_pinned=conv.is_pinned,
-            message_count=message_count
-        )
-        result.append(conv_dict)
+        if shape.fields is None or "message_count" in shape.fields:
+            conversation_ids = [conv.id for conv in conversations]
+            counts = archive.archived_counts(db, "conversation", conversation_ids)
+            hot_counts = db.query(
+                models.ConversationMessage.conversation_id, func.count(models.ConversationMessage.id)
+            ).filter(
+                models.ConversationMessage.conversation_id.in_(conversation_ids)
+            ).group_by(models.ConversationMessage.conversation_id)
+            for conversation_id, count in hot_counts:
+                counts[conversation_id] = counts.get(conversation_id, 0) + count
+            for conv in conversations:
+                conv.message_count = counts.get(conv.id, 0)
+        
+        return conversations
     
-    return result
+    return await response_cache.cached_response(
+        request, current_user.id, shape.resources(), shape.response_type(), build
+    )
 
 
 @app.post("/api/conversations", response_model=schemas.ConversationResponse)
@@ -456,7 +631,8 @@ async def create_conversation(
 ):
     """Create a new conversation"""
     count = db.query(func.count(models.Conversation.id)).filter(
-        models.Conversation.user_id == current_user.id
+        models.Conversation.user_id == current_user.id,
+        models.Conversation.deleted_at.is_(None)
     ).scalar()
     
     if count >= 5:
@@ -467,6 +643,8 @@ async def create_conversation(
         **conversation.dict()
     )
     db.add(db_conversation)
+    db.flush()
+    changelog.record(db, current_user.id, "conversation", db_conversation.id)
     db.commit()
     db.refresh(db_conversation)
     
@@ -482,46 +660,67 @@ async def get_conversation_messages(
     """Get messages for a conversation"""
     conversation = db.query(models.Conversation).filter(
         models.Conversation.id == conversation_id,
-        models.Conversation.user_id == current_user.id
+        models.Conversation.user_id == current_user.id,
+        models.Conversation.deleted_at.is_(None)
     ).first()
     
     if not conversation:
         raise HTTPException(status_code=404, detail="Conversation not found")
     
-    messages = db.query(models.ConversationMessage).filter(
-        models.ConversationMessage.conversation_id == conversation_id
-    ).order_by(models.ConversationMessage.created_at.asc()).all()
-    
-    return messages
+    return streaming.json_response(streaming.encode_rows(
+        archive.iter_messages(db, "conversation", conversation_id, since=conversation.created_at), schemas.ConversationMessageResponse
+    ))
 
 
 @app.post("/api/conversations/{conversation_id}/messages", response_model=schemas.ConversationMessageResponse)
 async def add_conversation_message(
     conversation_id: int,
     message: schemas.ConversationMessageCreate,
+    background_tasks: BackgroundTasks,
     current_user: models.User = Depends(auth.get_current_user),
     db: Session = Depends(get_db)
 ):
     """Add a message to a conversation"""
     conversation = db.query(models.Conversation).filter(
         models.Conversation.id == conversation_id,
-        models.Conversation.user_id == current_user.id
+        models.Conversation.user_id == current_user.id,
+        models.Conversation.deleted_at.is_(None)
     ).first()
     
     if not conversation:
         raise HTTPException(status_code=404, detail="Conversation not found")
     
+    if coalescer.MESSAGE_COALESCING:
+        user_id = current_user.id
+        db.commit()  # don't hold the read transaction while the batch is written
+        row, queued_job = await coalescer.messages_for(db).submit("conversation_message", user_id, {
+            "conversation_id": conversation_id, "created_at": datetime.utcnow(), **message.dict()
+        })
+        if queued_job:
+            jobs.kick(background_tasks)
+        return row
+    
     db_message = models.ConversationMessage(
         conversation_id=conversation_id,
         **message.dict()
     )
     db.add(db_message)
     
-    from datetime import datetime
     conversation.updated_at = datetime.utcnow()
+    db.flush()
+    changelog.record(db, current_user.id, "conversation_message", db_message.id)
+    changelog.record(db, current_user.id, "conversation", conversation_id)
+    
+    # The conversation starts counting towards the AI badge at exactly this size
+    message_count = db.query(func.count(models.ConversationMessage.id)).filter(
+        models.ConversationMessage.conversation_id == conversation_id
+    ).scalar()
+    if message_count == badges.AI_CONVERSATION_MIN_MESSAGES:
+        badges.queue_evaluation(db, current_user.id, ["ai_conversations"])
     
     db.commit()
     db.refresh(db_message)
+    jobs.kick(background_tasks)
     
     return db_message
 
@@ -530,45 +729,57 @@ async def add_conversation_message(
 async def update_conversation(
     conversation_id: int,
     conversation: schemas.ConversationUpdate,
+    request: Request,
+    response: Response,
     current_user: models.User = Depends(auth.get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Update a conversation"""
-    db_conversation = db.query(models.Conversation).filter(
-        models.Conversation.id == conversation_id,
-        models.Conversation.user_id == current_user.id
-    ).first()
-    
-    if not db_conversation:
-        raise HTTPException(status_code=404, detail="Conversation not found")
-    
-    for key, value in conversation.dict(exclude_unset=True).items():
-        setattr(db_conversation, key, value)
-    
+    """Update a conversation (send If-Match with its version to avoid lost updates)"""
+    db_conversation = mutations.update_owned(
+        db, models.Conversation,
+        [
+            models.Conversation.id == conversation_id,
+            models.Conversation.user_id == current_user.id,
+            models.Conversation.deleted_at.is_(None)
+        ],
+        conversation.dict(exclude_unset=True),
+        mutations.parse_if_match(request),
+        "Conversation not found"
+    )
+    changelog.record(db, current_user.id, "conversation", conversation_id)
     db.commit()
-    db.refresh(db_conversation)
     
+    mutations.set_etag(response, db_conversation.version)
     return db_conversation
 
 
 @app.delete("/api/conversations/{conversation_id}")
 async def delete_conversation(
     conversation_id: int,
+    request: Request,
+    background_tasks: BackgroundTasks,
     current_user: models.User = Depends(auth.get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Delete a conversation"""
-    db_conversation = db.query(models.Conversation).filter(
-        models.Conversation.id == conversation_id,
-        models.Conversation.user_id == current_user.id
-    ).first()
-    
-    if not db_conversation:
-        raise HTTPException(status_code=404, detail="Conversation not found")
-    
-    db.delete(db_conversation)
+    """Soft-delete a conversation; its messages are purged in the background"""
+    mutations.update_owned(
+        db, models.Conversation,
+        [
+            models.Conversation.id == conversation_id,
+            models.Conversation.user_id == current_user.id,
+            models.Conversation.deleted_at.is_(None)
+        ],
+        {"deleted_at": datetime.utcnow()},
+        mutations.parse_if_match(request),
+        "Conversation not found"
+    )
+    changelog.record(db, current_user.id, "conversation", conversation_id, "delete")
+    purge.schedule(db, current_user.id, "conversation", conversation_id)
+    jobs.enqueue(db, "purge", user_id=current_user.id)
     db.commit()
     
+    jobs.kick(background_tasks)
+    
     return {"message": "Conversation deleted successfully"}
 
 
@@ -576,17 +787,28 @@ async def delete_conversation(
 
 @app.get("/api/saved-news", response_model=List[schemas.SavedNewsResponse])
 async def get_saved_news(
+    request: Request,
+    fields: Optional[str] = None,
     current_user: models.User = Depends(auth.get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Get all saved news for the current user"""
-    saved_news = db.query(models.SavedNews).filter(
-        models.SavedNews.user_id == current_user.id
-    ).order_by(models.SavedNews.saved_at.desc()).all()
-    
-    print(f"✅ Fetched {len(saved_news)} saved news for user {current_user.id}")
+    """Get all saved news for the current user (`?fields=`)"""
+    shape = shaping.parse(shaping.SAVED_NEWS, fields)
     
-    return saved_news
+    def rows():
+        saved_news = shape.apply(db.query(models.SavedNews)).filter(
+            models.SavedNews.user_id == current_user.id
+        ).order_by(models.SavedNews.saved_at.desc())
+        
+        count = 0
+        for item in saved_news.yield_per(streaming.STREAM_BATCH_ROWS):
+            count += 1
+            yield item
+        print(f"✅ Fetched {count} saved news for user {current_user.id}")
+    
+    return await response_cache.cached_stream(
+        request, current_user.id, shape.resources(), shape.response_type(), rows
+    )
 
 
 @app.post("/api/saved-news", response_model=schemas.SavedNewsResponse)
@@ -609,6 +831,8 @@ async def save_news(
         **news.dict()
     )
     db.add(db_news)
+    db.flush()
+    changelog.record(db, current_user.id, "saved_news", db_news.id)
     db.commit()
     db.refresh(db_news)
     
@@ -624,15 +848,16 @@ async def delete_saved_news(
     db: Session = Depends(get_db)
 ):
     """Delete a saved news article"""
-    db_news = db.query(models.SavedNews).filter(
-        models.SavedNews.id == news_id,
-        models.SavedNews.user_id == current_user.id
-    ).first()
-    
-    if not db_news:
-        raise HTTPException(status_code=404, detail="Saved news not found")
-    
-    db.delete(db_news)
+    mutations.delete_owned(
+        db, models.SavedNews,
+        [
+            models.SavedNews.id == news_id,
+            models.SavedNews.user_id == current_user.id
+        ],
+        None,
+        "Saved news not found"
+    )
+    changelog.record(db, current_user.id, "saved_news", news_id, "delete")
     db.commit()
     
     return {"message": "Saved news deleted successfully"}
@@ -640,44 +865,45 @@ async def delete_saved_news(
 
 # ==================== BADGE ENDPOINTS ====================
 
+@app.get("/api/badges", response_model=List[schemas.BadgeResponse])
+async def get_badges(
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Get all badge definitions"""
+    badges.badge_ids(db)
+    return db.query(models.Badge).filter(models.Badge.key.isnot(None)).order_by(models.Badge.id).all()
+
+
+@app.get("/api/badges/earned", response_model=List[schemas.UserBadgeResponse])
+async def get_earned_badges(
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Get badges the current user has earned"""
+    return db.query(models.UserBadge).filter(
+        models.UserBadge.user_id == current_user.id
+    ).order_by(models.UserBadge.earned_at.desc()).all()
+
+
 @app.get("/api/badges/check-progress")
 async def check_badge_progress(
     current_user: models.User = Depends(auth.get_current_user),
     db: Session = Depends(get_db)
 ):
     """Check user's progress on all badges"""
-    sector_count = db.query(func.count(models.Sector.id)).filter(
-        models.Sector.user_id == current_user.id
-    ).scalar()
-    
-    sectors = db.query(models.Sector).filter(models.Sector.user_id == current_user.id).all()
-    sector_ids = [s.id for s in sectors]
-    completed_goals = db.query(func.count(models.Goal.id)).filter(
-        models.Goal.sector_id.in_(sector_ids),
-        models.Goal.is_completed == True
-    ).scalar() if sector_ids else 0
-    
-    conversations = db.query(models.Conversation).filter(
-        models.Conversation.user_id == current_user.id
-    ).all()
-    
-    ai_conversations = 0
-    for conv in conversations:
-        msg_count = db.query(func.count(models.ConversationMessage.id)).filter(
-            models.ConversationMessage.conversation_id == conv.id
-        ).scalar()
-        if msg_count >= 5:
-            ai_conversations += 1
+    progress = badges.metric_values(db, current_user.id)
     
     return {
         "profile_complete": True,
-        "sectors_created": sector_count,
-        "goals_completed": completed_goals,
+        "sectors_created": progress["sectors_created"],
+        "goals_completed": progress["goals_completed"],
         "streak_days": current_user.streak_days,
-        "ai_conversations": ai_conversations,
+        "ai_conversations": progress["ai_conversations"],
         "zone_out_uses": 0,
         "news_articles_read": 0,
-        "user_level": current_user.human_level
+        "user_level": current_user.human_level,
+        "earned": sorted(badges.earned_keys(db, current_user.id))
     }
 
 
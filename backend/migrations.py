@@ -0,0 +1,121 @@
+"""
+In-place schema upgrades for databases created by an earlier release.
+
+`Base.metadata.create_all` creates missing tables but never alters a table
+that already exists, so a column added to a model would be missing from
+every deployed database and the first query naming it would fail.
+`upgrade(engine)` runs right after create_all and brings existing tables up
+to the models:
+
+- each (table, column) in ADDED_COLUMNS that the table lacks is added with
+  ALTER TABLE ... ADD COLUMN, typed, constrained and defaulted as in the
+  model; existing rows get the column's scalar default, if it has one
+- each index in ADDED_INDEXES, and the index of every added column, is
+  created if it is missing
+- each unique constraint in ADDED_UNIQUE is created as a unique index of
+  the same name, after dropping duplicate rows (the oldest one is kept)
+
+Every step looks at the live schema first, so upgrade() is idempotent and
+cheap enough to run on every start. When a model gains a column or an
+index on a table that has already shipped, append it here.
+"""
+from sqlalchemy import inspect, text, update
+from sqlalchemy.schema import CreateColumn
+
+import models
+
+# (table, column) added to tables after they first shipped, oldest first
+ADDED_COLUMNS = [
+    ("sectors", "deleted_at"),
+    ("conversations", "deleted_at"),
+    ("badges", "key"),
+    ("sectors", "version"),
+    ("goals", "version"),
+    ("conversations", "version"),
+    ("users", "change_seq"),
+    ("users", "sync_floor"),
+    ("goals", "is_habit"),
+    ("goals", "remind_at"),
+    ("users", "unread_notifications"),
+]
+
+# (table, column or index name) indexes added to tables after they first shipped
+ADDED_INDEXES = [
+    ("messages", "sector_id"),
+    ("goals", "sector_id"),
+    ("statistics", "sector_id"),
+    ("conversation_messages", "conversation_id"),
+    ("notifications", "ix_notifications_user_id_id"),
+    ("users", "updated_at"),
+]
+
+# (table, constraint name) unique constraints added to tables after they first shipped
+ADDED_UNIQUE = [
+    ("user_badges", "uq_user_badges_user_badge"),
+]
+
+
+def _index(table, name: str):
+    """The model's index called `name`, or else its index on the single column `name`"""
+    for index in table.indexes:
+        if index.name == name:
+            return index
+    for index in table.indexes:
+        if [column.name for column in index.columns] == [name]:
+            return index
+    return None
+
+
+def _add_unique(connection, table, name: str):
+    constraint = next(constraint for constraint in table.constraints if constraint.name == name)
+    preparer = connection.dialect.identifier_preparer
+    table_sql = preparer.format_table(table)
+    columns_sql = ", ".join(preparer.quote(column.name) for column in constraint.columns)
+    connection.execute(text(
+        f"DELETE FROM {table_sql} WHERE id NOT IN (SELECT MIN(id) FROM {table_sql} GROUP BY {columns_sql})"
+    ))
+    connection.execute(text(f"CREATE UNIQUE INDEX {preparer.quote(name)} ON {table_sql} ({columns_sql})"))
+    print(f"🔧 Added unique index {name}")
+
+
+def upgrade(engine) -> int:
+    """Add the columns and indexes that existing tables are missing. Returns how many columns were added"""
+    added = 0
+    with engine.begin() as connection:
+        inspector = inspect(connection)
+        tables = set(inspector.get_table_names())
+        columns = {}
+
+        for table_name, column_name in ADDED_COLUMNS:
+            if table_name not in tables:
+                continue  # created by create_all with every column
+            if table_name not in columns:
+                columns[table_name] = {column["name"] for column in inspector.get_columns(table_name)}
+            if column_name in columns[table_name]:
+                continue
+
+            column = models.Base.metadata.tables[table_name].c[column_name]
+            table_sql = connection.dialect.identifier_preparer.format_table(column.table)
+            column_sql = CreateColumn(column).compile(dialect=connection.dialect)
+            connection.execute(text(f"ALTER TABLE {table_sql} ADD COLUMN {column_sql}"))
+            if column.default is not None and column.default.is_scalar and column.server_default is None:
+                connection.execute(
+                    update(column.table).where(column.is_(None)).values({column_name: column.default.arg})
+                )
+            columns[table_name].add(column_name)
+            added += 1
+            print(f"🔧 Added column {table_name}.{column_name}")
+
+        for table_name, name in ADDED_INDEXES + ADDED_COLUMNS:
+            index = _index(models.Base.metadata.tables[table_name], name)
+            if table_name in tables and index is not None:
+                index.create(connection, checkfirst=True)
+
+        for table_name, name in ADDED_UNIQUE:
+            if table_name not in tables:
+                continue
+            existing = {index["name"] for index in inspector.get_indexes(table_name)}
+            existing |= {constraint["name"] for constraint in inspector.get_unique_constraints(table_name)}
+            if name not in existing:
+                _add_unique(connection, models.Base.metadata.tables[table_name], name)
+    return added
@@ -1,5 +1,7 @@
-from sqlalchemy import Boolean, Column, Integer, String, Text, Float, DateTime, ForeignKey, Enum as SQLEnum, JSON
+from sqlalchemy import Boolean, Column, Integer, String, Text, Float, DateTime, LargeBinary, ForeignKey, Index, UniqueConstraint, Enum as SQLEnum, JSON
+from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.orm import relationship
+from sqlalchemy.schema import PrimaryKeyConstraint
 from datetime import datetime
 import enum
 from database import Base
@@ -33,8 +35,11 @@ class User(Base):
     human_level = Column(Integer, default=1)
     total_points = Column(Integer, default=0)
     streak_days = Column(Integer, default=0)
+    change_seq = Column(Integer, nullable=False, default=0, server_default="0")  # last ChangeLog.seq
+    sync_floor = Column(Integer, nullable=False, default=0, server_default="0")  # log compacted up to here
+    unread_notifications = Column(Integer, nullable=False, default=0, server_default="0")  # see notifications.py
     created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)  # leaderboard refresh
 
     # Relationships
     sectors = relationship("Sector", back_populates="user", cascade="all, delete-orphan")
@@ -54,6 +59,8 @@ class Sector(Base):
     icon = Column(String, default="📊")
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime, default=datetime.utcnow)
+    deleted_at = Column(DateTime, nullable=True, index=True)  # soft delete, children purged in background
+    version = Column(Integer, nullable=False, default=1, server_default="1")  # optimistic concurrency / ETag
 
     # Relationships
     user = relationship("User", back_populates="sectors")
@@ -64,13 +71,14 @@ class Sector(Base):
 # Message Model (for sector chats)
 class Message(Base):
     __tablename__ = "messages"
+    __table_args__ = {"postgresql_partition_by": "RANGE (created_at)", "info": {"partition_key": "created_at"}}
 
     id = Column(Integer, primary_key=True, index=True)
-    sector_id = Column(Integer, ForeignKey("sectors.id"))
+    sector_id = Column(Integer, ForeignKey("sectors.id"), index=True)
     content = Column(Text)
     is_user = Column(Boolean)
     ai_model = Column(String, nullable=True)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)  # monthly partition key on Postgres
 
     # Relationships
     sector = relationship("Sector", back_populates="messages")
@@ -80,26 +88,58 @@ class Goal(Base):
     __tablename__ = "goals"
 
     id = Column(Integer, primary_key=True, index=True)
-    sector_id = Column(Integer, ForeignKey("sectors.id"))
+    sector_id = Column(Integer, ForeignKey("sectors.id"), index=True)
     title = Column(String)
     description = Column(Text, nullable=True)
     target_value = Column(Float, nullable=True)
     current_value = Column(Float, default=0)
     unit = Column(String, nullable=True)
     deadline = Column(DateTime, nullable=True)
+    remind_at = Column(DateTime, nullable=True, index=True)  # pending deadline reminder, see reminders.py
     is_completed = Column(Boolean, default=False)
     completed_at = Column(DateTime, nullable=True)
+    is_habit = Column(Boolean, default=False)  # tracked with daily check-ins (HabitYear)
     created_at = Column(DateTime, default=datetime.utcnow)
+    version = Column(Integer, nullable=False, default=1, server_default="1")  # optimistic concurrency / ETag
 
     # Relationships
     sector = relationship("Sector", back_populates="goals")
+    habit_years = relationship("HabitYear", back_populates="goal", cascade="all, delete-orphan")
+    progress = relationship("GoalProgress", back_populates="goal", cascade="all, delete-orphan")
+
+# HabitYear Model (one bit per day of daily check-ins for a habit goal)
+class HabitYear(Base):
+    __tablename__ = "habit_checkins"
+    __table_args__ = (UniqueConstraint("goal_id", "year", name="uq_habit_checkins_goal_year"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    goal_id = Column(Integer, ForeignKey("goals.id"), index=True)
+    year = Column(Integer, nullable=False)
+    bits = Column(LargeBinary, nullable=False)  # 46 bytes, bit (day_of_year - 1) in little-endian bit order
+    checkin_count = Column(Integer, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    # Relationships
+    goal = relationship("Goal", back_populates="habit_years")
+
+# GoalProgress Model (current_value after each change, for velocity and ETA forecasts)
+class GoalProgress(Base):
+    __tablename__ = "goal_progress"
+
+    id = Column(Integer, primary_key=True, index=True)
+    goal_id = Column(Integer, ForeignKey("goals.id"), index=True)
+    value = Column(Float, nullable=False)
+    recorded_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+    # Relationships
+    goal = relationship("Goal", back_populates="progress")
 
 # Statistic Model
 class Statistic(Base):
     __tablename__ = "statistics"
 
     id = Column(Integer, primary_key=True, index=True)
-    sector_id = Column(Integer, ForeignKey("sectors.id"))
+    sector_id = Column(Integer, ForeignKey("sectors.id"), index=True)
     metric_name = Column(String)
     value = Column(Float)
     unit = Column(String, nullable=True)
@@ -114,6 +154,7 @@ class Badge(Base):
     __tablename__ = "badges"
 
     id = Column(Integer, primary_key=True, index=True)
+    key = Column(String, unique=True, index=True)  # rule key from badges.BADGE_RULES
     name = Column(String)
     description = Column(Text)
     badge_type = Column(SQLEnum(BadgeType))
@@ -126,6 +167,7 @@ class Badge(Base):
 # UserBadge Model
 class UserBadge(Base):
     __tablename__ = "user_badges"
+    __table_args__ = (UniqueConstraint("user_id", "badge_id", name="uq_user_badges_user_badge"),)
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
@@ -146,6 +188,8 @@ class Conversation(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     is_pinned = Column(Boolean, default=False)
+    deleted_at = Column(DateTime, nullable=True, index=True)  # soft delete, children purged in background
+    version = Column(Integer, nullable=False, default=1, server_default="1")  # optimistic concurrency / ETag
     
     # Relationships
     user = relationship("User", back_populates="conversations")
@@ -154,13 +198,14 @@ class Conversation(Base):
 # ConversationMessage Model
 class ConversationMessage(Base):
     __tablename__ = "conversation_messages"
+    __table_args__ = {"postgresql_partition_by": "RANGE (created_at)", "info": {"partition_key": "created_at"}}
 
     id = Column(Integer, primary_key=True, index=True)
-    conversation_id = Column(Integer, ForeignKey("conversations.id"))
+    conversation_id = Column(Integer, ForeignKey("conversations.id"), index=True)
     role = Column(String)  # 'user' or 'assistant'
     content = Column(Text)
     model_used = Column(String, nullable=True)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)  # monthly partition key on Postgres
     
     # Relationships
     conversation = relationship("Conversation", back_populates="conversation_messages")
@@ -180,3 +225,110 @@ class SavedNews(Base):
     saved_at = Column(DateTime, default=datetime.utcnow)
     
     user = relationship("User")
+
+
+# Notification Model (stored events for a user: deadline reminders, ...)
+class Notification(Base):
+    __tablename__ = "notifications"
+    __table_args__ = (Index("ix_notifications_user_id_id", "user_id", "id"),)  # keyset pages per user
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    kind = Column(String, nullable=False)  # e.g. "deadline_reminder"
+    title = Column(String, nullable=False)
+    body = Column(Text, nullable=True)
+    data = Column(JSON, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    read_at = Column(DateTime, nullable=True)
+
+
+# PurgeTask Model (background removal of soft-deleted sectors/conversations)
+class PurgeTask(Base):
+    __tablename__ = "purge_tasks"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"))
+    entity_type = Column(String)  # 'sector' or 'conversation'
+    entity_id = Column(Integer)
+    status = Column(String, default="pending", index=True)  # pending, running, done, failed
+    rows_purged = Column(Integer, default=0)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    completed_at = Column(DateTime, nullable=True)
+
+# Job Model (durable background work queue)
+class Job(Base):
+    __tablename__ = "jobs"
+    __table_args__ = (Index("ix_jobs_status_run_at", "status", "run_at"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=True, index=True)
+    kind = Column(String, nullable=False)
+    payload = Column(JSON, nullable=True)
+    status = Column(String, default="queued")  # queued, running, done, failed
+    attempts = Column(Integer, default=0)
+    max_attempts = Column(Integer, default=5)
+    run_at = Column(DateTime, default=datetime.utcnow)
+    locked_by = Column(String, nullable=True)
+    locked_at = Column(DateTime, nullable=True)
+    last_error = Column(Text, nullable=True)
+    result = Column(JSON, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+# UserShard Model (sharding directory in the main database: where each user's data lives, see sharding.py)
+class UserShard(Base):
+    __tablename__ = "user_shards"
+
+    user_id = Column(Integer, primary_key=True)  # allocates user ids, unique across shards
+    email = Column(String, unique=True, index=True, nullable=False)
+    shard = Column(String, nullable=False)
+    moving = Column(Boolean, nullable=False, default=False)  # writes are refused while a move copies the data
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+
+# ChangeLog Model (append-only per-user change feed for delta sync)
+class ChangeLog(Base):
+    __tablename__ = "change_log"
+    __table_args__ = (
+        UniqueConstraint("user_id", "seq", name="uq_change_log_user_seq"),
+        Index("ix_change_log_entity", "user_id", "entity_type", "entity_id"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    seq = Column(Integer, nullable=False)
+    entity_type = Column(String, nullable=False)  # sector, goal, message, conversation, conversation_message, saved_news
+    entity_id = Column(Integer, nullable=False)
+    op = Column(String, nullable=False)  # 'upsert' or 'delete'
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+
+# MessageArchive Model (compressed chunk of old messages moved out of the hot tables)
+class MessageArchive(Base):
+    __tablename__ = "message_archives"
+    __table_args__ = (Index("ix_message_archives_parent", "kind", "parent_id"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String, nullable=False)  # 'conversation' (ConversationMessage) or 'sector' (Message)
+    parent_id = Column(Integer, nullable=False)  # conversation_id or sector_id
+    codec = Column(String, nullable=False)  # 'zstd' or 'zlib'
+    message_count = Column(Integer, nullable=False)
+    first_message_at = Column(DateTime)
+    last_message_at = Column(DateTime)
+    raw_bytes = Column(Integer, nullable=False)  # uncompressed JSON size
+    blob = Column(LargeBinary, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+# Postgres requires the partition key in the primary key of a partitioned
+# table; the ORM keeps identifying rows by `id` alone (see partitions.py)
+@compiles(PrimaryKeyConstraint, "postgresql")
+def _partitioned_primary_key(constraint, compiler, **kw):
+    key = constraint.table.info.get("partition_key")
+    if not key or key in constraint.columns:
+        return compiler.visit_primary_key_constraint(constraint, **kw)
+    names = [column.name for column in constraint.columns] + [key]
+    return "PRIMARY KEY (%s)" % ", ".join(compiler.preparer.quote(name) for name in names)
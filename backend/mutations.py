@@ -0,0 +1,99 @@
+"""
+Single-statement, ownership-checked writes with optimistic concurrency.
+
+Updates and deletes run as one `UPDATE/DELETE ... WHERE id = ? AND <owned>
+[AND version = ?] RETURNING ...` instead of SELECT, mutate, commit, refresh.
+Versioned rows expose their version as an ETag; a client that sends it
+back in If-Match gets 409 instead of silently overwriting a newer edit.
+Only when nothing matched is a second query made, to tell 404 from 409.
+"""
+from typing import Optional
+
+from fastapi import HTTPException, Request, Response
+from sqlalchemy import delete, select, update
+from sqlalchemy.orm import Session
+
+import models
+
+
+def parse_if_match(request: Request) -> Optional[int]:
+    """Read the expected version from If-Match; None when absent or '*'"""
+    value = request.headers.get("if-match")
+    if not value or value.strip() == "*":
+        return None
+
+    value = value.strip()
+    if value.startswith("W/"):
+        value = value[2:]
+    try:
+        return int(value.strip('"'))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="If-Match must be a version ETag")
+
+
+def etag(version: int) -> str:
+    return f'"{version}"'
+
+
+def set_etag(response: Response, version: int):
+    response.headers["ETag"] = etag(version)
+
+
+def owned_sector_ids(user_id: int):
+    return select(models.Sector.id).where(
+        models.Sector.user_id == user_id,
+        models.Sector.deleted_at.is_(None)
+    )
+
+
+def _missing(db: Session, model, conditions, expected_version: Optional[int], detail: str):
+    """Explain why a guarded statement matched nothing"""
+    if expected_version is not None:
+        current = db.scalar(select(model.version).where(*conditions))
+        if current is not None:
+            raise HTTPException(
+                status_code=409,
+                detail=f"{model.__name__} was modified (current version {current})",
+                headers={"ETag": f'"{current}"'}
+            )
+    raise HTTPException(status_code=404, detail=detail)
+
+
+def update_owned(db: Session, model, conditions: list, values: dict,
+                 expected_version: Optional[int], detail: str):
+    """UPDATE ... RETURNING the row, bumping its version; 404/409 if nothing matched"""
+    guarded = list(conditions)
+    if expected_version is not None:
+        guarded.append(model.version == expected_version)
+
+    row = db.scalars(
+        update(model)
+        .where(*guarded)
+        .values(**values, version=model.version + 1)
+        .returning(model),
+        execution_options={"synchronize_session": False, "populate_existing": True},
+    ).first()
+
+    if row is None:
+        _missing(db, model, conditions, expected_version, detail)
+
+    # Detached rows keep their RETURNING values through commit, no refresh query
+    db.expunge(row)
+    return row
+
+
+def delete_owned(db: Session, model, conditions: list,
+                 expected_version: Optional[int], detail: str) -> int:
+    """DELETE ... RETURNING id; 404/409 if nothing matched"""
+    guarded = list(conditions)
+    if expected_version is not None:
+        guarded.append(model.version == expected_version)
+
+    deleted_id = db.scalar(
+        delete(model).where(*guarded).returning(model.id),
+        execution_options={"synchronize_session": False},
+    )
+
+    if deleted_id is None:
+        _missing(db, model, conditions, expected_version, detail)
+    return deleted_id
@@ -0,0 +1,103 @@
+"""
+Notification inbox.
+
+Fan-out on write: when something happens (a badge earned, a deadline
+reminder, ...) one row per recipient is inserted right away, so reading an
+inbox is a plain index range on (user_id, id) and never joins back to the
+sources.
+
+Each user's unread count is kept in `users.unread_notifications` and
+maintained incrementally in the same transaction: +1 per notification
+written, minus the number of rows a mark-as-read actually changed. The
+current user is loaded on every request anyway, so the count endpoint costs
+no query at all.
+
+New notifications are also pushed to open `/api/events` streams as a
+"notification" event carrying the new unread count.
+"""
+from datetime import datetime
+from typing import Iterable, List, Optional
+
+from sqlalchemy import insert, select, update
+from sqlalchemy.orm import Session
+
+import events
+import models
+
+NOTIFICATIONS_PAGE_SIZE = 20
+NOTIFICATIONS_MAX_PAGE_SIZE = 100
+
+
+def fan_out(db: Session, user_ids: Iterable[int], kind: str, title: str,
+            body: Optional[str] = None, data: Optional[dict] = None) -> List[int]:
+    """Write one notification per recipient in the caller's transaction. Returns their ids"""
+    recipients = sorted(set(user_ids))
+    if not recipients:
+        return []
+
+    now = datetime.utcnow()
+    ids = db.scalars(
+        insert(models.Notification).returning(models.Notification.id, sort_by_parameter_order=True),
+        [
+            {"user_id": user_id, "kind": kind, "title": title, "body": body, "data": data, "created_at": now}
+            for user_id in recipients
+        ],
+    ).all()
+    unread = dict(db.execute(
+        update(models.User)
+        .where(models.User.id.in_(recipients))
+        .values(unread_notifications=models.User.unread_notifications + 1)
+        .returning(models.User.id, models.User.unread_notifications),
+        execution_options={"synchronize_session": False},
+    ).all())
+
+    for user_id, notification_id in zip(recipients, ids):
+        events.publish_after_commit(db, user_id, "notification", {
+            "id": notification_id, "kind": kind, "title": title, "body": body, "data": data,
+            "created_at": now.isoformat(), "unread": unread.get(user_id),
+        })
+    return list(ids)
+
+
+def notify(db: Session, user_id: int, kind: str, title: str,
+           body: Optional[str] = None, data: Optional[dict] = None) -> int:
+    return fan_out(db, [user_id], kind, title, body, data)[0]
+
+
+def page(db: Session, user_id: int, before: Optional[int] = None, limit: int = NOTIFICATIONS_PAGE_SIZE,
+         unread_only: bool = False) -> list:
+    """Newest first, `limit` rows with an id below `before`"""
+    stmt = select(models.Notification).where(models.Notification.user_id == user_id)
+    if before is not None:
+        stmt = stmt.where(models.Notification.id < before)
+    if unread_only:
+        stmt = stmt.where(models.Notification.read_at.is_(None))
+    return db.scalars(stmt.order_by(models.Notification.id.desc()).limit(limit)).all()
+
+
+def mark_read(db: Session, user_id: int, ids: Optional[List[int]] = None,
+              up_to: Optional[int] = None) -> tuple:
+    """Mark the given ids, everything up to an id, or all unread rows as read in one UPDATE.
+    Returns (rows marked, new unread count)"""
+    stmt = (
+        update(models.Notification)
+        .where(models.Notification.user_id == user_id, models.Notification.read_at.is_(None))
+        .values(read_at=datetime.utcnow())
+    )
+    if ids is not None:
+        stmt = stmt.where(models.Notification.id.in_(ids))
+    if up_to is not None:
+        stmt = stmt.where(models.Notification.id <= up_to)
+    marked = db.execute(stmt, execution_options={"synchronize_session": False}).rowcount
+
+    if not marked:
+        return 0, db.scalar(select(models.User.unread_notifications).where(models.User.id == user_id))
+    unread = db.execute(
+        update(models.User)
+        .where(models.User.id == user_id)
+        .values(unread_notifications=models.User.unread_notifications - marked)
+        .returning(models.User.unread_notifications),
+        execution_options={"synchronize_session": False},
+    ).scalar_one()
+    return marked, unread
+
@@ -0,0 +1,268 @@
+"""
+Monthly range partitioning of the message tables on Postgres.
+
+`messages` and `conversation_messages` are declared `PARTITION BY RANGE
+(created_at)` (see models.py), with one partition per calendar month named
+`<table>_pYYYY_MM` plus a `<table>_default` partition for anything outside
+the pre-created range, e.g. imported history. `ensure_partitions` creates
+the current month and PARTITION_MONTHS_AHEAD months ahead; it runs on
+startup and in the "maintain_partitions" job, which reschedules itself.
+
+With MESSAGE_RETENTION_MONTHS set, maintenance drops whole partitions past
+the retention window (`DETACH` + `DROP TABLE`, no row deletes or vacuum
+debt) along with archived chunks that are entirely older. On SQLite, or a
+Postgres database whose tables predate partitioning, the same retention
+runs as batched row deletes.
+
+Message reads pass the parent's `created_at` as a lower bound so Postgres
+prunes partitions from before the conversation or sector existed.
+
+Existing Postgres tables are converted once with `python partitions.py
+convert`, which copies the rows in a single transaction; run it in a
+maintenance window.
+"""
+import os
+import re
+from datetime import date, datetime
+
+from sqlalchemy import delete, select, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+import jobs
+import models
+
+PARTITION_MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", "3"))
+MESSAGE_RETENTION_MONTHS = int(os.getenv("MESSAGE_RETENTION_MONTHS", "0"))  # 0 keeps messages forever
+PARTITION_MAINTENANCE_HOURS = float(os.getenv("PARTITION_MAINTENANCE_HOURS", "24"))
+RETENTION_BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", "1000"))
+
+PARTITIONED_MODELS = (models.Message, models.ConversationMessage)
+
+_PARTITION_NAME = re.compile(r"_p(\d{4})_(\d{2})$")
+
+
+def _add_months(month: date, count: int) -> date:
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _month_start(moment: datetime) -> date:
+    return date(moment.year, moment.month, 1)
+
+
+def _is_postgres(bind) -> bool:
+    return bind.dialect.name == "postgresql"
+
+
+def _is_partitioned(conn, table: str) -> bool:
+    relkind = conn.scalar(
+        text("SELECT relkind FROM pg_class WHERE oid = to_regclass(:table)"), {"table": table}
+    )
+    return relkind == "p"
+
+
+def retention_cutoff(months: int = MESSAGE_RETENTION_MONTHS):
+    """First instant that is kept, aligned to a month boundary; None without retention"""
+    if months <= 0:
+        return None
+    return datetime.combine(_add_months(_month_start(datetime.utcnow()), -months), datetime.min.time())
+
+
+# ==================== PARTITION CREATION ====================
+
+def _create_partition(conn, table: str, month: date) -> bool:
+    name = f"{table}_p{month:%Y_%m}"
+    exists = conn.scalar(text("SELECT to_regclass(:name) IS NOT NULL"), {"name": name})
+    if exists:
+        return False
+    conn.execute(text(
+        f'CREATE TABLE "{name}" PARTITION OF "{table}" '
+        f"FOR VALUES FROM ('{month.isoformat()}') TO ('{_add_months(month, 1).isoformat()}')"
+    ))
+    return True
+
+
+def ensure_partitions(engine: Engine, months_ahead: int = PARTITION_MONTHS_AHEAD) -> list:
+    """Create this month's and the next months' partitions; returns the names created"""
+    if not _is_postgres(engine):
+        return []
+
+    created = []
+    current = _month_start(datetime.utcnow())
+    with engine.begin() as conn:
+        for model in PARTITIONED_MODELS:
+            table = model.__tablename__
+            if not _is_partitioned(conn, table):
+                print(f"⚠️ {table} is not partitioned; run `python partitions.py convert`")
+                continue
+            conn.execute(text(f'CREATE TABLE IF NOT EXISTS "{table}_default" PARTITION OF "{table}" DEFAULT'))
+            for offset in range(months_ahead + 1):
+                month = _add_months(current, offset)
+                if _create_partition(conn, table, month):
+                    created.append(f"{table}_p{month:%Y_%m}")
+
+    if created:
+        print(f"🗂️ Created partitions: {', '.join(created)}")
+    return created
+
+
+# ==================== RETENTION ====================
+
+def _monthly_partitions(conn, table: str) -> list:
+    """(name, month) of the table's monthly partitions, oldest first"""
+    names = conn.scalars(text(
+        "SELECT child.relname FROM pg_inherits "
+        "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+        "WHERE pg_inherits.inhparent = to_regclass(:table)"
+    ), {"table": table}).all()
+    partitions = []
+    for name in names:
+        match = _PARTITION_NAME.search(name)
+        if match:
+            partitions.append((name, date(int(match.group(1)), int(match.group(2)), 1)))
+    return sorted(partitions, key=lambda partition: partition[1])
+
+
+def _delete_rows_before(db: Session, model, cutoff: datetime) -> int:
+    deleted = 0
+    while True:
+        ids = select(model.id).where(model.created_at < cutoff).limit(RETENTION_BATCH_SIZE).scalar_subquery()
+        batch = db.execute(
+            delete(model).where(model.id.in_(ids)),
+            execution_options={"synchronize_session": False},
+        ).rowcount
+        db.commit()
+        deleted += batch
+        if batch < RETENTION_BATCH_SIZE:
+            return deleted
+
+
+def apply_retention(db: Session, months: int = MESSAGE_RETENTION_MONTHS) -> dict:
+    """Remove messages older than the retention window, by partition where possible"""
+    cutoff = retention_cutoff(months)
+    if cutoff is None:
+        return {"dropped_partitions": [], "deleted_rows": 0, "deleted_archives": 0}
+
+    dropped = []
+    deleted_rows = 0
+    for model in PARTITIONED_MODELS:
+        table = model.__tablename__
+        if _is_postgres(db.bind) and _is_partitioned(db.connection(), table):
+            for name, month in _monthly_partitions(db.connection(), table):
+                if _add_months(month, 1) > cutoff.date():
+                    break
+                db.execute(text(f'ALTER TABLE "{table}" DETACH PARTITION "{name}"'))
+                db.execute(text(f'DROP TABLE "{name}"'))
+                db.commit()
+                dropped.append(name)
+        # Partitioned tables only have stray rows left in the default partition
+        deleted_rows += _delete_rows_before(db, model, cutoff)
+
+    deleted_archives = db.execute(
+        delete(models.MessageArchive).where(models.MessageArchive.last_message_at < cutoff),
+        execution_options={"synchronize_session": False},
+    ).rowcount
+    db.commit()
+
+    print(f"🗓️ Retention before {cutoff:%Y-%m}: dropped {len(dropped)} partitions, "
+          f"deleted {deleted_rows} rows and {deleted_archives} archive chunks")
+    return {"dropped_partitions": dropped, "deleted_rows": deleted_rows, "deleted_archives": deleted_archives}
+
+
+# ==================== MAINTENANCE JOB ====================
+
+def schedule_maintenance(db: Session, delay_seconds: float = 0):
+    """Queue the maintenance job unless one is already waiting or running"""
+    pending = db.scalar(
+        select(models.Job.id).where(models.Job.kind == "maintain_partitions",
+                                    models.Job.status.in_(("queued", "running")))
+    )
+    if pending is None:
+        jobs.enqueue(db, "maintain_partitions", delay_seconds=delay_seconds)
+
+
+@jobs.handler("maintain_partitions", concurrency=1)
+def maintain_job(db: Session, payload: dict):
+    created = ensure_partitions(db.get_bind(), payload.get("months_ahead", PARTITION_MONTHS_AHEAD))
+    retention = apply_retention(db, payload.get("retention_months", MESSAGE_RETENTION_MONTHS))
+    jobs.enqueue(db, "maintain_partitions", delay_seconds=PARTITION_MAINTENANCE_HOURS * 3600)
+    return {"created_partitions": created, **retention}
+
+
+# ==================== CONVERSION ====================
+
+def convert(engine: Engine):
+    """Rebuild existing unpartitioned message tables as partitioned ones, keeping ids"""
+    if not _is_postgres(engine):
+        print("ℹ️ Partitioning is only available on Postgres")
+        return
+
+    for model in PARTITIONED_MODELS:
+        table = model.__table__
+        name = table.name
+        with engine.begin() as conn:
+            if _is_partitioned(conn, name):
+                print(f"✅ {name} is already partitioned")
+                continue
+
+            sequence = conn.scalar(text("SELECT pg_get_serial_sequence(:table, 'id')"), {"table": name})
+            bounds = conn.execute(text(f'SELECT min(created_at), max(created_at) FROM "{name}"')).one()
+
+            conn.execute(text(f'ALTER TABLE "{name}" RENAME TO "{name}_unpartitioned"'))
+            conn.execute(text(f'ALTER INDEX IF EXISTS "{name}_pkey" RENAME TO "{name}_unpartitioned_pkey"'))
+            for index in table.indexes:
+                conn.execute(text(f'DROP INDEX IF EXISTS "{index.name}"'))
+            # The new table's SERIAL gets a fresh sequence; keep using the old one
+            if sequence:
+                conn.execute(text(f"ALTER SEQUENCE {sequence} OWNED BY NONE"))
+            table.create(conn)
+            new_sequence = conn.scalar(text("SELECT pg_get_serial_sequence(:table, 'id')"), {"table": name})
+            if sequence and new_sequence:
+                conn.execute(text(f"ALTER TABLE \"{name}\" ALTER COLUMN id SET DEFAULT nextval('{sequence}')"))
+                conn.execute(text(f"DROP SEQUENCE {new_sequence}"))
+                conn.execute(text(f'ALTER SEQUENCE {sequence} OWNED BY "{name}".id'))
+
+            conn.execute(text(f'CREATE TABLE "{name}_default" PARTITION OF "{name}" DEFAULT'))
+            if bounds[0] is not None:
+                month = _month_start(bounds[0])
+                while month <= _month_start(bounds[1]):
+                    _create_partition(conn, name, month)
+                    month = _add_months(month, 1)
+
+            # Rows without a timestamp land in the default partition
+            columns = ", ".join(f'"{column.name}"' for column in table.columns)
+            selected = ", ".join(
+                "COALESCE(created_at, '1970-01-01')" if column.name == "created_at" else f'"{column.name}"'
+                for column in table.columns
+            )
+            moved = conn.execute(text(
+                f'INSERT INTO "{name}" ({columns}) SELECT {selected} FROM "{name}_unpartitioned"'
+            )).rowcount
+            conn.execute(text(f'DROP TABLE "{name}_unpartitioned"'))
+            print(f"🗂️ Converted {name}: {moved} rows")
+
+    ensure_partitions(engine)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from database import SessionLocal, engine
+
+    parser = argparse.ArgumentParser(description="Manage message table partitions")
+    parser.add_argument("command", choices=["ensure", "retention", "convert"])
+    parser.add_argument("--months", type=int, default=MESSAGE_RETENTION_MONTHS, help="retention in months")
+    args = parser.parse_args()
+
+    models.Base.metadata.create_all(bind=engine)
+    if args.command == "ensure":
+        ensure_partitions(engine)
+    elif args.command == "convert":
+        convert(engine)
+    else:
+        db = SessionLocal()
+        try:
+            apply_retention(db, args.months)
+        finally:
+            db.close()
@@ -0,0 +1,25 @@
+"""
+Point awarding.
+
+Points are added with a single `UPDATE ... SET total_points = total_points + n`
+so concurrent awards never overwrite each other. The new total is staged
+for the leaderboard index, which applies it on commit.
+"""
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+import leaderboard
+import models
+
+
+def award_points(db: Session, user_id: int, amount: int) -> int:
+    """Add points to a user inside the caller's transaction. Returns the new total"""
+    total = db.execute(
+        update(models.User)
+        .where(models.User.id == user_id)
+        .values(total_points=models.User.total_points + amount)
+        .returning(models.User.total_points),
+        execution_options={"synchronize_session": "fetch"},
+    ).scalar_one()
+    leaderboard.stage(db, user_id, total)
+    return total
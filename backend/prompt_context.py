@@ -0,0 +1,257 @@
+"""
+Sector context for AI prompts.
+
+The sector chat sends the model a system prompt. Putting every goal, every
+statistic and the whole chat history in it would overflow the model's
+context, so this module picks what fits a token budget.
+
+Per sector, a summary is precomputed: a header line, one line per goal and
+one rollup line per statistic metric (latest value, 30-day average and
+range, change against the previous 30 days), each already tokenized.
+Summaries are cached per worker under the user's response-cache tag
+versions for sectors and goals (see response_cache.py). Any goal or sector
+change, or an import, bumps those versions and the next request rebuilds
+the summary.
+
+For a question, every goal line, rollup and one of the last
+CONTEXT_MESSAGE_WINDOW chat messages is scored. The score is its
+similarity to the question (hashed term vectors, see related.py) plus a
+prior: active and soon-due goals, fresh metrics and the latest messages
+rank higher. Items are then taken greedily by score while they fit the
+budget. Tokens are estimated at ~4 characters each.
+"""
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Optional
+
+import numpy as np
+from sqlalchemy import and_, case, func, select
+from sqlalchemy.orm import Session
+
+import models
+import related
+import response_cache
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+CONTEXT_MAX_TOKEN_BUDGET = int(os.getenv("CONTEXT_MAX_TOKEN_BUDGET", "8000"))
+CONTEXT_MESSAGE_WINDOW = int(os.getenv("CONTEXT_MESSAGE_WINDOW", "50"))
+CONTEXT_RECENT_MESSAGES = 4  # the tail of the chat gets the full recency prior
+CONTEXT_MESSAGE_MAX_CHARS = 1200
+CONTEXT_PRIOR_WEIGHT = 0.5
+CONTEXT_SUMMARY_TTL_SECONDS = int(os.getenv("CONTEXT_SUMMARY_TTL_SECONDS", "300"))
+CONTEXT_SUMMARY_MAX_ENTRIES = int(os.getenv("CONTEXT_SUMMARY_MAX_ENTRIES", "5000"))
+
+CHARS_PER_TOKEN = 4
+ROLLUP_DAYS = 30
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN) + 1
+
+
+def _number(value: Optional[float]) -> str:
+    return "?" if value is None else f"{value:.4g}"
+
+
+def _similarity(query: tuple, doc: tuple) -> float:
+    """Cosine similarity of two (buckets, weights) term vectors"""
+    _, in_query, in_doc = np.intersect1d(query[0], doc[0], assume_unique=True, return_indices=True)
+    if not len(in_query):
+        return 0.0
+    dot = float(np.dot(query[1][in_query], doc[1][in_doc]))
+    return dot / float(np.linalg.norm(query[1]) * np.linalg.norm(doc[1]))
+
+
+class Item:
+    __slots__ = ("kind", "ref", "text", "vector", "prior", "tokens")
+
+    def __init__(self, kind: str, ref, text: str, prior: float):
+        self.kind = kind
+        self.ref = ref
+        self.text = text
+        self.vector = related.vectorize(text)
+        self.prior = prior
+        self.tokens = estimate_tokens(text)
+
+
+# ==================== SECTOR SUMMARIES ====================
+
+def _goal_item(goal, now: datetime) -> Item:
+    parts = [goal.title]
+    if goal.target_value:
+        percent = min(100, round(100 * (goal.current_value or 0) / goal.target_value))
+        parts.append(f"{_number(goal.current_value or 0)}/{_number(goal.target_value)} {goal.unit or ''}".rstrip()
+                     + f" ({percent}%)")
+    if goal.is_completed:
+        parts.append("completed" + (f" {goal.completed_at:%Y-%m-%d}" if goal.completed_at else ""))
+    elif goal.deadline:
+        parts.append(("overdue since " if goal.deadline < now else "due ") + f"{goal.deadline:%Y-%m-%d}")
+    if goal.is_habit:
+        parts.append("daily habit")
+    text = "- " + ", ".join(parts)
+    if goal.description:
+        text += f": {goal.description[:200]}"
+
+    if goal.is_completed:
+        prior = 0.2
+    elif goal.deadline and goal.deadline < now + timedelta(days=14):
+        prior = 1.0  # overdue or due within two weeks
+    else:
+        prior = 0.7
+    return Item("goal", goal.id, text, prior)
+
+
+def _statistic_items(db: Session, sector_id: int, now: datetime) -> list:
+    """One rollup line per metric, aggregated in the database"""
+    Statistic = models.Statistic
+    recent = Statistic.recorded_at >= now - timedelta(days=ROLLUP_DAYS)
+    previous = and_(Statistic.recorded_at < now - timedelta(days=ROLLUP_DAYS),
+                    Statistic.recorded_at >= now - timedelta(days=2 * ROLLUP_DAYS))
+    rollups = db.execute(
+        select(
+            Statistic.metric_name,
+            func.count(),
+            func.max(Statistic.recorded_at).label("latest_at"),
+            func.max(Statistic.unit),
+            func.avg(case((recent, Statistic.value))),
+            func.min(case((recent, Statistic.value))),
+            func.max(case((recent, Statistic.value))),
+            func.count(case((recent, 1))),
+            func.avg(case((previous, Statistic.value))),
+        )
+        .where(Statistic.sector_id == sector_id)
+        .group_by(Statistic.metric_name)
+    ).all()
+    if not rollups:
+        return []
+
+    newest = (
+        select(Statistic.metric_name, func.max(Statistic.recorded_at).label("recorded_at"))
+        .where(Statistic.sector_id == sector_id)
+        .group_by(Statistic.metric_name)
+        .subquery()
+    )
+    latest = dict(db.execute(
+        select(Statistic.metric_name, Statistic.value)
+        .join(newest, and_(Statistic.metric_name == newest.c.metric_name,
+                           Statistic.recorded_at == newest.c.recorded_at))
+        .where(Statistic.sector_id == sector_id)
+    ).all())
+
+    items = []
+    for name, count, latest_at, unit, average, low, high, recent_count, previous_average in rollups:
+        unit = f" {unit}" if unit else ""
+        text = f"- {name}: latest {_number(latest.get(name))}{unit}"
+        if latest_at:
+            text += f" on {latest_at:%Y-%m-%d}"
+        if recent_count:
+            text += (f"; {ROLLUP_DAYS}-day avg {_number(average)}{unit}, range {_number(low)}-{_number(high)}"
+                     f" over {recent_count} readings")
+            if previous_average:
+                text += f", {100 * (average - previous_average) / abs(previous_average):+.0f}% vs previous {ROLLUP_DAYS} days"
+        text += f" ({count} total)"
+        age_days = (now - latest_at).total_seconds() / 86400 if latest_at else math.inf
+        items.append(Item("statistic", name, text, math.exp(-age_days / ROLLUP_DAYS)))
+    return items
+
+
+def build_summary(db: Session, sector) -> dict:
+    now = datetime.utcnow()
+    goals = db.scalars(select(models.Goal).where(models.Goal.sector_id == sector.id).order_by(models.Goal.id)).all()
+    active = sum(1 for goal in goals if not goal.is_completed)
+    overdue = sum(1 for goal in goals if not goal.is_completed and goal.deadline and goal.deadline < now)
+
+    sector_type = sector.sector_type.value if sector.sector_type else "general"
+    header = f"Sector: {sector.name} ({sector_type})."
+    if sector.description:
+        header += f" {sector.description[:300]}"
+    header += f" Goals: {active} active, {len(goals) - active} completed, {overdue} overdue."
+    return {
+        "header": header,
+        "items": [_goal_item(goal, now) for goal in goals] + _statistic_items(db, sector.id, now),
+    }
+
+
+_summaries = OrderedDict()  # (user_id, sector_id) -> (versions, expires_at, summary)
+_summaries_lock = threading.Lock()
+
+
+async def summary_for(db: Session, user_id: int, sector) -> dict:
+    """The sector's summary, rebuilt when the user's goals or sectors changed since it was cached"""
+    key = (user_id, sector.id)
+    versions = await response_cache.backend.versions(response_cache.tags_for(user_id, ("sectors", "goals")))
+    with _summaries_lock:
+        cached = _summaries.get(key)
+        if cached is not None and cached[0] == versions and cached[1] > time.monotonic():
+            _summaries.move_to_end(key)
+            return cached[2]
+
+    summary = build_summary(db, sector)
+    with _summaries_lock:
+        _summaries[key] = (versions, time.monotonic() + CONTEXT_SUMMARY_TTL_SECONDS, summary)
+        _summaries.move_to_end(key)
+        while len(_summaries) > CONTEXT_SUMMARY_MAX_ENTRIES:
+            _summaries.popitem(last=False)
+    return summary
+
+
+# ==================== SELECTION ====================
+
+def _message_items(db: Session, sector) -> list:
+    rows = db.scalars(
+        select(models.Message)
+        .where(models.Message.sector_id == sector.id, models.Message.created_at >= sector.created_at)
+        .order_by(models.Message.created_at.desc(), models.Message.id.desc())
+        .limit(CONTEXT_MESSAGE_WINDOW)
+    ).all()
+    items = []
+    for age, message in enumerate(rows):
+        prior = 1.0 if age < CONTEXT_RECENT_MESSAGES else math.exp(-(age - CONTEXT_RECENT_MESSAGES) / 10)
+        items.append(Item("message", message, (message.content or "")[:CONTEXT_MESSAGE_MAX_CHARS], prior))
+    return items
+
+
+async def select_context(db: Session, user_id: int, sector, question: str = "",
+                         budget: int = CONTEXT_TOKEN_BUDGET) -> dict:
+    """The sector header plus the highest scoring goals, rollups and messages that fit `budget` tokens"""
+    summary = await summary_for(db, user_id, sector)
+    candidates = summary["items"] + _message_items(db, sector)
+    query = related.vectorize(question)
+
+    used = estimate_tokens(summary["header"])
+    chosen, omitted = [], 0
+    scored = sorted(
+        ((_similarity(query, item.vector) + CONTEXT_PRIOR_WEIGHT * item.prior, index, item)
+         for index, item in enumerate(candidates)),
+        key=lambda entry: (-entry[0], entry[1]),
+    )
+    for _, _, item in scored:
+        if used + item.tokens > budget:
+            omitted += 1
+            continue
+        used += item.tokens
+        chosen.append(item)
+
+    lines = [summary["header"]]
+    goals = [item for item in chosen if item.kind == "goal"]
+    statistics = [item for item in chosen if item.kind == "statistic"]
+    if goals:
+        lines += ["Relevant goals:"] + [item.text for item in goals]
+    if statistics:
+        lines += ["Recent statistics:"] + [item.text for item in statistics]
+    messages = sorted((item.ref for item in chosen if item.kind == "message"),
+                      key=lambda message: (message.created_at, message.id))
+    return {
+        "sector_id": sector.id,
+        "context": "\n".join(lines),
+        "messages": messages,
+        "goal_ids": [item.ref for item in goals],
+        "metrics": [item.ref for item in statistics],
+        "tokens": used,
+        "budget": budget,
+        "omitted": omitted,
+    }
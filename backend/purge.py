@@ -0,0 +1,172 @@
+"""
+Background purge of soft-deleted sectors and conversations.
+
+Deleting a sector or conversation only stamps `deleted_at`, records a
+PurgeTask and enqueues a "purge" job. The purge then removes the children with bulk
+`DELETE ... WHERE id IN (SELECT ... LIMIT n)` batches, committing after
+each batch so no request ever waits on a long cascade or its locks.
+
+Run `python purge.py` to drain pending tasks, `--loop` to keep polling.
+"""
+import os
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, delete, select, update
+from sqlalchemy.orm import Session
+
+import jobs
+import models
+import sharding
+from database import SessionLocal, engine
+
+PURGE_BATCH_SIZE = int(os.getenv("PURGE_BATCH_SIZE", "1000"))
+# A running task not finished after this long belongs to a crashed worker
+PURGE_STALE_SECONDS = int(os.getenv("PURGE_STALE_SECONDS", str(jobs.JOB_LOCK_TIMEOUT_SECONDS)))
+
+# Parent model and the (child model, parent id -> row filter) pairs purged before it,
+# grandchildren first
+PURGE_TARGETS = {
+    "sector": (models.Sector, [
+        (models.Message, lambda sector_id: models.Message.sector_id == sector_id),
+        (models.MessageArchive, lambda sector_id: and_(
+            models.MessageArchive.kind == "sector", models.MessageArchive.parent_id == sector_id)),
+        (models.HabitYear, lambda sector_id: models.HabitYear.goal_id.in_(
+            select(models.Goal.id).where(models.Goal.sector_id == sector_id))),
+        (models.GoalProgress, lambda sector_id: models.GoalProgress.goal_id.in_(
+            select(models.Goal.id).where(models.Goal.sector_id == sector_id))),
+        (models.Goal, lambda sector_id: models.Goal.sector_id == sector_id),
+        (models.Statistic, lambda sector_id: models.Statistic.sector_id == sector_id),
+    ]),
+    "conversation": (models.Conversation, [
+        (models.ConversationMessage, lambda conversation_id: models.ConversationMessage.conversation_id == conversation_id),
+        (models.MessageArchive, lambda conversation_id: and_(
+            models.MessageArchive.kind == "conversation", models.MessageArchive.parent_id == conversation_id)),
+    ]),
+}
+
+
+def schedule(db: Session, user_id: int, entity_type: str, entity_id: int) -> models.PurgeTask:
+    """Record a purge for a soft-deleted entity, committed with the caller's transaction"""
+    task = models.PurgeTask(user_id=user_id, entity_type=entity_type, entity_id=entity_id)
+    db.add(task)
+    return task
+
+
+def _delete_batch(db: Session, model, belongs_to, parent_id: int, batch_size: int) -> int:
+    ids = select(model.id).where(belongs_to(parent_id)).limit(batch_size).scalar_subquery()
+    result = db.execute(
+        delete(model).where(model.id.in_(ids)),
+        execution_options={"synchronize_session": False},
+    )
+    return result.rowcount
+
+
+def run_task(db: Session, task: models.PurgeTask, batch_size: int = PURGE_BATCH_SIZE):
+    """Purge one entity's children batch by batch, then the entity itself"""
+    parent, children = PURGE_TARGETS[task.entity_type]
+
+    for model, belongs_to in children:
+        while True:
+            deleted = _delete_batch(db, model, belongs_to, task.entity_id, batch_size)
+            task.rows_purged += deleted
+            db.commit()
+            if deleted < batch_size:
+                break
+            print(f"🧹 Purging {task.entity_type} {task.entity_id}: {task.rows_purged} rows so far")
+
+    db.execute(
+        delete(parent).where(parent.id == task.entity_id, parent.deleted_at.isnot(None)),
+        execution_options={"synchronize_session": False},
+    )
+    task.rows_purged += 1
+    task.status = "done"
+    task.completed_at = datetime.utcnow()
+    db.commit()
+
+    print(f"✅ Purged {task.entity_type} {task.entity_id} ({task.rows_purged} rows)")
+
+
+@jobs.handler("purge", concurrency=1)
+def purge_job(db: Session, payload: dict):
+    return {"processed": run_pending(session_factory=sharding.session_factory_of(db))}
+
+
+def _claim(db: Session, task_id: int) -> bool:
+    """Move a task from pending to running; False if another worker got it first"""
+    result = db.execute(
+        update(models.PurgeTask)
+        .where(models.PurgeTask.id == task_id, models.PurgeTask.status == "pending")
+        .values(status="running", started_at=datetime.utcnow())
+    )
+    db.commit()
+    return result.rowcount == 1
+
+
+def requeue_stale(db: Session) -> int:
+    """Give tasks from crashed workers back to pending; their committed batches stay purged"""
+    cutoff = datetime.utcnow() - timedelta(seconds=PURGE_STALE_SECONDS)
+    result = db.execute(
+        update(models.PurgeTask)
+        .where(models.PurgeTask.status == "running", models.PurgeTask.started_at < cutoff)
+        .values(status="pending"),
+        execution_options={"synchronize_session": False},
+    )
+    db.commit()
+    return result.rowcount
+
+
+def run_pending(limit: int = 100, session_factory=SessionLocal) -> int:
+    """Run pending purge tasks in a fresh session. Returns how many were processed.
+
+    Tasks left running by a crashed worker are picked up again first. A task
+    that fails goes back to pending and the error is re-raised, so the
+    "purge" job that called us is retried with the queue's backoff.
+    """
+    db = session_factory()
+    processed = 0
+    try:
+        requeued = requeue_stale(db)
+        if requeued:
+            print(f"♻️ Requeued {requeued} stale purge tasks")
+        task_ids = db.scalars(
+            select(models.PurgeTask.id)
+            .where(models.PurgeTask.status == "pending")
+            .order_by(models.PurgeTask.id)
+            .limit(limit)
+        ).all()
+
+        for task_id in task_ids:
+            if not _claim(db, task_id):
+                continue
+
+            task = db.get(models.PurgeTask, task_id)
+            try:
+                run_task(db, task)
+            except Exception as e:
+                # Hand the task back and fail the job, which retries it with backoff;
+                # the batches already committed are not purged again
+                db.rollback()
+                task.status = "pending"
+                task.last_error = str(e)
+                db.commit()
+                print(f"❌ Purge of {task.entity_type} {task.entity_id} failed: {e}")
+                raise
+            processed += 1
+    finally:
+        db.close()
+
+    return processed
+
+
+if __name__ == "__main__":
+    import sys
+
+    models.Base.metadata.create_all(bind=engine)
+
+    if "--loop" in sys.argv:
+        while True:
+            if not run_pending():
+                time.sleep(5)
+    else:
+        print(f"🧹 Processed {run_pending(limit=10_000)} purge tasks")
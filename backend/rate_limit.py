@@ -0,0 +1,359 @@
+"""
+Per-user rate limiting and in-flight request caps.
+
+Every /api request is charged against a token bucket keyed by the caller
+(user from the JWT, otherwise client IP) and the route budget it matches.
+A second counter caps how many requests one caller may have in flight at
+once, so a runaway polling loop cannot hold every DB connection. Long-lived
+streams (LONG_LIVED_PREFIXES) are exempt from that cap.
+
+The in-memory backend is enough for a single worker. With several workers
+set RATE_LIMIT_BACKEND=redis so all of them share the same buckets.
+
+Run `python rate_limit.py` to benchmark the per-request overhead.
+"""
+import json
+import math
+import os
+import threading
+import time
+import uuid
+from typing import Optional
+from urllib.parse import parse_qs
+
+from jose import JWTError, jwt
+
+from auth import ALGORITHM, SECRET_KEY
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+RATE_LIMIT_MAX_IN_FLIGHT = int(os.getenv("RATE_LIMIT_MAX_IN_FLIGHT", "8"))
+RATE_LIMIT_TRUST_FORWARDED = os.getenv("RATE_LIMIT_TRUST_FORWARDED", "false").lower() == "true"
+# An in-flight slot not released within this long (crashed worker) stops counting
+RATE_LIMIT_SLOT_TTL_SECONDS = int(os.getenv("RATE_LIMIT_SLOT_TTL_SECONDS", "300"))
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+# Streams that stay open for minutes; charged to their budget on connect but
+# exempt from the in-flight cap, or a few open tabs would lock a user out
+LONG_LIVED_PREFIXES = ("/api/events",)
+
+
+class RouteBudget:
+    def __init__(self, name: str, method: str, prefix: str, rate: float, burst: int):
+        self.name = name
+        self.method = method
+        self.prefix = prefix
+        self.rate = rate      # tokens refilled per second
+        self.burst = burst    # bucket capacity
+
+
+# First match wins, so keep the specific prefixes on top
+ROUTE_BUDGETS = [
+    RouteBudget("auth", "POST", "/api/auth/", rate=0.2, burst=5),
+    # The batch itself; its items are charged to their own budgets (see charge)
+    RouteBudget("batch", "POST", "/api/batch", rate=2.0, burst=20),
+    RouteBudget("write", "POST", "/api/", rate=2.0, burst=20),
+    RouteBudget("write", "PUT", "/api/", rate=2.0, burst=20),
+    RouteBudget("delete", "DELETE", "/api/", rate=1.0, burst=10),
+    RouteBudget("read", "*", "/api/", rate=10.0, burst=60),
+]
+
+
+def match_budget(method: str, path: str) -> Optional[RouteBudget]:
+    """Find the budget for a request, None means the route is not limited"""
+    if method == "OPTIONS":
+        return None
+    for budget in ROUTE_BUDGETS:
+        if budget.method in ("*", method) and path.startswith(budget.prefix):
+            return budget
+    return None
+
+
+# ==================== BACKENDS ====================
+
+class MemoryBackend:
+    """Buckets and in-flight counters in this process only"""
+
+    def __init__(self, max_keys: int = 100_000):
+        self.max_keys = max_keys
+        self._buckets = {}
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    async def take(self, key: str, rate: float, burst: int, cost: int = 1) -> float:
+        """Take tokens from a bucket. Returns 0 when allowed, else seconds to wait"""
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                if len(self._buckets) >= self.max_keys:
+                    self._evict_full(now)
+                tokens = burst
+            else:
+                tokens = min(burst, bucket[0] + (now - bucket[1]) * rate)
+
+            if tokens >= cost:
+                self._buckets[key] = (tokens - cost, now, rate, burst)
+                return 0.0
+
+            self._buckets[key] = (tokens, now, rate, burst)
+            return (cost - tokens) / rate
+
+    async def acquire_slot(self, key: str, limit: int) -> Optional[str]:
+        """Claim one of `limit` in-flight slots. Returns the slot to release, None when all are taken"""
+        with self._lock:
+            count = self._in_flight.get(key, 0)
+            if count >= limit:
+                return None
+            self._in_flight[key] = count + 1
+            return key
+
+    async def release_slot(self, key: str, slot: str):
+        with self._lock:
+            count = self._in_flight.get(key, 0) - 1
+            if count > 0:
+                self._in_flight[key] = count
+            else:
+                self._in_flight.pop(key, None)
+
+    def _evict_full(self, now: float):
+        # A bucket that has refilled completely is the same as a missing one
+        self._buckets = {
+            key: bucket for key, bucket in self._buckets.items()
+            if bucket[0] + (now - bucket[1]) * bucket[2] < bucket[3]
+        }
+
+
+# Refill and take in one round trip, using the server clock so every
+# worker sees the same time
+_TAKE_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1])
+if tokens == nil then
+  tokens = burst
+else
+  tokens = math.min(burst, tokens + (now - tonumber(bucket[2])) * rate)
+end
+local wait = 0
+if tokens >= cost then
+  tokens = tokens - cost
+else
+  wait = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return tostring(wait)
+"""
+
+# In-flight requests as members of a sorted set scored by when they expire:
+# a crashed worker's members age out, and a slow request can never make the
+# count go negative
+_ACQUIRE_SCRIPT = """
+local limit = tonumber(ARGV[1])
+local ttl = tonumber(ARGV[2])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now)
+if redis.call('ZCARD', KEYS[1]) >= limit then
+  return 0
+end
+redis.call('ZADD', KEYS[1], now + ttl, ARGV[3])
+redis.call('EXPIRE', KEYS[1], ttl)
+return 1
+"""
+
+
+class RedisBackend:
+    """Buckets shared by every worker through Redis"""
+
+    def __init__(self, url: str = REDIS_URL, prefix: str = "rl:"):
+        import redis.asyncio  # optional dependency, only needed for multi-worker deployments
+
+        self.prefix = prefix
+        self._client = redis.asyncio.Redis.from_url(url)
+        self._take = self._client.register_script(_TAKE_SCRIPT)
+        self._acquire = self._client.register_script(_ACQUIRE_SCRIPT)
+
+    async def take(self, key: str, rate: float, burst: int, cost: int = 1) -> float:
+        return float(await self._take(keys=[self.prefix + key], args=[rate, burst, cost]))
+
+    async def acquire_slot(self, key: str, limit: int) -> Optional[str]:
+        slot = uuid.uuid4().hex
+        acquired = await self._acquire(keys=[self.prefix + key], args=[limit, RATE_LIMIT_SLOT_TTL_SECONDS, slot])
+        return slot if acquired else None
+
+    async def release_slot(self, key: str, slot: str):
+        await self._client.zrem(self.prefix + key, slot)
+
+
+def create_backend():
+    if RATE_LIMIT_BACKEND == "redis":
+        return RedisBackend()
+    return MemoryBackend()
+
+
+_backend = None
+
+
+def get_backend():
+    """The process-wide backend shared by the middleware and batch charging"""
+    global _backend
+    if _backend is None:
+        _backend = create_backend()
+    return _backend
+
+
+async def charge(identity: str, requests: list) -> float:
+    """Charge (method, path) pairs that bypass the middleware, one take per budget.
+    Returns 0 when allowed, else seconds to wait"""
+    if not RATE_LIMIT_ENABLED:
+        return 0.0
+    costs = {}
+    for method, path in requests:
+        budget = match_budget(method, path)
+        if budget is not None:
+            costs[budget.name] = (budget, costs.get(budget.name, (budget, 0))[1] + 1)
+
+    backend = get_backend()
+    retry_after = 0.0
+    for budget, cost in costs.values():
+        retry_after = max(retry_after, await backend.take(f"{identity}:{budget.name}", budget.rate, budget.burst, cost))
+    return retry_after
+
+
+# ==================== MIDDLEWARE ====================
+
+class RateLimitMiddleware:
+    """ASGI middleware enforcing route budgets and the in-flight cap"""
+
+    def __init__(self, app, backend=None, max_in_flight: int = RATE_LIMIT_MAX_IN_FLIGHT):
+        self.app = app
+        self.backend = backend or get_backend()
+        self.max_in_flight = max_in_flight
+        self._token_cache = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not RATE_LIMIT_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        budget = match_budget(scope["method"], scope["path"])
+        if budget is None:
+            await self.app(scope, receive, send)
+            return
+
+        identity = self.identify(scope)
+        retry_after = await self.backend.take(f"{identity}:{budget.name}", budget.rate, budget.burst)
+        if retry_after:
+            await _reject(send, retry_after, "Rate limit exceeded")
+            return
+
+        if scope["path"].startswith(LONG_LIVED_PREFIXES):
+            await self.app(scope, receive, send)
+            return
+
+        key = f"{identity}:in-flight"
+        slot = await self.backend.acquire_slot(key, self.max_in_flight)
+        if slot is None:
+            await _reject(send, 1, "Too many concurrent requests")
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            await self.backend.release_slot(key, slot)
+
+    def identify(self, scope) -> str:
+        """Key requests by user when the token is valid, else by client IP"""
+        headers = dict(scope["headers"])
+        authorization = headers.get(b"authorization", b"").decode("latin-1")
+        token = authorization[7:] if authorization.lower().startswith("bearer ") else None
+        if token is None and b"token=" in scope.get("query_string", b""):
+            # EventSource cannot send headers, so /api/events takes ?token=
+            token = parse_qs(scope["query_string"].decode("latin-1")).get("token", [None])[0]
+        if token:
+            email = self._token_subject(token)
+            if email:
+                return f"user:{email}"
+
+        if RATE_LIMIT_TRUST_FORWARDED and b"x-forwarded-for" in headers:
+            return "ip:" + headers[b"x-forwarded-for"].decode("latin-1").split(",")[0].strip()
+        client = scope.get("client")
+        return f"ip:{client[0] if client else 'unknown'}"
+
+    def _token_subject(self, token: str) -> Optional[str]:
+        # Signature checks are the expensive part, so remember decoded tokens
+        cached = self._token_cache.get(token)
+        if cached and cached[1] > time.time():
+            return cached[0]
+
+        try:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        except JWTError:
+            return None
+
+        if len(self._token_cache) >= 10_000:
+            self._token_cache.clear()
+        self._token_cache[token] = (payload.get("sub"), payload.get("exp", 0))
+        return payload.get("sub")
+
+
+async def _reject(send, retry_after: float, detail: str):
+    body = json.dumps({"detail": detail}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": 429,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+if __name__ == "__main__":
+    import asyncio
+
+    import auth
+
+    async def ok_app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def noop_send(message):
+        pass
+
+    async def bench(app, scopes):
+        start = time.perf_counter()
+        for scope in scopes:
+            await app(scope, None, noop_send)
+        return (time.perf_counter() - start) / len(scopes) * 1e6
+
+    n = 100_000
+    token = auth.create_access_token(data={"sub": "bench@example.com"})
+    scopes = [
+        {
+            "type": "http",
+            "method": "GET",
+            "path": "/api/sectors",
+            "client": (f"10.0.{i % 256}.{i % 97}", 1234),
+            "headers": [(b"authorization", f"Bearer {token}".encode())] if i % 2 else [],
+        }
+        for i in range(n)
+    ]
+
+    # Huge budgets so every request takes the full allowed path
+    for budget in ROUTE_BUDGETS:
+        budget.rate, budget.burst = 1e9, 10**9
+
+    baseline = asyncio.run(bench(ok_app, scopes))
+    limited = asyncio.run(bench(RateLimitMiddleware(ok_app, MemoryBackend()), scopes))
+    print(f"⏱️ bare app:     {baseline:.2f} µs/request")
+    print(f"⏱️ rate limited: {limited:.2f} µs/request")
+    print(f"⏱️ overhead:     {limited - baseline:.2f} µs/request")
@@ -0,0 +1,296 @@
+"""
+Shared cache of serialized GET responses.
+
+Cached routes store the final JSON bytes (plus headers such as ETag) per
+user, path and query string, so a hit skips the queries and Pydantic
+serialization entirely and only the auth lookup remains.
+
+Invalidation is by tag generation: every entry's key includes the current
+version of the tags it depends on (`u<id>` and `u<id>:<resource>`).
+`changelog.record` stages the tags a mutation touches and they are bumped
+when its transaction commits, which makes every older entry unreachable;
+the LRU then ages them out. Tag versions are read before the queries run,
+so a response built from pre-commit data can never be stored under a
+post-commit version.
+
+`cached_stream` does the same for lists that can grow large: a miss is
+streamed (see streaming.py) and only kept if it stays under
+RESPONSE_CACHE_MAX_STREAM_BYTES.
+
+The in-memory backend is a bounded LRU per worker; with several workers set
+RESPONSE_CACHE_BACKEND=redis so entries and tag versions are shared.
+Lookups and stores are awaited so Redis round trips do not block the event
+loop. Bumps are not: they run in the synchronous after_commit hook, next to
+the commit they follow.
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import AsyncIterator, Callable, Iterable, Iterator, Optional, get_args
+
+from fastapi import Request, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+import streaming
+
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+RESPONSE_CACHE_BACKEND = os.getenv("RESPONSE_CACHE_BACKEND", "memory")
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "10000"))
+# Upper bound on staleness for writes that bypass the change log (scripts, manual SQL)
+RESPONSE_CACHE_TTL_SECONDS = int(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "300"))
+# Streamed lists bigger than this are not kept, so holding them never costs more memory
+RESPONSE_CACHE_MAX_STREAM_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_STREAM_BYTES", str(256 * 1024)))
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+# Change-log entity type -> cached resources it can change
+ENTITY_RESOURCES = {
+    "sector": ("sectors", "goals"),  # deleting a sector hides its goals
+    "goal": ("goals",),
+    "saved_news": ("saved_news",),
+    "conversation": ("conversations",),
+    "conversation_message": ("conversations",),  # message counts
+}
+
+
+class MemoryBackend:
+    """Bounded LRU for a single worker"""
+
+    def __init__(self, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    async def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    async def set(self, key: str, value: bytes, ttl: int):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    async def versions(self, tags: list) -> list:
+        with self._lock:
+            return [self._versions.get(tag, 0) for tag in tags]
+
+    def bump(self, tags: list):
+        with self._lock:
+            for tag in tags:
+                self._versions[tag] = self._versions.get(tag, 0) + 1
+
+    def size(self) -> int:
+        return len(self._entries)
+
+
+class RedisBackend:
+    """Entries and tag versions shared by every worker through Redis"""
+
+    def __init__(self, url: str = REDIS_URL, prefix: str = "rc:"):
+        import redis  # optional dependency, only needed for multi-worker deployments
+        import redis.asyncio
+
+        self.prefix = prefix
+        self._client = redis.asyncio.Redis.from_url(url)
+        self._sync_client = redis.Redis.from_url(url)  # for bump(), called from after_commit
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self._client.get(self.prefix + key)
+
+    async def set(self, key: str, value: bytes, ttl: int):
+        await self._client.set(self.prefix + key, value, ex=ttl)
+
+    async def versions(self, tags: list) -> list:
+        values = await self._client.mget([f"{self.prefix}tag:{tag}" for tag in tags])
+        return [int(value or 0) for value in values]
+
+    def bump(self, tags: list):
+        pipe = self._sync_client.pipeline(transaction=False)
+        for tag in tags:
+            pipe.incr(f"{self.prefix}tag:{tag}")
+        pipe.execute()
+
+    def size(self) -> Optional[int]:
+        return None  # shared with other data, not cheap to count
+
+
+def create_backend():
+    if RESPONSE_CACHE_BACKEND == "redis":
+        return RedisBackend()
+    return MemoryBackend()
+
+
+backend = create_backend()
+
+
+# ==================== STATS ====================
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def _count(route: str, outcome: str):
+    with _stats_lock:
+        counters = _stats.setdefault(route, {"hits": 0, "misses": 0})
+        counters[outcome] += 1
+
+
+def stats() -> dict:
+    """Hit/miss counters per route template for this worker"""
+    with _stats_lock:
+        routes = {route: dict(counters) for route, counters in _stats.items()}
+    hits = misses = 0
+    for counters in routes.values():
+        total = counters["hits"] + counters["misses"]
+        counters["hit_ratio"] = round(counters["hits"] / total, 4) if total else None
+        hits += counters["hits"]
+        misses += counters["misses"]
+    return {
+        "enabled": RESPONSE_CACHE_ENABLED,
+        "backend": RESPONSE_CACHE_BACKEND,
+        "entries": backend.size(),
+        "hits": hits,
+        "misses": misses,
+        "hit_ratio": round(hits / (hits + misses), 4) if hits + misses else None,
+        "routes": routes,
+    }
+
+
+# ==================== CACHED RESPONSES ====================
+
+def tags_for(user_id: int, resources) -> list:
+    return [f"u{user_id}"] + [f"u{user_id}:{resource}" for resource in resources]
+
+
+def _pack(headers: dict, body: bytes) -> bytes:
+    return json.dumps(headers).encode() + b"\n" + body
+
+
+async def _key(request: Request, user_id: int, resources: tuple) -> str:
+    versions = await backend.versions(tags_for(user_id, resources))
+    return (f"{request.url.path}?{'&'.join(sorted(request.url.query.split('&')))}"
+            f"|{user_id}|{'.'.join(map(str, versions))}")
+
+
+def _unpack(value: bytes) -> tuple:
+    headers, body = value.split(b"\n", 1)
+    return json.loads(headers), body
+
+
+async def cached_response(request: Request, user_id: int, resources: tuple, response_type,
+                          build: Callable, headers: Optional[Callable] = None) -> Response:
+    """Serve the cached bytes for this request, or build, serialize and store them.
+
+    `build()` returns ORM objects matching `response_type`; it may raise
+    HTTPException, which is not cached. `headers(result)` adds response headers.
+    """
+    route = getattr(request.scope.get("route"), "path", request.url.path)
+    if RESPONSE_CACHE_ENABLED:
+        key = await _key(request, user_id, resources)
+        value = await backend.get(key)
+        if value is not None:
+            _count(route, "hits")
+            cached_headers, body = _unpack(value)
+            return Response(content=body, media_type="application/json",
+                            headers={**cached_headers, "X-Cache": "HIT"})
+
+    result = build()
+    adapter = streaming.adapter_for(response_type)
+    body = adapter.dump_json(adapter.validate_python(result, from_attributes=True))
+    extra_headers = headers(result) if headers else {}
+
+    if RESPONSE_CACHE_ENABLED:
+        _count(route, "misses")
+        await backend.set(key, _pack(extra_headers, body), RESPONSE_CACHE_TTL_SECONDS)
+    return Response(content=body, media_type="application/json",
+                    headers={**extra_headers, "X-Cache": "MISS"})
+
+
+def _tee(chunks: Iterator[bytes], kept: dict) -> Iterator[bytes]:
+    """Pass the chunks through, collecting them in `kept` until they outgrow the limit"""
+    size = 0
+    for chunk in chunks:
+        if kept["chunks"] is not None:
+            size += len(chunk)
+            if size <= RESPONSE_CACHE_MAX_STREAM_BYTES:
+                kept["chunks"].append(chunk)
+            else:
+                kept["chunks"] = None
+        yield chunk
+    kept["complete"] = True
+
+
+async def _store_kept(key: str, kept: dict):
+    if kept["complete"] and kept["chunks"] is not None:
+        await backend.set(key, _pack({}, b"".join(kept["chunks"])), RESPONSE_CACHE_TTL_SECONDS)
+
+
+async def _store_after(body: AsyncIterator[bytes], key: str, kept: dict) -> AsyncIterator[bytes]:
+    async for chunk in body:
+        yield chunk
+    await _store_kept(key, kept)
+
+
+async def cached_stream(request: Request, user_id: int, resources: tuple, response_type,
+                        rows: Callable[[], Iterable]) -> Response:
+    """`cached_response` for lists that can be large: a miss streams `rows()` (see streaming.py)
+    and keeps the bytes only when they fit RESPONSE_CACHE_MAX_STREAM_BYTES"""
+    route = getattr(request.scope.get("route"), "path", request.url.path)
+    if RESPONSE_CACHE_ENABLED:
+        key = await _key(request, user_id, resources)
+        value = await backend.get(key)
+        if value is not None:
+            _count(route, "hits")
+            cached_headers, body = _unpack(value)
+            return Response(content=body, media_type="application/json",
+                            headers={**cached_headers, "X-Cache": "HIT"})
+        _count(route, "misses")
+
+    chunks = streaming.encode_rows(rows(), get_args(response_type)[0])
+    if not RESPONSE_CACHE_ENABLED:
+        return streaming.json_response(chunks, headers={"X-Cache": "MISS"})
+
+    kept = {"chunks": [], "complete": False}
+    response = streaming.json_response(_tee(chunks, kept), headers={"X-Cache": "MISS"})
+    if isinstance(response, StreamingResponse):
+        response.body_iterator = _store_after(response.body_iterator, key, kept)
+    else:
+        await _store_kept(key, kept)  # read in full while deciding not to stream
+    return response
+
+
+# ==================== INVALIDATION ====================
+
+def stage_invalidation(db: Session, user_id: int, entity_type: Optional[str] = None):
+    """Bump the user's tags for an entity type (all of them if None) once the transaction commits"""
+    resources = ENTITY_RESOURCES.get(entity_type, ()) if entity_type else None
+    staged = db.info.setdefault("response_cache", set())
+    if resources is None:
+        staged.add(f"u{user_id}")
+    else:
+        staged.update(f"u{user_id}:{resource}" for resource in resources)
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_invalidation(session):
+    staged = session.info.pop("response_cache", None)
+    if staged:
+        backend.bump(sorted(staged))
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_invalidation(session):
+    session.info.pop("response_cache", None)
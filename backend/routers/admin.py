@@ -0,0 +1,62 @@
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException
+from sqlalchemy.orm import Session
+import models
+import schemas
+import auth
+import cohorts
+import jobs
+import snapshot
+from database import get_db
+
+router = APIRouter()
+
+
+@router.get("/cohorts/{report}", response_model=schemas.CohortReportResponse)
+def get_cohort_report(
+    report: str,
+    cohort: str = "all",
+    days: int = 30,
+    admin: models.User = Depends(auth.get_admin_user)
+):
+    """A cohort report (sector-types, goal-completion, message-volume) from the latest snapshot"""
+    if report not in cohorts.REPORTS:
+        raise HTTPException(status_code=404, detail="Report not found")
+    snap = snapshot.load()
+    if snap is None:
+        raise HTTPException(status_code=409, detail="No snapshot yet, start an export first")
+
+    try:
+        rows = cohorts.run(snap, report, cohort, days)
+    except cohorts.ReportError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return {
+        "report": report,
+        "cohort": cohort,
+        "generation": snap.generation,
+        "exported_at": snap.exported_at,
+        "rows": rows
+    }
+
+
+@router.get("/snapshot")
+def get_snapshot_status(admin: models.User = Depends(auth.get_admin_user)):
+    """Generation, export time and row counts of the analytics snapshot"""
+    return snapshot.status()
+
+
+@router.post("/snapshot", response_model=schemas.JobResponse, status_code=202)
+async def start_snapshot_export(
+    background_tasks: BackgroundTasks,
+    full: bool = False,
+    admin: models.User = Depends(auth.get_admin_user),
+    db: Session = Depends(get_db)
+):
+    """Export the changes since the last snapshot (or everything with ?full=true) in the background"""
+    job = jobs.enqueue(db, "snapshot_export", {"full": full}, user_id=admin.id, max_attempts=1)
+    db.commit()
+    db.refresh(job)
+    
+    jobs.kick(background_tasks)
+    
+    return job
@@ -0,0 +1,23 @@
+from fastapi import APIRouter, Depends, Request
+from sqlalchemy.orm import Session
+import models
+import schemas
+import auth
+import analytics
+import response_cache
+from database import get_db
+
+router = APIRouter()
+
+
+@router.get("", response_model=schemas.AnalyticsResponse)
+async def get_analytics(
+    request: Request,
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Completion rates, velocity, deadline forecasts and weekly trends for the current user"""
+    return await response_cache.cached_response(
+        request, current_user.id, ("sectors", "goals"), schemas.AnalyticsResponse,
+        lambda: analytics.compute(db, current_user.id)
+    )
@@ -0,0 +1,21 @@
+from fastapi import APIRouter, Depends, Request
+from sqlalchemy.orm import Session
+import models
+import schemas
+import auth
+import batch
+from database import get_db
+
+router = APIRouter()
+
+
+@router.post("/batch", response_model=schemas.BatchResponse)
+async def run_batch(
+    payload: schemas.BatchRequest,
+    request: Request,
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Run several API requests in one round trip with one auth check and DB session"""
+    responses = await batch.run(request, current_user, db, payload.requests)
+    return {"responses": responses}
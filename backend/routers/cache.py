@@ -0,0 +1,12 @@
+from fastapi import APIRouter, Depends
+import models
+import auth
+import response_cache
+
+router = APIRouter()
+
+
+@router.get("/stats")
+async def get_cache_stats(admin: models.User = Depends(auth.get_admin_user)):
+    """Response cache hit ratios for this worker"""
+    return response_cache.stats()
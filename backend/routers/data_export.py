@@ -0,0 +1,54 @@
+import zlib
+from datetime import datetime
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+import models
+import auth
+import data_export
+from database import get_db
+
+router = APIRouter()
+
+
+@router.get("/export")
+async def export_data(
+    gzip: bool = False,
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Stream all of the current user's data as NDJSON"""
+    lines = data_export.export_lines(db, current_user.id)
+    filename = f"human-export-{datetime.utcnow():%Y%m%d}.ndjson"
+    
+    if gzip:
+        return StreamingResponse(
+            data_export.gzip_stream(lines),
+            media_type="application/gzip",
+            headers={"Content-Disposition": f'attachment; filename="{filename}.gz"'}
+        )
+    
+    return StreamingResponse(
+        lines,
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+
+@router.post("/import")
+async def import_data(
+    request: Request,
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Import an NDJSON export (plain or gzip) into the current user's account"""
+    try:
+        result = await data_export.import_stream(db, current_user.id, request.stream())
+    except (ValueError, KeyError, TypeError, zlib.error) as e:
+        # ValueError covers bad JSON and undecodable UTF-8, zlib.error a corrupt gzip body
+        db.rollback()
+        raise HTTPException(status_code=400, detail=f"Invalid import file: {e}")
+    
+    print(f"✅ Imported data for user {current_user.id}: {result['imported']}")
+    
+    return result
@@ -0,0 +1,34 @@
+from typing import Optional
+from fastapi import APIRouter, Request
+from fastapi.responses import StreamingResponse
+import auth
+import events
+import sharding
+from database import SessionLocal
+
+router = APIRouter()
+
+
+@router.get("")
+async def stream_events(request: Request, token: Optional[str] = None):
+    """Server-Sent Events for the current user.
+    
+    EventSource cannot send headers, so the token may also be passed as `?token=`.
+    """
+    authorization = request.headers.get("authorization", "")
+    if authorization.lower().startswith("bearer "):
+        token = authorization[7:]
+    
+    # Resolve the user up front; the stream must not hold a DB connection open
+    db = SessionLocal()
+    try:
+        sharding.route_token(db, token)
+        user_id = auth.user_from_token(db, token).id
+    finally:
+        db.close()
+    
+    return StreamingResponse(
+        events.stream(request, user_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
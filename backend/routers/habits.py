@@ -0,0 +1,87 @@
+from datetime import date, datetime
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+import models
+import schemas
+import auth
+import changelog
+import habits
+import mutations
+from database import get_db
+
+router = APIRouter()
+
+
+def _get_owned_goal(db: Session, goal_id: int, user_id: int) -> models.Goal:
+    goal = db.query(models.Goal).filter(
+        models.Goal.id == goal_id,
+        models.Goal.sector_id.in_(mutations.owned_sector_ids(user_id))
+    ).first()
+    
+    if not goal:
+        raise HTTPException(status_code=404, detail="Goal not found")
+    
+    return goal
+
+
+def _get_owned_habit(db: Session, goal_id: int, user_id: int) -> models.Goal:
+    goal = _get_owned_goal(db, goal_id, user_id)
+    
+    # Check-ins count as progress, so they would corrupt a regular goal's current_value
+    if not goal.is_habit:
+        raise HTTPException(status_code=409, detail="Goal is not a habit")
+    
+    return goal
+
+
+@router.post("/{goal_id}/checkins", response_model=schemas.HabitStatsResponse)
+async def check_in(
+    goal_id: int,
+    checkin: schemas.HabitCheckinCreate,
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Check in a habit for a day (today by default)"""
+    goal = _get_owned_habit(db, goal_id, current_user.id)
+    today = datetime.utcnow().date()
+    day = checkin.day or today
+    
+    if day > today:
+        raise HTTPException(status_code=400, detail="Cannot check in a future day")
+    
+    if habits.set_checkin(db, goal_id, day, done=True):
+        changelog.record(db, current_user.id, "goal", goal_id)
+    db.commit()
+    
+    return habits.stats(db, goal)
+
+
+@router.delete("/{goal_id}/checkins/{day}", response_model=schemas.HabitStatsResponse)
+async def undo_check_in(
+    goal_id: int,
+    day: date,
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Remove a habit check-in"""
+    goal = _get_owned_habit(db, goal_id, current_user.id)
+    
+    if habits.set_checkin(db, goal_id, day, done=False):
+        changelog.record(db, current_user.id, "goal", goal_id)
+    db.commit()
+    
+    return habits.stats(db, goal)
+
+
+@router.get("/{goal_id}/habit", response_model=schemas.HabitHeatmapResponse)
+async def get_habit_heatmap(
+    goal_id: int,
+    year: Optional[int] = Query(None, ge=1970, le=9999),
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Get a year of check-ins as a bitmap plus streak stats"""
+    goal = _get_owned_goal(db, goal_id, current_user.id)
+    
+    return habits.heatmap(db, goal, year or datetime.utcnow().year)
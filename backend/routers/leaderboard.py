@@ -0,0 +1,59 @@
+from typing import List
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.orm import Session
+import models
+import schemas
+import auth
+import leaderboard
+from database import get_db
+from leaderboard import board
+
+router = APIRouter()
+
+
+def _with_names(db: Session, entries: list) -> List[schemas.LeaderboardEntry]:
+    """Attach display names for the listed users, one query per shard"""
+    names = leaderboard.display_names(db, [user_id for _, user_id, _ in entries])
+    return [
+        schemas.LeaderboardEntry(rank=rank, user_id=user_id, full_name=names.get(user_id), total_points=score)
+        for rank, user_id, score in entries
+    ]
+
+
+@router.get("", response_model=List[schemas.LeaderboardEntry])
+async def get_leaderboard(
+    limit: int = Query(10, ge=1, le=100),
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Get the top users by points"""
+    board.refresh(db)
+    return _with_names(db, board.top(limit))
+
+
+@router.get("/me", response_model=schemas.LeaderboardRankResponse)
+async def get_my_rank(
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Get the current user's rank"""
+    board.refresh(db)
+    board.update(current_user.id, current_user.total_points)
+    
+    return {
+        "rank": board.rank(current_user.id),
+        "total_users": board.total,
+        "total_points": current_user.total_points
+    }
+
+
+@router.get("/around-me", response_model=List[schemas.LeaderboardEntry])
+async def get_leaderboard_around_me(
+    radius: int = Query(5, ge=1, le=50),
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Get the users ranked just above and below the current user"""
+    board.refresh(db)
+    board.update(current_user.id, current_user.total_points)
+    return _with_names(db, board.around(current_user.id, radius))
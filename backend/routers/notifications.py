@@ -0,0 +1,53 @@
+from typing import Optional
+from fastapi import APIRouter, Depends, Query, Request, Response
+from sqlalchemy.orm import Session
+import models
+import schemas
+import auth
+import notifications
+from database import get_db
+
+router = APIRouter()
+
+
+@router.get("", response_model=schemas.NotificationPage)
+async def list_notifications(
+    before: Optional[int] = None,
+    limit: int = Query(notifications.NOTIFICATIONS_PAGE_SIZE, ge=1, le=notifications.NOTIFICATIONS_MAX_PAGE_SIZE),
+    unread_only: bool = False,
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Newest notifications first; pass `next_before` back as `before` for the next page"""
+    items = notifications.page(db, current_user.id, before, limit, unread_only)
+    return {
+        "items": items,
+        "next_before": items[-1].id if len(items) == limit else None,
+        "unread": current_user.unread_notifications,
+    }
+
+
+@router.api_route("/unread-count", methods=["GET", "HEAD"], response_model=schemas.UnreadCountResponse)
+async def get_unread_count(
+    request: Request,
+    current_user: models.User = Depends(auth.get_current_user)
+):
+    """Unread count from the user's counter; HEAD returns it in X-Unread-Count only"""
+    unread = current_user.unread_notifications
+    headers = {"X-Unread-Count": str(unread)}
+    if request.method == "HEAD":
+        return Response(headers=headers)
+    return Response(content=schemas.UnreadCountResponse(unread=unread).model_dump_json(),
+                    media_type="application/json", headers=headers)
+
+
+@router.post("/read", response_model=schemas.NotificationReadResponse)
+async def mark_notifications_read(
+    body: schemas.NotificationReadRequest,
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Mark `ids`, everything up to `up_to`, or (with neither) all notifications as read"""
+    marked, unread = notifications.mark_read(db, current_user.id, body.ids, body.up_to)
+    db.commit()
+    return {"marked": marked, "unread": unread}
@@ -0,0 +1,30 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+import models
+import schemas
+import auth
+import prompt_context
+from database import get_db
+
+router = APIRouter()
+
+
+@router.get("/{sector_id}/context", response_model=schemas.SectorContextResponse)
+async def get_sector_context(
+    sector_id: int,
+    q: str = Query("", max_length=4000),
+    budget: int = Query(prompt_context.CONTEXT_TOKEN_BUDGET, ge=100, le=prompt_context.CONTEXT_MAX_TOKEN_BUDGET),
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    """The goals, statistic rollups and prior messages most relevant to `q` that fit `budget` tokens"""
+    sector = db.query(models.Sector).filter(
+        models.Sector.id == sector_id,
+        models.Sector.user_id == current_user.id,
+        models.Sector.deleted_at.is_(None)
+    ).first()
+
+    if not sector:
+        raise HTTPException(status_code=404, detail="Sector not found")
+
+    return await prompt_context.select_context(db, current_user.id, sector, q, budget)
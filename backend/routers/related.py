@@ -0,0 +1,55 @@
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+import models
+import schemas
+import auth
+import related
+from database import get_db
+
+router = APIRouter()
+
+KIND = Query(None, pattern="^(goal|saved_news)$", description="Only return this kind")
+
+
+def _similar(db: Session, user: models.User, kind: str, doc_id: int, k: int, target_kind: Optional[str]):
+    results = related.similar(db, user, kind, doc_id, k, target_kind)
+    if results is None:
+        raise HTTPException(status_code=404, detail="Not found")
+    return results
+
+
+@router.get("", response_model=List[schemas.RelatedItem])
+async def search_related(
+    q: str = Query(..., min_length=1, max_length=1000),
+    k: int = Query(5, ge=1, le=50),
+    kind: Optional[str] = KIND,
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Goals and saved news most similar to free text"""
+    return related.search(db, current_user, q, k, kind)
+
+
+@router.get("/goals/{goal_id}", response_model=List[schemas.RelatedItem])
+async def related_to_goal(
+    goal_id: int,
+    k: int = Query(5, ge=1, le=50),
+    kind: Optional[str] = KIND,
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Saved news and other goals most similar to a goal"""
+    return _similar(db, current_user, related.GOAL, goal_id, k, kind)
+
+
+@router.get("/saved-news/{news_id}", response_model=List[schemas.RelatedItem])
+async def related_to_saved_news(
+    news_id: int,
+    k: int = Query(5, ge=1, le=50),
+    kind: Optional[str] = KIND,
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Goals and other saved news most similar to a saved article"""
+    return _similar(db, current_user, related.SAVED_NEWS, news_id, k, kind)
@@ -0,0 +1,20 @@
+from typing import Optional
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.orm import Session
+import models
+import auth
+import changelog
+from database import get_db
+
+router = APIRouter()
+
+
+@router.get("/sync")
+async def sync_changes(
+    since: Optional[int] = None,
+    limit: int = Query(changelog.SYNC_PAGE_SIZE, ge=1, le=5000),
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Get sectors, goals, conversations, messages and saved news changed after `since`"""
+    return changelog.changes_since(db, current_user, since, limit)
@@ -1,6 +1,6 @@
-from pydantic import BaseModel, EmailStr
-from typing import Optional
-from datetime import datetime
+from pydantic import AfterValidator, BaseModel, BeforeValidator, EmailStr
+from typing import Annotated, Any, Dict, List, Optional
+from datetime import date, datetime, time, timezone
 
 # ==================== USER SCHEMAS ====================
 
@@ -49,6 +49,7 @@ class SectorResponse(BaseModel):
     icon: str
     is_active: bool
     created_at: datetime
+    version: int = 1
 
     class Config:
         from_attributes = True
@@ -74,13 +75,27 @@ class MessageResponse(BaseModel):
 
 # ==================== GOAL SCHEMAS ====================
 
+def _end_of_day(value):
+    # <input type="date"> sends YYYY-MM-DD; the goal is due at the end of that day (UTC)
+    if isinstance(value, str) and len(value) == 10:
+        return datetime.combine(date.fromisoformat(value), time(23, 59, 59))
+    return value
+
+def _naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+Deadline = Annotated[Optional[datetime], BeforeValidator(_end_of_day), AfterValidator(_naive_utc)]
+
 class GoalCreate(BaseModel):
     title: str
     description: Optional[str] = None
     target_value: Optional[float] = None
     current_value: Optional[float] = 0
     unit: Optional[str] = None
-    deadline: Optional[str] = None
+    deadline: Deadline = None
+    is_habit: bool = False
 
 class GoalUpdate(BaseModel):
     title: Optional[str] = None
@@ -88,8 +103,9 @@ class GoalUpdate(BaseModel):
     target_value: Optional[float] = None
     current_value: Optional[float] = None
     unit: Optional[str] = None
-    deadline: Optional[str] = None
+    deadline: Deadline = None
     is_completed: Optional[bool] = None
+    is_habit: Optional[bool] = None
 
 class GoalResponse(BaseModel):
     id: int
@@ -99,10 +115,12 @@ class GoalResponse(BaseModel):
     target_value: Optional[float] = None
     current_value: Optional[float] = None
     unit: Optional[str] = None
-    deadline: Optional[str] = None
+    deadline: Optional[datetime] = None
     is_completed: bool
     completed_at: Optional[datetime] = None
+    is_habit: bool = False
     created_at: datetime
+    version: int = 1
 
     class Config:
         from_attributes = True
@@ -124,6 +142,7 @@ class ConversationResponse(BaseModel):
     is_pinned: bool
     created_at: datetime
     updated_at: datetime
+    version: int = 1
 
     class Config:
         from_attributes = True
@@ -135,6 +154,7 @@ class ConversationListResponse(BaseModel):
     updated_at: datetime
     is_pinned: bool
     message_count: int
+    version: int = 1
 
     class Config:
         from_attributes = True
@@ -182,11 +202,12 @@ class StatisticResponse(BaseModel):
 
 class BadgeResponse(BaseModel):
     id: int
+    key: str
     name: str
     description: str
+    badge_type: str
     icon: str
-    requirement: str
-    points: int
+    points_value: int
 
     class Config:
         from_attributes = True
@@ -225,3 +246,188 @@ class SavedNewsResponse(BaseModel):
 
     class Config:
         from_attributes = True
+
+
+# ==================== JOB SCHEMAS ====================
+
+class JobResponse(BaseModel):
+    id: int
+    kind: str
+    status: str
+    attempts: int
+    max_attempts: int
+    last_error: Optional[str] = None
+    result: Optional[dict] = None
+    run_at: datetime
+    created_at: datetime
+    updated_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+# ==================== LEADERBOARD SCHEMAS ====================
+
+class LeaderboardEntry(BaseModel):
+    rank: int
+    user_id: int
+    full_name: Optional[str] = None
+    total_points: int
+
+class LeaderboardRankResponse(BaseModel):
+    rank: int
+    total_users: int
+    total_points: int
+
+
+# ==================== HABIT SCHEMAS ====================
+
+class HabitCheckinCreate(BaseModel):
+    day: Optional[date] = None  # defaults to today (UTC)
+
+class HabitStatsResponse(BaseModel):
+    goal_id: int
+    checkins: int
+    current_streak: int
+    longest_streak: int
+    completion_rate: float
+
+class HabitHeatmapResponse(HabitStatsResponse):
+    # `checkins` counts this year only; streaks and rate are all-time
+    year: int
+    days: int
+    bits: str  # base64, bit (day_of_year - 1) of the year in little-endian bit order
+
+
+# ==================== BATCH SCHEMAS ====================
+
+class BatchItem(BaseModel):
+    id: Optional[str] = None  # echoed back to match results
+    method: str = "GET"
+    path: str  # e.g. "/api/sectors/3/goals?limit=5"
+    body: Optional[Any] = None
+
+class BatchRequest(BaseModel):
+    requests: List[BatchItem]
+
+class BatchItemResult(BaseModel):
+    id: Optional[str] = None
+    status: int
+    headers: Dict[str, str] = {}
+    body: Optional[Any] = None
+
+class BatchResponse(BaseModel):
+    responses: List[BatchItemResult]
+
+
+# ==================== ANALYTICS SCHEMAS ====================
+
+class AnalyticsSummary(BaseModel):
+    goals: int
+    completed: int
+    completion_rate: Optional[float] = None
+    at_risk: int
+    overdue: int
+    stalled: int
+
+class SectorAnalytics(BaseModel):
+    sector_id: int
+    name: str
+    icon: Optional[str] = None
+    color: Optional[str] = None
+    goals: int
+    completed: int
+    completion_rate: Optional[float] = None
+    average_progress: Optional[float] = None  # over goals with a target, completed goals count as 1
+    at_risk: int
+
+class GoalForecast(BaseModel):
+    goal_id: int
+    sector_id: int
+    title: str
+    progress: Optional[float] = None  # current_value / target_value, capped at 1
+    velocity_per_day: float
+    eta: Optional[datetime] = None
+    deadline: Optional[datetime] = None
+    status: str  # on_track, at_risk, overdue, stalled, no_target
+
+class WeeklyTrend(BaseModel):
+    week_start: date
+    goals_created: int
+    goals_completed: int
+    progress_updates: int
+    progress_percent_gained: float  # sum over goals of progress gained, in percent of their target
+    statistics_recorded: int
+
+class AnalyticsResponse(BaseModel):
+    generated_at: datetime
+    summary: AnalyticsSummary
+    sectors: List[SectorAnalytics]
+    forecasts: List[GoalForecast]
+    weeks: List[WeeklyTrend]
+
+
+# ==================== NOTIFICATION SCHEMAS ====================
+
+class NotificationResponse(BaseModel):
+    id: int
+    kind: str
+    title: str
+    body: Optional[str] = None
+    data: Optional[Dict[str, Any]] = None
+    created_at: datetime
+    read_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+class NotificationPage(BaseModel):
+    items: List[NotificationResponse]
+    next_before: Optional[int] = None  # keyset cursor: pass as `before` for the next page
+    unread: int
+
+class UnreadCountResponse(BaseModel):
+    unread: int
+
+class NotificationReadRequest(BaseModel):
+    ids: Optional[List[int]] = None
+    up_to: Optional[int] = None  # mark everything with an id <= this
+
+class NotificationReadResponse(BaseModel):
+    marked: int
+    unread: int
+
+
+# ==================== RELATED CONTENT SCHEMAS ====================
+
+class RelatedItem(BaseModel):
+    kind: str  # goal or saved_news
+    id: int
+    title: str
+    score: float  # cosine similarity, 0-1
+    sector_id: Optional[int] = None
+    url: Optional[str] = None
+    source: Optional[str] = None
+
+
+# ==================== PROMPT CONTEXT SCHEMAS ====================
+
+class SectorContextResponse(BaseModel):
+    sector_id: int
+    context: str  # sector header, relevant goals and statistic rollups, for the system prompt
+    messages: List[MessageResponse]  # prior chat messages worth keeping, oldest first
+    goal_ids: List[int]
+    metrics: List[str]
+    tokens: int  # estimated tokens used
+    budget: int
+    omitted: int  # candidates that did not fit the budget
+
+
+# ==================== ADMIN SCHEMAS ====================
+
+class CohortReportResponse(BaseModel):
+    report: str
+    cohort: str
+    generation: int  # snapshot the rows were computed from
+    exported_at: datetime
+    rows: List[Dict[str, Any]]
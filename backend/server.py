@@ -0,0 +1,332 @@
+"""
+Production entry point: a pre-forking master running uvicorn workers.
+
+    python server.py --workers 4 --port 8000
+
+The master imports the app once (preload), runs `lifecycle.prepare()`
+(tables, partitions, badge catalog, leaderboard, bcrypt/JWT warm-up),
+closes its database connections, binds the listening socket and forks
+--workers (WEB_CONCURRENCY, default 1) workers. Each worker serves the inherited
+socket with uvicorn and the kernel spreads new connections across them.
+Import and warm-up costs are paid once and the loaded code and caches are
+shared copy-on-write. Anything that must not cross a fork (connection
+pools, scheduler threads, the events listener) is created in each worker
+by the app's lifespan.
+
+SIGTERM or SIGINT to the master shuts down gracefully: every worker stops
+accepting, ends its open event streams, finishes in-flight requests for up
+to GRACEFUL_TIMEOUT_SECONDS, then runs the lifespan shutdown, which closes
+its pools. Workers still alive after that are killed. A worker that dies
+is replaced; one that fails its startup stops the server.
+
+Workers do not share memory once forked. With more than one, set
+RATE_LIMIT_BACKEND, RESPONSE_CACHE_BACKEND, IDEMPOTENCY_BACKEND and
+EVENTS_BACKEND to redis: on the default "memory" backends each worker
+would keep its own rate limits, cache, idempotency keys and event streams.
+The master refuses to start more than one worker while any of them is
+"memory", unless given --allow-memory-backends.
+
+Run `python server.py bench` to measure requests/sec for 1, 2, 4, ...
+workers up to the number of CPUs.
+"""
+import argparse
+import os
+import signal
+import socket
+import sys
+import time
+import traceback
+
+import uvicorn
+
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+GRACEFUL_TIMEOUT_SECONDS = float(os.getenv("GRACEFUL_TIMEOUT_SECONDS", "30"))
+LIFESPAN_SHUTDOWN_SECONDS = 10  # after the drain, for closing pools and joining threads
+
+STARTUP_FAILURE = 3  # worker exit code when the lifespan startup fails
+
+
+class WorkerServer(uvicorn.Server):
+    def handle_exit(self, sig, frame):
+        super().handle_exit(sig, frame)
+        import events
+
+        events.hub.close_all()  # event streams never finish on their own
+
+
+def _serve(app, sock: socket.socket, options) -> int:
+    """Run one worker on the shared socket until it is told to stop"""
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    config = uvicorn.Config(
+        app,
+        lifespan="on",
+        timeout_graceful_shutdown=options.graceful_timeout,
+        access_log=options.access_log,
+        log_level=options.log_level,
+    )
+    server = WorkerServer(config)
+    server.run(sockets=[sock])
+    return 0 if server.started else STARTUP_FAILURE
+
+
+class Master:
+    """Forks the workers, replaces the ones that die and stops them on SIGTERM/SIGINT"""
+
+    def __init__(self, app, sock: socket.socket, options):
+        self.app = app
+        self.sock = sock
+        self.options = options
+        self.workers = {}  # pid -> started at
+        self.stopping = False
+
+    def spawn(self):
+        pid = os.fork()
+        if pid == 0:
+            code = 1
+            try:
+                code = _serve(self.app, self.sock, self.options)
+            except BaseException:
+                traceback.print_exc()
+            finally:
+                os._exit(code)
+        self.workers[pid] = time.monotonic()
+
+    def reap(self) -> list:
+        """(pid, exit code) of workers that exited"""
+        exited = []
+        while self.workers:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                break
+            if self.workers.pop(pid, None) is not None:
+                exited.append((pid, os.waitstatus_to_exitcode(status)))
+        return exited
+
+    def _stop(self, sig, frame):
+        self.stopping = True
+
+    def run(self) -> int:
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+        for _ in range(self.options.workers):
+            self.spawn()
+        print(f"🚀 Master {os.getpid()} serving on {self.options.host}:{self.options.port} "
+              f"with {self.options.workers} workers")
+
+        exit_code = 0
+        while not self.stopping:
+            for pid, code in self.reap():
+                if code == STARTUP_FAILURE:
+                    print(f"❌ Worker {pid} failed to start, shutting down")
+                    self.stopping, exit_code = True, 1
+                    break
+                print(f"⚠️ Worker {pid} exited with {code}, starting a new one")
+                self.spawn()
+            time.sleep(0.2)
+
+        self.shutdown()
+        return exit_code
+
+    def shutdown(self):
+        print(f"🛑 Draining {len(self.workers)} workers (up to {self.options.graceful_timeout:.0f}s)")
+        for pid in self.workers:
+            os.kill(pid, signal.SIGTERM)
+        deadline = time.monotonic() + self.options.graceful_timeout + LIFESPAN_SHUTDOWN_SECONDS
+        while self.workers and time.monotonic() < deadline:
+            self.reap()
+            time.sleep(0.1)
+        for pid in list(self.workers):
+            print(f"⚠️ Worker {pid} did not stop in time, killing it")
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+        self.workers.clear()
+        self.sock.close()
+        print("👋 Server stopped")
+
+
+def memory_backends() -> list:
+    """Settings left on a per-process "memory" backend, which forked workers cannot share"""
+    import events
+    import idempotency
+    import rate_limit
+    import response_cache
+
+    settings = [
+        ("RATE_LIMIT_BACKEND", rate_limit.RATE_LIMIT_ENABLED, rate_limit.RATE_LIMIT_BACKEND),
+        ("RESPONSE_CACHE_BACKEND", response_cache.RESPONSE_CACHE_ENABLED, response_cache.RESPONSE_CACHE_BACKEND),
+        ("IDEMPOTENCY_BACKEND", idempotency.IDEMPOTENCY_ENABLED, idempotency.IDEMPOTENCY_BACKEND),
+        ("EVENTS_BACKEND", True, events.EVENTS_BACKEND),
+    ]
+    return [name for name, enabled, backend in settings if enabled and backend == "memory"]
+
+
+def serve(options) -> int:
+    import lifecycle
+    import main
+
+    local = memory_backends() if options.workers > 1 else []
+    if local and not options.allow_memory_backends:
+        print(f"❌ {', '.join(local)} use the in-process memory backend, which {options.workers} workers "
+              f"cannot share. Set them to redis, run with --workers 1, or pass --allow-memory-backends")
+        return 2
+    if local:
+        print(f"⚠️ {', '.join(local)} use the memory backend: each of the {options.workers} workers "
+              f"keeps its own rate limits, cache, idempotency keys and event streams")
+
+    lifecycle.prepare()
+    lifecycle.release_connections()  # workers open their own
+    sock = uvicorn.Config(main.app, host=options.host, port=options.port, backlog=options.backlog).bind_socket()
+    return Master(main.app, sock, options).run()
+
+
+# ==================== BENCHMARK ====================
+
+def _request(connection, path: str, headers: dict) -> int:
+    connection.request("GET", path, headers=headers)
+    response = connection.getresponse()
+    response.read()
+    return response.status
+
+
+def _load(port: int, path: str, token: str, seconds: float, connections: int) -> tuple:
+    """Requests from one client process over `connections` keep-alive connections: (ok, failed, latencies)"""
+    import http.client
+    import threading
+
+    headers = {"Authorization": f"Bearer {token}"}
+    deadline = time.monotonic() + seconds
+    results = []
+
+    def client():
+        connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+        ok, failed, latencies = 0, 0, []
+        while time.monotonic() < deadline:
+            began = time.perf_counter()
+            try:
+                status = _request(connection, path, headers)
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                failed += 1
+                continue
+            latencies.append(time.perf_counter() - began)
+            if status == 200:
+                ok += 1
+            else:
+                failed += 1
+        connection.close()
+        results.append((ok, failed, latencies))
+
+    threads = [threading.Thread(target=client) for _ in range(connections)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return (sum(r[0] for r in results), sum(r[1] for r in results),
+            [latency for r in results for latency in r[2]])
+
+
+def _wait_ready(port: int, timeout: float = 60):
+    import http.client
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=2)
+            if _request(connection, "/api", {}) == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"server on port {port} did not become ready")
+
+
+def _token(port: int) -> str:
+    import http.client
+    import json
+    from urllib.parse import urlencode
+
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    body = {"email": "bench@example.com", "password": "bench-password", "full_name": "Bench"}
+    connection.request("POST", "/api/auth/signup", json.dumps(body), {"Content-Type": "application/json"})
+    connection.getresponse().read()
+    form = urlencode({"username": body["email"], "password": body["password"]})
+    connection.request("POST", "/api/auth/login", form, {"Content-Type": "application/x-www-form-urlencoded"})
+    return json.loads(connection.getresponse().read())["access_token"]
+
+
+def bench(options):
+    """Requests/sec and latency for increasing worker counts, each against a fresh SQLite database"""
+    import subprocess
+    import tempfile
+    from concurrent.futures import ProcessPoolExecutor
+
+    import numpy as np
+
+    counts = sorted({min(1 << i, options.max_workers) for i in range(options.max_workers.bit_length() + 1)})
+    paths = ["/api", "/api/users/me"]  # no database; JWT plus a primary-key lookup
+    clients = max(1, options.clients)
+    per_client = max(1, options.connections // clients)
+    print(f"⏱️ {os.cpu_count()} CPUs, {clients} client processes x {per_client} connections, "
+          f"{options.seconds:.0f}s per run")
+    print(f"{'workers':>7} {'path':<14} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+
+    for workers in counts:
+        with tempfile.TemporaryDirectory() as directory:
+            env = dict(
+                os.environ,
+                DATABASE_URL=f"sqlite:///{directory}/bench.db",
+                SECRET_KEY=os.getenv("SECRET_KEY") or "bench-secret",
+                RATE_LIMIT_ENABLED="false",
+                REMINDERS_ENABLED="false",
+            )
+            env.pop("SHARD_URLS", None)
+            process = subprocess.Popen(
+                [sys.executable, os.path.abspath(__file__), "--workers", str(workers),
+                 "--port", str(options.port), "--log-level", "warning", "--allow-memory-backends"],
+                cwd=os.path.dirname(os.path.abspath(__file__)), env=env,
+                stdout=subprocess.DEVNULL,
+            )
+            try:
+                _wait_ready(options.port)
+                token = _token(options.port)
+                for path in paths:
+                    with ProcessPoolExecutor(clients) as pool:
+                        runs = list(pool.map(_load, [options.port] * clients, [path] * clients, [token] * clients,
+                                             [options.seconds] * clients, [per_client] * clients))
+                    ok = sum(run[0] for run in runs)
+                    failed = sum(run[1] for run in runs)
+                    latencies = np.array([latency for run in runs for latency in run[2]]) * 1000
+                    p50, p99 = np.percentile(latencies, [50, 99]) if len(latencies) else (0, 0)
+                    print(f"{workers:>7} {path:<14} {ok / options.seconds:>9.0f} {p50:>8.1f} {p99:>8.1f} {failed:>7}")
+            finally:
+                process.send_signal(signal.SIGTERM)
+                process.wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the HUMAN API with pre-forked uvicorn workers")
+    parser.add_argument("command", nargs="?", choices=["serve", "bench"], default="serve")
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=WEB_CONCURRENCY)
+    parser.add_argument("--backlog", type=int, default=2048)
+    parser.add_argument("--graceful-timeout", type=float, default=GRACEFUL_TIMEOUT_SECONDS)
+    parser.add_argument("--log-level", default=os.getenv("LOG_LEVEL", "info"))
+    parser.add_argument("--access-log", action="store_true")
+    parser.add_argument("--allow-memory-backends", action="store_true",
+                        help="start several workers even though some backends are per-process")
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1, help="bench: largest worker count")
+    parser.add_argument("--clients", type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                        help="bench: load generator processes")
+    parser.add_argument("--connections", type=int, default=64, help="bench: concurrent connections in total")
+    parser.add_argument("--seconds", type=float, default=10, help="bench: duration of each run")
+    options = parser.parse_args()
+
+    if options.command == "bench":
+        bench(options)
+    else:
+        sys.exit(serve(options))
@@ -0,0 +1,134 @@
+"""
+Client-shaped list responses: `?fields=` and `?include=`.
+
+`fields=id,title,current_value` limits both the payload and the SELECT:
+only those columns are loaded (`load_only`) and serialized, through a
+partial response model derived from the route's schema. `include=sector`
+embeds related rows, loaded with one extra `selectinload` query for the
+whole page instead of one call per row.
+
+Unknown names are rejected with 400 so typos do not silently return
+everything. `id` is always returned.
+"""
+from functools import lru_cache
+from typing import List, Optional
+
+from fastapi import HTTPException
+from pydantic import ConfigDict, create_model
+from sqlalchemy.orm import load_only, selectinload
+
+import models
+import schemas
+
+
+class Include:
+    def __init__(self, name: str, relationship, schema, many: bool, resource: str):
+        self.name = name
+        self.relationship = relationship  # e.g. models.Goal.sector
+        self.schema = schema              # response schema of the related rows
+        self.many = many
+        self.resource = resource          # response cache resource the related rows belong to
+
+
+class Resource:
+    def __init__(self, name: str, model, schema, includes: tuple = ()):
+        self.name = name
+        self.model = model
+        self.schema = schema
+        self.includes = {include.name: include for include in includes}
+
+
+SECTORS = Resource("sectors", models.Sector, schemas.SectorResponse, (
+    Include("goals", models.Sector.goals, schemas.GoalResponse, True, "goals"),
+))
+GOALS = Resource("goals", models.Goal, schemas.GoalResponse, (
+    Include("sector", models.Goal.sector, schemas.SectorResponse, False, "sectors"),
+))
+SAVED_NEWS = Resource("saved_news", models.SavedNews, schemas.SavedNewsResponse)
+CONVERSATIONS = Resource("conversations", models.Conversation, schemas.ConversationListResponse)
+
+
+def _split(value: Optional[str]) -> list:
+    return [part.strip() for part in (value or "").split(",") if part.strip()]
+
+
+@lru_cache(maxsize=256)
+def _shaped_model(schema, fields: Optional[tuple], includes: tuple):
+    """Response model with only `fields` of `schema` plus the included relations"""
+    definitions = {}
+    for name, info in schema.model_fields.items():
+        if fields is None or name in fields:
+            definitions[name] = (info.annotation, info)
+    for name, related_schema, many in includes:
+        definitions[name] = (List[related_schema], []) if many else (Optional[related_schema], None)
+    return create_model(
+        f"{schema.__name__}Shaped", __config__=ConfigDict(from_attributes=True), **definitions
+    )
+
+
+class Shape:
+    def __init__(self, resource: Resource, fields: Optional[list], includes: list):
+        self.resource = resource
+        self.fields = fields
+        self.includes = includes
+
+    @property
+    def is_default(self) -> bool:
+        return self.fields is None and not self.includes
+
+    def apply(self, query):
+        """Add column projection and eager loading to a query for the resource's model"""
+        model = self.resource.model
+        if self.fields is not None:
+            columns = {name for name in self.fields if name in model.__table__.columns}
+            for include in self.includes:
+                # Many-to-one relations need their foreign key to be loaded
+                columns.update(column.name for column in include.relationship.property.local_columns
+                               if column.table is model.__table__)
+            query = query.options(load_only(*(getattr(model, name) for name in sorted(columns))))
+        for include in self.includes:
+            query = query.options(selectinload(include.relationship))
+        return query
+
+    def response_type(self):
+        """List type used to serialize the shaped rows"""
+        if self.is_default:
+            return List[self.resource.schema]
+        model = _shaped_model(
+            self.resource.schema,
+            tuple(sorted(self.fields)) if self.fields is not None else None,
+            tuple((include.name, include.schema, include.many) for include in self.includes),
+        )
+        return List[model]
+
+    def resources(self) -> tuple:
+        """Response cache resources the shaped response depends on"""
+        return (self.resource.name,) + tuple(include.resource for include in self.includes)
+
+
+def parse(resource: Resource, fields: Optional[str] = None, include: Optional[str] = None) -> Shape:
+    """Validate the query parameters against the resource's schema; 400 on unknown names"""
+    available = resource.schema.model_fields
+    selected = None
+    if fields:
+        selected = _split(fields)
+        unknown = [name for name in selected if name not in available]
+        if unknown:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unknown field(s) {', '.join(unknown)} for {resource.name}; "
+                       f"available: {', '.join(available)}"
+            )
+        selected = ["id"] + [name for name in dict.fromkeys(selected) if name != "id"]
+
+    includes = []
+    for name in dict.fromkeys(_split(include)):
+        if name not in resource.includes:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Cannot include '{name}' in {resource.name}; "
+                       f"available: {', '.join(resource.includes) or 'none'}"
+            )
+        includes.append(resource.includes[name])
+
+    return Shape(resource, selected, includes)
@@ -0,0 +1,412 @@
+"""
+Horizontal sharding of user data by user_id.
+
+Set SHARD_URLS to a comma-separated list of `name=url` databases, e.g.
+
+    SHARD_URLS=s0=sqlite:///./shard0.db,s1=sqlite:///./shard1.db
+
+Everything a user owns (the user row, sectors, goals, messages,
+conversations, saved news, notifications, change log, jobs) lives on one
+shard. Unset, there is a single "default" shard on DATABASE_URL and nothing
+changes.
+
+Placement: new users are put on the shard a consistent-hash ring
+(SHARD_VNODES virtual nodes per shard) picks for their id. The
+`user_shards` directory table in the main DATABASE_URL database records
+where each user actually lives, so adding a shard moves nobody implicitly:
+`python sharding.py rebalance` moves just the ~1/N users whose ring
+placement changed. The directory also allocates user ids, which keeps them
+globally unique, and enforces email uniqueness across shards.
+
+Routing: `get_db` opens a session on the main database and `route_request`
+rebinds it to the shard of the user in the bearer token (the `uid` claim,
+or `sub` for older tokens) before the handler runs. Directory lookups are
+cached per worker for SHARD_DIRECTORY_TTL_SECONDS.
+
+Moving a user (`python sharding.py move <user_id> <shard>`) is online:
+1. The directory marks the user `moving`; writes get 503 + Retry-After,
+   reads keep going to the old shard.
+2. After every worker's cached route has expired, the user's data is
+   streamed from the old shard into the new one with data_export's
+   export/import (ids are remapped; clients are told to resync).
+3. If the user's `change_seq` moved during the copy a write slipped in, so
+   the copy is rolled back and the move aborted.
+4. The directory points at the new shard and, once stale routes have
+   expired again, writes resume and the old copy is purged.
+"""
+import bisect
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import Optional
+
+from fastapi import HTTPException, Request
+from jose import JWTError, jwt
+from sqlalchemy import create_engine, delete, func, insert, select, text, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, sessionmaker
+
+import migrations
+import models
+from database import SQLALCHEMY_DATABASE_URL, SessionLocal, engine
+
+SHARD_URLS = os.getenv("SHARD_URLS", "")
+SHARD_VNODES = int(os.getenv("SHARD_VNODES", "128"))
+SHARD_DIRECTORY_TTL_SECONDS = float(os.getenv("SHARD_DIRECTORY_TTL_SECONDS", "5"))
+SHARD_MOVE_DRAIN_SECONDS = float(os.getenv("SHARD_MOVE_DRAIN_SECONDS", "2"))
+
+DEFAULT_SHARD = "default"
+ENABLED = bool(SHARD_URLS.strip())
+SAFE_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+
+class HashRing:
+    """Consistent hashing: each node owns the arcs before its virtual points"""
+
+    def __init__(self, nodes, vnodes: int = SHARD_VNODES):
+        self.nodes = list(nodes)
+        points = sorted(
+            (self._hash(f"{node}#{replica}"), node) for node in self.nodes for replica in range(vnodes)
+        )
+        self._hashes = [point for point, _ in points]
+        self._owners = [node for _, node in points]
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+    def node_for(self, key) -> str:
+        index = bisect.bisect(self._hashes, self._hash(str(key))) % len(self._hashes)
+        return self._owners[index]
+
+
+class Shard:
+    def __init__(self, name: str, shard_engine, session_factory):
+        self.name = name
+        self.engine = shard_engine
+        self.session_factory = session_factory
+
+
+def _normalize(url: str) -> str:
+    return url.replace("postgres://", "postgresql://", 1) if url.startswith("postgres://") else url
+
+
+def _load_shards() -> dict:
+    if not ENABLED:
+        return {DEFAULT_SHARD: Shard(DEFAULT_SHARD, engine, SessionLocal)}
+    shards = {}
+    for entry in SHARD_URLS.split(","):
+        name, _, url = entry.strip().partition("=")
+        url = _normalize(url.strip())
+        if url == SQLALCHEMY_DATABASE_URL:
+            shard_engine = engine
+        else:
+            shard_engine = create_engine(url, connect_args={"check_same_thread": False} if "sqlite" in url else {})
+        shards[name.strip()] = Shard(name.strip(), shard_engine, sessionmaker(
+            autocommit=False, autoflush=False, bind=shard_engine, info={"shard": name.strip()}))
+    print(f"🧩 Sharding enabled: {', '.join(shards)}")
+    return shards
+
+
+shards = _load_shards()
+ring = HashRing(shards)
+
+
+def create_all():
+    """Create and upgrade the tables on every shard (the main database is handled by main.py)"""
+    for shard in shards.values():
+        if shard.engine is not engine:
+            models.Base.metadata.create_all(bind=shard.engine)
+            migrations.upgrade(shard.engine)
+
+
+def session_factories() -> dict:
+    """Shard name -> sessionmaker, for background work that must visit every shard"""
+    return {name: shard.session_factory for name, shard in shards.items()}
+
+
+def shard_of(db: Session) -> str:
+    return db.info.get("shard", DEFAULT_SHARD)
+
+
+def session_factory_of(db: Session):
+    """The sessionmaker of the shard a session is bound to"""
+    shard = shards.get(shard_of(db))
+    return shard.session_factory if shard else SessionLocal
+
+
+# ==================== DIRECTORY ====================
+
+_routes = {}  # ("uid", id) or ("email", email) -> (expires_at, user_id, shard, moving)
+_routes_lock = threading.Lock()
+
+
+def lookup(user_id: Optional[int] = None, email: Optional[str] = None) -> Optional[tuple]:
+    """(user_id, shard, moving) from the directory, cached briefly; None if unknown"""
+    key = ("uid", user_id) if user_id is not None else ("email", email)
+    now = time.monotonic()
+    with _routes_lock:
+        cached = _routes.get(key)
+    if cached is not None and cached[0] > now:
+        return cached[1:]
+
+    directory = SessionLocal()
+    try:
+        condition = (models.UserShard.user_id == user_id) if user_id is not None else (models.UserShard.email == email)
+        row = directory.execute(
+            select(models.UserShard.user_id, models.UserShard.shard, models.UserShard.moving).where(condition)
+        ).first()
+    finally:
+        directory.close()
+    if row is None:
+        return None
+    with _routes_lock:
+        _routes[key] = (now + SHARD_DIRECTORY_TTL_SECONDS, row.user_id, row.shard, bool(row.moving))
+    return row.user_id, row.shard, bool(row.moving)
+
+
+def bind(db: Session, shard: str):
+    """Point an unused (or just closed) session at a shard"""
+    db.close()
+    db.bind = shards[shard].engine
+    db.info["shard"] = shard
+
+
+def route_token(db: Session, token: Optional[str], method: str = "GET"):
+    """Bind the session to the shard of the token's user; unknown tokens stay on the main database"""
+    if not ENABLED or not token:
+        return
+    import auth  # auth depends on database.get_db, which routes through here
+
+    try:
+        claims = jwt.decode(token, auth.SECRET_KEY, algorithms=[auth.ALGORITHM])
+    except JWTError:
+        return  # get_current_user rejects it
+    route = lookup(user_id=claims["uid"]) if "uid" in claims else lookup(email=claims.get("sub"))
+    if route is None:
+        return
+    _, shard, moving = route
+    if moving and method not in SAFE_METHODS:
+        raise HTTPException(status_code=503, detail="Your data is being moved, try again shortly",
+                            headers={"Retry-After": str(int(SHARD_DIRECTORY_TTL_SECONDS + SHARD_MOVE_DRAIN_SECONDS) + 1)})
+    bind(db, shard)
+
+
+def route_request(db: Session, request: Request):
+    authorization = request.headers.get("authorization", "")
+    token = authorization[7:] if authorization.lower().startswith("bearer ") else request.query_params.get("token")
+    route_token(db, token, request.method)
+
+
+def route_email(db: Session, email: str):
+    """Bind the session to the shard of the user with this email (login)"""
+    if ENABLED:
+        route = lookup(email=email)
+        if route is not None:
+            bind(db, route[1])
+
+
+def register(db: Session, email: str) -> Optional[int]:
+    """Allocate a global user id, place it on the ring and bind `db` to its shard.
+    Returns None if the email is taken"""
+    directory = SessionLocal()
+    try:
+        entry = models.UserShard(email=email, shard="")
+        directory.add(entry)
+        directory.flush()
+        entry.shard = ring.node_for(entry.user_id)
+        directory.commit()
+        user_id, shard = entry.user_id, entry.shard
+    except IntegrityError:
+        directory.rollback()
+        return None
+    finally:
+        directory.close()
+    bind(db, shard)
+    return user_id
+
+
+# ==================== MOVING USERS ====================
+
+def _set_directory(user_id: int, **values):
+    directory = SessionLocal()
+    try:
+        directory.execute(update(models.UserShard).where(models.UserShard.user_id == user_id)
+                          .values(updated_at=datetime.utcnow(), **values))
+        directory.commit()
+    finally:
+        directory.close()
+
+
+def _copy(source: Session, target: Session, user_id: int) -> dict:
+    import badges
+    import changelog
+    import data_export
+
+    badge_ids = badges.badge_ids(target)  # commits the catalog first if the shard has none yet
+
+    user = source.get(models.User, user_id)
+    target.add(models.User(**{column.name: getattr(user, column.name) for column in models.User.__table__.columns}))
+    target.flush()
+
+    importer = data_export.Importer(target, user_id)
+    for line in data_export.export_lines(source, user_id):
+        importer.add(json.loads(line))
+    importer.flush()
+
+    # Badge ids are per shard; match them by rule key
+    earned = source.execute(
+        select(models.Badge.key, models.UserBadge.earned_at)
+        .join(models.UserBadge, models.UserBadge.badge_id == models.Badge.id)
+        .where(models.UserBadge.user_id == user_id)
+    ).all()
+    target.add_all(models.UserBadge(user_id=user_id, badge_id=badge_ids[key], earned_at=earned_at)
+                   for key, earned_at in earned if key in badge_ids)
+
+    notification_columns = [column for column in models.Notification.__table__.columns if column.name != "id"]
+    rows = source.execute(select(*notification_columns).where(models.Notification.user_id == user_id)
+                          .order_by(models.Notification.id)).all()
+    if rows:
+        target.execute(insert(models.Notification), [dict(row._mapping) for row in rows])
+
+    changelog.force_resync(target, user_id)  # ids were remapped; clients reload
+    return importer.counts
+
+
+def _purge_source(db: Session, user_id: int):
+    """Remove everything the user owns from a shard they no longer live on"""
+    import purge
+
+    for entity_type, model in (("sector", models.Sector), ("conversation", models.Conversation)):
+        ids = db.scalars(select(model.id).where(model.user_id == user_id)).all()
+        db.execute(update(model).where(model.id.in_(ids), model.deleted_at.is_(None))
+                   .values(deleted_at=datetime.utcnow()), execution_options={"synchronize_session": False})
+        db.commit()
+        for entity_id in ids:
+            task = purge.schedule(db, user_id, entity_type, entity_id)
+            db.flush()
+            purge.run_task(db, task)
+
+    for model in (models.SavedNews, models.Notification, models.UserBadge, models.ChangeLog,
+                  models.Job, models.PurgeTask):
+        db.execute(delete(model).where(model.user_id == user_id), execution_options={"synchronize_session": False})
+    db.execute(delete(models.User).where(models.User.id == user_id), execution_options={"synchronize_session": False})
+    db.commit()
+
+
+def move_user(user_id: int, target: str) -> dict:
+    """Move one user's data to another shard while the app keeps serving them"""
+    if target not in shards:
+        raise ValueError(f"Unknown shard '{target}'")
+    route = lookup(user_id=user_id)
+    if route is None:
+        raise LookupError(f"User {user_id} is not in the shard directory")
+    source_name = route[1]
+    if source_name == target:
+        return {"user_id": user_id, "moved": False, "shard": target}
+
+    _set_directory(user_id, moving=True)
+    time.sleep(SHARD_DIRECTORY_TTL_SECONDS + SHARD_MOVE_DRAIN_SECONDS)  # stale routes expire, in-flight writes finish
+    source = shards[source_name].session_factory()
+    destination = shards[target].session_factory()
+    try:
+        seq = source.scalar(select(models.User.change_seq).where(models.User.id == user_id))
+        pending = source.scalar(select(func.count()).select_from(models.Job).where(
+            models.Job.user_id == user_id, models.Job.status.in_(("queued", "running"))))
+        if pending:
+            raise RuntimeError(f"User {user_id} has {pending} pending jobs; retry once they finish")
+
+        counts = _copy(source, destination, user_id)
+        if source.scalar(select(models.User.change_seq).where(models.User.id == user_id)) != seq:
+            raise RuntimeError(f"User {user_id} changed during the copy; retry the move")
+        destination.commit()
+        _set_directory(user_id, shard=target)
+    except Exception:
+        destination.rollback()
+        _set_directory(user_id, moving=False)
+        source.close()
+        raise
+    finally:
+        destination.close()
+
+    time.sleep(SHARD_DIRECTORY_TTL_SECONDS)  # every worker now routes to the new shard
+    _set_directory(user_id, moving=False)
+    try:
+        source.rollback()
+        _purge_source(source, user_id)
+    except Exception as e:
+        print(f"⚠️ User {user_id} moved to {target}, but purging the copy on {source_name} failed: {e}")
+    finally:
+        source.close()
+
+    print(f"🚚 Moved user {user_id} from {source_name} to {target}: {counts}")
+    return {"user_id": user_id, "moved": True, "from": source_name, "shard": target, "rows": counts}
+
+
+def misplaced() -> list:
+    """(user_id, current shard, ring shard) for users the ring now places elsewhere"""
+    directory = SessionLocal()
+    try:
+        rows = directory.execute(select(models.UserShard.user_id, models.UserShard.shard)).all()
+    finally:
+        directory.close()
+    return [(user_id, shard, ring.node_for(user_id)) for user_id, shard in rows if ring.node_for(user_id) != shard]
+
+
+def backfill(shard: Optional[str] = None) -> int:
+    """Add directory entries for users created before sharding; they live in the main database"""
+    if shard is None:
+        shard = next((name for name, entry in shards.items() if entry.engine is engine), None)
+    if shard is None:
+        raise ValueError("The main database is not one of SHARD_URLS; pass the shard holding existing users")
+    directory = SessionLocal()
+    try:
+        known = select(models.UserShard.user_id)
+        users = directory.execute(select(models.User.id, models.User.email).where(models.User.id.not_in(known))).all()
+        directory.add_all(models.UserShard(user_id=user_id, email=email, shard=shard) for user_id, email in users)
+        directory.flush()
+        if engine.dialect.name == "postgresql":
+            # Explicit ids do not advance the sequence that allocates new ones
+            directory.execute(text(
+                "SELECT setval(pg_get_serial_sequence('user_shards', 'user_id'), "
+                "(SELECT COALESCE(MAX(user_id), 1) FROM user_shards))"))
+        directory.commit()
+    finally:
+        directory.close()
+    return len(users)
+
+
+if __name__ == "__main__":
+    models.Base.metadata.create_all(bind=engine)
+    migrations.upgrade(engine)
+    create_all()
+    command = sys.argv[1] if len(sys.argv) > 1 else "status"
+
+    if command == "status":
+        directory = SessionLocal()
+        counts = dict(directory.execute(
+            select(models.UserShard.shard, func.count()).group_by(models.UserShard.shard)).all())
+        directory.close()
+        for name in shards:
+            print(f"🧩 {name}: {counts.get(name, 0)} users")
+        print(f"🧩 {len(misplaced())} users placed differently by the current ring")
+    elif command == "backfill":
+        print(f"✅ Added {backfill(sys.argv[2] if len(sys.argv) > 2 else None)} users to the directory")
+    elif command == "move":
+        print(move_user(int(sys.argv[2]), sys.argv[3]))
+    elif command == "rebalance":
+        dry_run = "--dry-run" in sys.argv
+        for user_id, current, placed in misplaced():
+            if dry_run:
+                print(f"🚚 would move user {user_id}: {current} -> {placed}")
+                continue
+            try:
+                move_user(user_id, placed)
+            except Exception as e:
+                print(f"⚠️ Could not move user {user_id}: {e}")
+    else:
+        print("usage: python sharding.py [status | backfill [shard] | move <user_id> <shard> | rebalance [--dry-run]]")
@@ -0,0 +1,474 @@
+"""
+Columnar snapshot of the user data for admin analytics.
+
+Aggregates across every user (see cohorts.py) would be full scans of the
+production tables, so they run against a copy instead: each table in
+TABLES is exported to NumPy arrays, one `.npy` file per column, under
+SNAPSHOT_DIR. Only numbers, booleans, timestamps and low-cardinality
+categories (enums, message roles, ...) are exported. Names, emails, titles
+and message contents never leave the database.
+
+Exports are incremental. Each run adds a segment per table:
+
+- append-only tables (messages, progress history, ...) export the rows
+  with an id above the last one exported, on every shard. Rows younger
+  than SNAPSHOT_LAG_SECONDS wait for the next run, so a transaction that
+  commits late cannot be skipped. Ids do not follow timestamps exactly, so
+  the export stops at the first young row rather than filtering by age:
+  the watermark never passes a row that is still waiting;
+- mutable tables (users, sectors, goals, ...) compare every row's id and
+  version (or updated_at) with the snapshot. Changed rows are exported
+  again and vanished ids are recorded as deletions.
+
+Readers merge the segments: the latest copy of a row wins, unless a later
+segment deleted it. When a table has more than SNAPSHOT_MAX_SEGMENTS
+segments it is compacted into one. Segments are written before the
+manifest is swapped in, so a reader never sees a half-written export.
+
+Rows are keyed by shard and id, since ids repeat across shards. With
+several workers SNAPSHOT_DIR must be on storage they share.
+
+    python snapshot.py export [--full]
+    python snapshot.py status
+"""
+import fcntl
+import json
+import os
+import shutil
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+
+import numpy as np
+from sqlalchemy import Boolean, DateTime, Enum, Float, Integer, func, select
+
+import jobs
+import models
+import sharding
+
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", "./snapshot")
+SNAPSHOT_LAG_SECONDS = int(os.getenv("SNAPSHOT_LAG_SECONDS", "60"))
+SNAPSHOT_BATCH_ROWS = int(os.getenv("SNAPSHOT_BATCH_ROWS", "10000"))
+SNAPSHOT_SEGMENT_ROWS = int(os.getenv("SNAPSHOT_SEGMENT_ROWS", "1000000"))
+SNAPSHOT_MAX_SEGMENTS = int(os.getenv("SNAPSHOT_MAX_SEGMENTS", "16"))
+
+KEY_SHIFT = 40  # key = shard code << KEY_SHIFT | id
+ID_MASK = (1 << KEY_SHIFT) - 1
+IN_BATCH = 1000  # ids per IN (...) when re-reading changed rows
+MANIFEST = "manifest.json"
+
+
+class TableSpec:
+    """How one model is exported"""
+
+    def __init__(self, model, mutable: bool = False, categorical: tuple = ()):
+        self.model = model
+        self.table = model.__table__
+        self.name = self.table.name
+        self.mutable = mutable
+        self.columns = {}  # exported column -> kind
+        for column in self.table.columns:
+            kind = _kind(column, categorical)
+            if kind is not None and column.name != "id":
+                self.columns[column.name] = kind
+        stamps = [name for name in ("version", "updated_at") if name in self.table.c]
+        self.stamp = stamps[0] if mutable and stamps else None  # changes whenever the row does
+        times = [name for name in ("created_at", "recorded_at", "earned_at") if name in self.table.c]
+        self.time_column = times[0] if times else None
+
+
+def _kind(column, categorical: tuple) -> Optional[str]:
+    if column.name in categorical or isinstance(column.type, Enum):
+        return "category"
+    if isinstance(column.type, Boolean):
+        return "bool"
+    if isinstance(column.type, Integer):
+        return "int"
+    if isinstance(column.type, Float):
+        return "float"
+    if isinstance(column.type, DateTime):
+        return "datetime"
+    return None  # free text, JSON and binary stay in the database
+
+
+TABLES = [
+    TableSpec(models.User, mutable=True),
+    TableSpec(models.Sector, mutable=True),
+    TableSpec(models.Goal, mutable=True),
+    TableSpec(models.GoalProgress),
+    TableSpec(models.Statistic),
+    TableSpec(models.Message, categorical=("ai_model",)),
+    TableSpec(models.Conversation, mutable=True),
+    TableSpec(models.ConversationMessage, categorical=("role", "model_used")),
+    TableSpec(models.SavedNews, mutable=True, categorical=("source", "category")),
+    TableSpec(models.Badge, mutable=True, categorical=("key",)),
+    TableSpec(models.UserBadge),
+]
+
+
+# ==================== ENCODING ====================
+
+def _encode(kind: str, values: list, categories: list) -> np.ndarray:
+    """Column values as an array; missing values become -1, NaN or NaT"""
+    if kind == "int":
+        return np.array([-1 if value is None else value for value in values], dtype=np.int64)
+    if kind == "float":
+        return np.array([np.nan if value is None else value for value in values], dtype=np.float64)
+    if kind == "bool":
+        return np.array([-1 if value is None else int(value) for value in values], dtype=np.int8)
+    if kind == "datetime":
+        return np.array(values, dtype="datetime64[us]")
+    codes = {category: code for code, category in enumerate(categories)}
+    encoded = np.empty(len(values), dtype=np.int32)
+    for i, value in enumerate(values):
+        if value is None:
+            encoded[i] = -1
+            continue
+        value = getattr(value, "name", value)  # enum members by name
+        if value not in codes:
+            codes[value] = len(categories)
+            categories.append(value)
+        encoded[i] = codes[value]
+    return encoded
+
+
+def _empty(kind: str) -> np.ndarray:
+    return np.empty(0, dtype={"int": np.int64, "float": np.float64, "bool": np.int8,
+                              "datetime": "datetime64[us]", "category": np.int32}[kind])
+
+
+def _keys(shard_code: int, ids) -> np.ndarray:
+    return (np.int64(shard_code) << KEY_SHIFT) | np.asarray(ids, dtype=np.int64)
+
+
+# ==================== SEGMENTS ====================
+
+def _read_manifest(directory: str) -> Optional[dict]:
+    try:
+        with open(os.path.join(directory, MANIFEST)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _write_manifest(directory: str, manifest: dict):
+    path = os.path.join(directory, MANIFEST)
+    with open(path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(path + ".tmp", path)
+
+
+def _segment_path(directory: str, table: str, segment: str) -> str:
+    return os.path.join(directory, table, segment)
+
+
+def _load_segment(path: str, columns) -> tuple:
+    """(keys, deleted keys, {column: array}) of one segment, memory-mapped"""
+    arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r") for name in columns}
+    return (np.load(os.path.join(path, "_key.npy"), mmap_mode="r"),
+            np.load(os.path.join(path, "_deleted.npy"), mmap_mode="r"), arrays)
+
+
+def read_table(directory: str, name: str, state: dict, columns=None) -> tuple:
+    """(keys, {column: array}) of the live rows of a table, segments merged"""
+    columns = list(state["columns"]) if columns is None else list(columns)
+    segments = [_load_segment(_segment_path(directory, name, segment), columns) for segment in state["segments"]]
+    if not segments:
+        return np.empty(0, dtype=np.int64), {column: _empty(state["columns"][column]) for column in columns}
+
+    keys = np.concatenate([segment[0] for segment in segments])
+    rows = {column: np.concatenate([segment[2][column] for segment in segments]) for column in columns}
+    if not state["mutable"]:
+        return keys, rows  # appended rows are never repeated or deleted
+    deleted = np.concatenate([segment[1] for segment in segments])
+
+    # The last copy of each key wins...
+    row_segment = np.repeat(np.arange(len(segments)), [len(segment[0]) for segment in segments])
+    unique_keys, last_reversed = np.unique(keys[::-1], return_index=True)
+    last = len(keys) - 1 - last_reversed
+    alive = np.ones(len(last), dtype=bool)
+
+    # ...unless a later segment deleted it
+    if len(deleted):
+        deleted_segment = np.repeat(np.arange(len(segments)), [len(segment[1]) for segment in segments])
+        deleted_keys, deleted_last = np.unique(deleted[::-1], return_index=True)
+        deleted_at = deleted_segment[len(deleted) - 1 - deleted_last]
+        position = np.minimum(np.searchsorted(deleted_keys, unique_keys), len(deleted_keys) - 1)
+        found = deleted_keys[position] == unique_keys
+        alive[found] = row_segment[last[found]] > deleted_at[position[found]]
+
+    last = last[alive]
+    return unique_keys[alive], {column: values[last] for column, values in rows.items()}
+
+
+class SegmentWriter:
+    """Buffers encoded batches of a table and writes them as segments"""
+
+    def __init__(self, directory: str, name: str, manifest: dict, state: dict):
+        self.directory = directory
+        self.name = name
+        self.manifest = manifest
+        self.state = state
+        self.written = []
+        self._reset()
+
+    def _reset(self):
+        self._keys, self._deleted, self._rows, self._count = [], [], {column: [] for column in self.state["columns"]}, 0
+
+    def add(self, keys: np.ndarray, rows: dict):
+        self._keys.append(keys)
+        for column, values in rows.items():
+            self._rows[column].append(values)
+        self._count += len(keys)
+        if self._count >= SNAPSHOT_SEGMENT_ROWS:
+            self.flush()
+
+    def delete(self, keys: np.ndarray):
+        self._deleted.append(np.asarray(keys, dtype=np.int64))
+
+    def flush(self):
+        if not self._count and not any(len(keys) for keys in self._deleted):
+            return
+        segment = f"{self.manifest['next_segment']:06d}"
+        self.manifest["next_segment"] += 1
+        path = _segment_path(self.directory, self.name, segment)
+        os.makedirs(path + ".tmp", exist_ok=True)
+        np.save(os.path.join(path + ".tmp", "_key.npy"), _concat(self._keys, np.int64))
+        np.save(os.path.join(path + ".tmp", "_deleted.npy"), _concat(self._deleted, np.int64))
+        for column, kind in self.state["columns"].items():
+            values = np.concatenate(self._rows[column]) if self._rows[column] else _empty(kind)
+            np.save(os.path.join(path + ".tmp", f"{column}.npy"), values)
+        os.rename(path + ".tmp", path)
+        self.written.append(segment)
+        self._reset()
+
+
+def _concat(arrays: list, dtype) -> np.ndarray:
+    return np.concatenate(arrays).astype(dtype) if arrays else np.empty(0, dtype=dtype)
+
+
+# ==================== EXPORT ====================
+
+def _encode_rows(spec: TableSpec, state: dict, shard_code: int, rows: list) -> tuple:
+    keys = _keys(shard_code, [row.id for row in rows])
+    encoded = {column: _encode(kind, [getattr(row, column) for row in rows], state["categories"].setdefault(column, []))
+               for column, kind in state["columns"].items()}
+    return keys, encoded
+
+
+def _select(spec: TableSpec):
+    return select(spec.table.c.id, *(spec.table.c[column] for column in spec.columns))
+
+
+def _export_appended(db, spec: TableSpec, state: dict, shard: str, shard_code: int, writer: SegmentWriter) -> int:
+    """Rows added since the last export, up to the first one younger than the lag"""
+    since = state["max_id"].get(shard, 0)
+    stmt = _select(spec).where(spec.table.c.id > since).order_by(spec.table.c.id)
+    if spec.time_column is not None:
+        cutoff = datetime.utcnow() - timedelta(seconds=SNAPSHOT_LAG_SECONDS)
+        first_young = db.scalar(
+            select(func.min(spec.table.c.id))
+            .where(spec.table.c.id > since, spec.table.c[spec.time_column] >= cutoff)
+        )
+        if first_young is not None:
+            stmt = stmt.where(spec.table.c.id < first_young)
+    exported = 0
+    for rows in db.execute(stmt.execution_options(yield_per=SNAPSHOT_BATCH_ROWS)).partitions():
+        writer.add(*_encode_rows(spec, state, shard_code, rows))
+        state["max_id"][shard] = rows[-1].id
+        exported += len(rows)
+    return exported
+
+
+def _export_changed(db, spec: TableSpec, state: dict, shard_code: int, writer: SegmentWriter,
+                    known: tuple) -> tuple:
+    """Rows added or changed since the last export, and ids that are gone: (exported, deleted)"""
+    known_keys, known_stamps = known
+    in_shard = (known_keys >> KEY_SHIFT) == shard_code
+    known_ids = known_keys[in_shard] & ID_MASK  # sorted, as merged keys are
+    if known_stamps is not None:
+        known_stamps = known_stamps[in_shard]
+
+    columns = [spec.table.c.id] + ([spec.table.c[spec.stamp]] if spec.stamp else [])
+    live = db.execute(select(*columns).order_by(spec.table.c.id)).all()
+    live_ids = np.fromiter((row[0] for row in live), dtype=np.int64, count=len(live))
+
+    position = np.minimum(np.searchsorted(known_ids, live_ids), max(len(known_ids) - 1, 0))
+    seen = (known_ids[position] == live_ids) if len(known_ids) else np.zeros(len(live_ids), dtype=bool)
+    changed = ~seen
+    if spec.stamp is not None and len(known_ids):
+        live_stamps = _encode(spec.columns[spec.stamp], [row[1] for row in live], [])
+        changed |= seen & (live_stamps != known_stamps[position])
+
+    gone = np.setdiff1d(known_ids, live_ids, assume_unique=True)
+    if len(gone):
+        writer.delete(_keys(shard_code, gone))
+
+    changed_ids = live_ids[changed].tolist()
+    for start in range(0, len(changed_ids), IN_BATCH):
+        rows = db.execute(_select(spec).where(spec.table.c.id.in_(changed_ids[start:start + IN_BATCH]))).all()
+        if rows:
+            writer.add(*_encode_rows(spec, state, shard_code, rows))
+    return len(changed_ids), len(gone)
+
+
+def _compact(directory: str, spec: TableSpec, manifest: dict, state: dict) -> list:
+    """Rewrite the table as one segment; returns the segments it replaces"""
+    keys, rows = read_table(directory, spec.name, state)
+    replaced = state["segments"]
+    writer = SegmentWriter(directory, spec.name, manifest, state)
+    writer.add(keys, rows)
+    writer.flush()
+    state["segments"] = writer.written
+    return replaced
+
+
+def export(full: bool = False, directory: str = SNAPSHOT_DIR) -> dict:
+    """Bring the snapshot up to date with every shard; `full` rebuilds it from scratch"""
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, ".lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)  # one export at a time
+        started = time.perf_counter()
+        previous = _read_manifest(directory) or {"generation": 0, "next_segment": 1, "shards": [], "tables": {}}
+        manifest = json.loads(json.dumps(previous))
+        obsolete = []  # (table, segment) to remove once the new manifest is in place
+        if full:
+            manifest["tables"] = {}
+            obsolete = [(name, segment) for name, state in previous["tables"].items() for segment in state["segments"]]
+        manifest["shards"] += [shard for shard in sharding.shards if shard not in manifest["shards"]]
+
+        report = {}
+        for spec in TABLES:
+            state = manifest["tables"].get(spec.name)
+            if state is None or state["columns"] != spec.columns:  # new table or changed schema
+                if state is not None:
+                    obsolete += [(spec.name, segment) for segment in state["segments"]]
+                state = {"columns": spec.columns, "mutable": spec.mutable, "categories": {},
+                         "segments": [], "max_id": {}, "rows": 0}
+                manifest["tables"][spec.name] = state
+
+            known = None
+            if spec.mutable:
+                known_keys, known_rows = read_table(directory, spec.name, state, [spec.stamp] if spec.stamp else [])
+                known = (known_keys, known_rows.get(spec.stamp))
+
+            writer = SegmentWriter(directory, spec.name, manifest, state)
+            exported = deleted = 0
+            for shard, session_factory in sharding.session_factories().items():
+                shard_code = manifest["shards"].index(shard)
+                db = session_factory()
+                try:
+                    if spec.mutable:
+                        added, removed = _export_changed(db, spec, state, shard_code, writer, known)
+                        exported, deleted = exported + added, deleted + removed
+                    else:
+                        exported += _export_appended(db, spec, state, shard, shard_code, writer)
+                finally:
+                    db.close()
+            writer.flush()
+            state["segments"] = state["segments"] + writer.written
+
+            if len(state["segments"]) > SNAPSHOT_MAX_SEGMENTS:
+                obsolete += [(spec.name, segment) for segment in _compact(directory, spec, manifest, state)]
+            state["rows"] = len(read_table(directory, spec.name, state, [])[0])
+            report[spec.name] = {"exported": exported, "deleted": deleted, "rows": state["rows"],
+                                 "segments": len(state["segments"])}
+
+        manifest["generation"] += 1
+        manifest["exported_at"] = datetime.utcnow().isoformat()
+        _write_manifest(directory, manifest)
+        for name, segment in obsolete:
+            shutil.rmtree(_segment_path(directory, name, segment), ignore_errors=True)
+
+        elapsed = time.perf_counter() - started
+        print(f"📦 Snapshot {manifest['generation']} exported in {elapsed:.2f}s: "
+              + ", ".join(f"{name} +{entry['exported']}/-{entry['deleted']}" for name, entry in report.items()))
+        return {"generation": manifest["generation"], "seconds": round(elapsed, 3), "tables": report}
+
+
+@jobs.handler("snapshot_export", concurrency=1)
+def snapshot_job(db, payload: dict):
+    return export(full=payload.get("full", False))
+
+
+# ==================== READING ====================
+
+class Table:
+    """Live rows of one table as column arrays"""
+
+    def __init__(self, keys: np.ndarray, columns: dict, categories: dict):
+        self.keys = keys
+        self.columns = columns
+        self.categories = categories
+
+    def __getitem__(self, column: str) -> np.ndarray:
+        return self.columns[column]
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def refs(self, column: str) -> np.ndarray:
+        """A foreign key column as keys of the referenced table (same shard)"""
+        return ((self.keys >> KEY_SHIFT) << KEY_SHIFT) | self.columns[column]
+
+
+class Snapshot:
+    def __init__(self, directory: str, manifest: dict):
+        self.directory = directory
+        self.generation = manifest["generation"]
+        self.exported_at = datetime.fromisoformat(manifest["exported_at"])
+        self._manifest = manifest
+        self._tables = {}
+        self._lock = threading.Lock()
+
+    def table(self, name: str) -> Table:
+        with self._lock:
+            if name not in self._tables:
+                state = self._manifest["tables"][name]
+                keys, columns = read_table(self.directory, name, state)
+                self._tables[name] = Table(keys, columns, state["categories"])
+            return self._tables[name]
+
+
+_current = None
+_current_lock = threading.Lock()
+
+
+def load(directory: str = SNAPSHOT_DIR) -> Optional[Snapshot]:
+    """The latest exported snapshot, None before the first export; tables are read on first use"""
+    global _current
+    manifest = _read_manifest(directory)
+    if manifest is None:
+        return None
+    with _current_lock:
+        if _current is None or _current.directory != directory or _current.generation != manifest["generation"]:
+            _current = Snapshot(directory, manifest)
+        return _current
+
+
+def status(directory: str = SNAPSHOT_DIR) -> dict:
+    manifest = _read_manifest(directory)
+    if manifest is None:
+        return {"generation": 0, "exported_at": None, "tables": {}}
+    return {
+        "generation": manifest["generation"],
+        "exported_at": manifest["exported_at"],
+        "tables": {name: {"rows": state["rows"], "segments": len(state["segments"])}
+                   for name, state in manifest["tables"].items()},
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Export the columnar analytics snapshot")
+    parser.add_argument("command", choices=["export", "status"])
+    parser.add_argument("--full", action="store_true", help="rebuild instead of exporting changes")
+    parser.add_argument("--directory", default=SNAPSHOT_DIR)
+    args = parser.parse_args()
+
+    if args.command == "export":
+        print(json.dumps(export(args.full, args.directory), indent=2))
+    else:
+        print(json.dumps(status(args.directory), indent=2))
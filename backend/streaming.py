@@ -0,0 +1,125 @@
+"""
+Streaming JSON arrays for large list responses.
+
+`encode_rows(rows, item_type)` turns an iterable of ORM rows into the bytes
+of a JSON array, STREAM_BATCH_ROWS rows at a time: each batch is validated
+and dumped with the route's Pydantic schema, so the output is identical to
+a regular response. Routes feed it from queries with
+`yield_per(STREAM_BATCH_ROWS)`, which reads from a server-side cursor on
+Postgres, so only one batch of rows and bytes is in memory at a time.
+
+`json_response(chunks)` reads ahead up to STREAM_MIN_BYTES. A list that
+ends before that is sent as a plain response with a Content-Length;
+anything bigger is sent as it is encoded, so the first rows leave before
+the last ones are read. Compression of either is up to compression.py.
+
+The chunks are produced in the threadpool after the endpoint returned,
+with the request's session still open: FastAPI 0.104 runs the teardown of
+yield dependencies (get_db) only once the response has been sent. Where
+that session is shared, as by the sub-requests of POST /api/batch, the
+caller sets `buffered` and every list is read in full before returning.
+
+Run `python streaming.py` to compare peak memory and time to the first row
+with building the whole list.
+"""
+import itertools
+import os
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Iterable, Iterator, List, Optional
+
+from fastapi import Response
+from fastapi.responses import StreamingResponse
+from pydantic import TypeAdapter
+
+STREAM_BATCH_ROWS = int(os.getenv("STREAM_BATCH_ROWS", "500"))
+STREAM_MIN_BYTES = int(os.getenv("STREAM_MIN_BYTES", str(64 * 1024)))
+
+# True while responses must not outlive the handler, see batch.py
+buffered: ContextVar[bool] = ContextVar("buffered", default=False)
+
+
+@lru_cache(maxsize=None)
+def adapter_for(response_type) -> TypeAdapter:
+    return TypeAdapter(response_type)
+
+
+def encode_rows(rows: Iterable, item_type) -> Iterator[bytes]:
+    """JSON array of `rows` serialized as `item_type`, one chunk per batch of rows"""
+    adapter = adapter_for(List[item_type])
+    rows = iter(rows)
+    yield b"["
+    separator = b""
+    while batch := list(itertools.islice(rows, STREAM_BATCH_ROWS)):
+        body = adapter.dump_json(adapter.validate_python(batch, from_attributes=True))
+        yield separator + body[1:-1]
+        separator = b","
+    yield b"]"
+
+
+def json_response(chunks: Iterator[bytes], headers: Optional[dict] = None) -> Response:
+    """A plain response for arrays under STREAM_MIN_BYTES (or any size when `buffered`), a streamed one otherwise"""
+    head, size = [], 0
+    stream = not buffered.get()
+    for chunk in chunks:
+        head.append(chunk)
+        size += len(chunk)
+        if stream and size >= STREAM_MIN_BYTES:
+            return StreamingResponse(itertools.chain(head, chunks), media_type="application/json", headers=headers)
+    return Response(content=b"".join(head), media_type="application/json", headers=headers)
+
+
+if __name__ == "__main__":
+    import tempfile
+    import time
+    import tracemalloc
+
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+
+    import models
+    import schemas
+
+    n = 50_000
+    with tempfile.TemporaryDirectory() as directory:
+        bench_engine = create_engine(f"sqlite:///{directory}/bench.db")
+        models.Base.metadata.create_all(bind=bench_engine)
+        db = sessionmaker(bind=bench_engine)()
+        db.add(models.User(email="bench@example.com", hashed_password="-", full_name="Bench"))
+        db.flush()
+        db.bulk_insert_mappings(models.SavedNews, [
+            {"user_id": 1, "title": f"Article {i} " + "headline " * 8, "description": "summary " * 30,
+             "url": f"https://example.com/{i}", "source": "Example"}
+            for i in range(n)
+        ])
+        db.commit()
+        db.close()
+
+        def query(session):
+            return session.query(models.SavedNews).filter(models.SavedNews.user_id == 1).order_by(models.SavedNews.id)
+
+        def measure(label, produce):
+            session = sessionmaker(bind=bench_engine)()
+            tracemalloc.start()
+            began = time.perf_counter()
+            first, size = None, 0
+            for chunk in produce(session):
+                if first is None and len(chunk) > 1:  # past the opening bracket
+                    first = time.perf_counter() - began
+                size += len(chunk)
+            total = time.perf_counter() - began
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            session.close()
+            print(f"⏱️ {label:<10} {n:,} rows, {size / 1e6:.1f}MB: first row {first * 1e3:.0f}ms, "
+                  f"total {total * 1e3:.0f}ms, peak {peak / 1e6:.1f}MB")
+
+        def whole(session):
+            adapter = adapter_for(List[schemas.SavedNewsResponse])
+            yield adapter.dump_json(adapter.validate_python(query(session).all(), from_attributes=True))
+
+        def streamed(session):
+            return encode_rows(query(session).yield_per(STREAM_BATCH_ROWS), schemas.SavedNewsResponse)
+
+        measure("list", whole)
+        measure("streamed", streamed)
@@ -0,0 +1,83 @@
+"""
+Shared fixtures. Tests run against throwaway SQLite files: the main
+database, which also holds the shard directory, as shard "s0" and a second
+database as shard "s1", so moves and shard-keyed snapshots are covered.
+
+The modules read their settings when imported, so the environment is set
+here before any of them is.
+
+    cd backend && python -m pytest
+"""
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+DATA_DIR = tempfile.mkdtemp(prefix="human-tests-")
+MAIN_URL = f"sqlite:///{DATA_DIR}/main.db"
+os.environ.update({
+    "DATABASE_URL": MAIN_URL,
+    "SHARD_URLS": f"s0={MAIN_URL},s1=sqlite:///{DATA_DIR}/s1.db",
+    "SHARD_DIRECTORY_TTL_SECONDS": "0",
+    "SHARD_MOVE_DRAIN_SECONDS": "0",
+    "JOB_WORKER_MODE": "worker",
+    "REMINDERS_ENABLED": "false",
+    "RATE_LIMIT_ENABLED": "false",
+})
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import models  # noqa: E402
+import response_cache  # noqa: E402
+import sharding  # noqa: E402
+
+
+@pytest.fixture(scope="session", autouse=True)
+def data_dir():
+    yield DATA_DIR
+    for shard in sharding.shards.values():
+        shard.engine.dispose()
+    shutil.rmtree(DATA_DIR, ignore_errors=True)
+
+
+@pytest.fixture(autouse=True)
+def databases(monkeypatch):
+    """Empty tables on every shard and an empty response cache for each test"""
+    for shard in sharding.shards.values():
+        models.Base.metadata.drop_all(bind=shard.engine)
+        models.Base.metadata.create_all(bind=shard.engine)
+    sharding._routes.clear()
+    monkeypatch.setattr(response_cache, "backend", response_cache.create_backend())
+
+
+@pytest.fixture
+def make_user():
+    """Create a user on a shard: `make_user(email, shard)` -> user id"""
+    def create(email: str, shard: str = "s0") -> int:
+        db = sharding.shards["s0"].session_factory()
+        try:
+            user_id = sharding.register(db, email)
+            sharding._set_directory(user_id, shard=shard)
+            sharding.bind(db, shard)
+            db.add(models.User(id=user_id, email=email, full_name=email, hashed_password="x"))
+            db.commit()
+        finally:
+            db.close()
+        return user_id
+    return create
+
+
+@pytest.fixture
+def session():
+    """`session(shard)` opens a session on a shard; all are closed after the test"""
+    opened = []
+
+    def open_session(shard: str = "s0"):
+        db = sharding.shards[shard].session_factory()
+        opened.append(db)
+        return db
+
+    yield open_session
+    for db in opened:
+        db.close()
@@ -0,0 +1,94 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+import models
+import rate_limit
+import streaming
+
+
+@pytest.fixture
+def client():
+    return TestClient(main.app)
+
+
+@pytest.fixture
+def headers(client):
+    body = {"email": "batch@example.com", "password": "secret", "full_name": "Batch"}
+    assert client.post("/api/auth/signup", json=body).status_code == 200
+    response = client.post("/api/auth/login", data={"username": body["email"], "password": body["password"]})
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+def _add_rows(session, email: str, n: int) -> int:
+    db = session("s0")
+    user = db.query(models.User).filter(models.User.email == email).one()
+    sector = models.Sector(user_id=user.id, name="Health", sector_type="HEALTH")
+    db.add(sector)
+    db.flush()
+    db.add_all(models.Goal(sector_id=sector.id, title=f"Goal {i}", target_value=10) for i in range(n))
+    db.add_all(models.SavedNews(user_id=user.id, title=f"News {i}", url=f"https://example.com/{i}")
+               for i in range(n))
+    db.commit()
+    return sector.id
+
+
+def test_batch_returns_large_lists_in_full(monkeypatch, client, headers, session):
+    monkeypatch.setattr(streaming, "STREAM_MIN_BYTES", 1024)  # every list below is streamed on its own
+    _add_rows(session, "batch@example.com", 300)
+    requests = [{"id": "goals", "path": "/api/goals"}, {"id": "news", "path": "/api/saved-news"},
+                {"id": "again", "path": "/api/goals"}]
+    response = client.post("/api/batch", headers=headers, json={"requests": requests})
+    direct = client.get("/api/goals", headers=headers)
+    assert direct.status_code == 200 and len(direct.json()) == 300
+
+    assert response.status_code == 200
+    results = {item["id"]: item for item in response.json()["responses"]}
+    assert [item["id"] for item in response.json()["responses"]] == ["goals", "news", "again"]
+    assert all(item["status"] == 200 for item in results.values())
+    assert results["goals"]["body"] == direct.json()
+    assert results["again"]["body"] == direct.json()
+    assert len(results["news"]["body"]) == 300
+
+
+def test_batch_runs_writes_and_reads_in_order(client, headers, session):
+    sector_id = _add_rows(session, "batch@example.com", 2)
+    requests = [
+        {"id": "before", "path": "/api/goals"},
+        {"id": "create", "method": "POST", "path": f"/api/sectors/{sector_id}/goals",
+         "body": {"title": "Read more", "target_value": 12}},
+        {"id": "after", "path": "/api/goals"},
+        {"id": "missing", "path": "/api/sectors/999999"},
+    ]
+    results = {item["id"]: item for item in
+               client.post("/api/batch", headers=headers, json={"requests": requests}).json()["responses"]}
+
+    assert results["create"]["status"] == 200
+    assert len(results["after"]["body"]) == len(results["before"]["body"]) + 1
+    assert results["missing"]["status"] == 404
+
+
+def test_batch_rejects_excluded_routes(client, headers):
+    response = client.post("/api/batch", headers=headers, json={"requests": [{"path": "/api/batch"}]})
+    assert response.status_code == 400
+
+
+def test_batch_items_are_charged_to_their_budgets(monkeypatch, client, headers, session):
+    monkeypatch.setattr(rate_limit, "RATE_LIMIT_ENABLED", True)
+    monkeypatch.setattr(rate_limit, "_backend", rate_limit.MemoryBackend())
+    sector_id = _add_rows(session, "batch@example.com", 0)
+    write = {"method": "POST", "path": f"/api/sectors/{sector_id}/goals", "body": {"title": "x", "target_value": 1}}
+
+    first = client.post("/api/batch", headers=headers, json={"requests": [write] * 15})
+    assert first.status_code == 200
+    assert [item["status"] for item in first.json()["responses"]] == [200] * 15
+
+    # The write bucket holds 20 and refills at 2/s, so 15 more must wait
+    second = client.post("/api/batch", headers=headers, json={"requests": [write] * 15})
+    assert second.status_code == 429 and int(second.headers["retry-after"]) >= 1
+    assert len(client.get("/api/goals", headers=headers).json()) == 15
+
+    delete = {"method": "DELETE", "path": "/api/goals/1"}
+    too_many = client.post("/api/batch", headers=headers, json={"requests": [delete] * 11})
+    assert too_many.status_code == 400
+
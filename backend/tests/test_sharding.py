@@ -0,0 +1,139 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy import func, select
+
+import changelog
+import leaderboard
+import models
+import sharding
+
+
+def _add_data(db, user_id: int) -> dict:
+    """A sector with a goal, its progress and a message, a conversation with a reply, news and a notification"""
+    sector = models.Sector(user_id=user_id, name="Health", sector_type="HEALTH")
+    conversation = models.Conversation(user_id=user_id, title="Chat")
+    db.add_all([sector, conversation])
+    db.flush()
+    goal = models.Goal(sector_id=sector.id, title="Run", target_value=10)
+    db.add_all([
+        goal,
+        models.Message(sector_id=sector.id, content="hello", is_user=True),
+        models.ConversationMessage(conversation_id=conversation.id, role="user", content="hi"),
+        models.SavedNews(user_id=user_id, title="News", url="https://example.com"),
+        models.Notification(user_id=user_id, kind="deadline_reminder", title="Soon"),
+    ])
+    db.flush()
+    db.add(models.GoalProgress(goal_id=goal.id, value=3))
+    changelog.record(db, user_id, "sector", sector.id)
+    changelog.record(db, user_id, "goal", goal.id)
+    db.commit()
+    return {"sector": sector.id, "conversation": conversation.id}
+
+
+def _counts(db, user_id: int) -> dict:
+    """Rows the user owns on one shard, per model"""
+    sector_ids = select(models.Sector.id).where(models.Sector.user_id == user_id)
+    conversation_ids = select(models.Conversation.id).where(models.Conversation.user_id == user_id)
+    goal_ids = select(models.Goal.id).where(models.Goal.sector_id.in_(sector_ids))
+    conditions = {
+        models.User: models.User.id == user_id,
+        models.Sector: models.Sector.user_id == user_id,
+        models.Goal: models.Goal.sector_id.in_(sector_ids),
+        models.GoalProgress: models.GoalProgress.goal_id.in_(goal_ids),
+        models.Message: models.Message.sector_id.in_(sector_ids),
+        models.Conversation: models.Conversation.user_id == user_id,
+        models.ConversationMessage: models.ConversationMessage.conversation_id.in_(conversation_ids),
+        models.SavedNews: models.SavedNews.user_id == user_id,
+        models.Notification: models.Notification.user_id == user_id,
+        models.ChangeLog: models.ChangeLog.user_id == user_id,
+        models.PurgeTask: models.PurgeTask.user_id == user_id,
+    }
+    return {model.__tablename__: db.scalar(select(func.count()).select_from(model).where(condition))
+            for model, condition in conditions.items()}
+
+
+def _directory(user_id: int) -> tuple:
+    db = sharding.shards["s0"].session_factory()
+    try:
+        entry = db.get(models.UserShard, user_id)
+        return entry.shard, bool(entry.moving)
+    finally:
+        db.close()
+
+
+def test_move_copies_the_user_and_purges_the_old_shard(make_user, session):
+    user_id = make_user("mover@example.com", "s0")
+    bystander = make_user("stays@example.com", "s0")
+    _add_data(session("s0"), user_id)
+    _add_data(session("s0"), bystander)
+    before = _counts(session("s0"), user_id)
+    bystander_before = _counts(session("s0"), bystander)
+
+    result = sharding.move_user(user_id, "s1")
+
+    assert result["moved"] and result["shard"] == "s1"
+    assert _directory(user_id) == ("s1", False)
+    moved = _counts(session("s1"), user_id)
+    for table, count in before.items():
+        if table != "change_log":  # the copy records a resync instead of replaying the log
+            assert moved[table] == count, table
+    assert session("s1").get(models.User, user_id).sync_floor > 0
+
+    # Everything the user owned on s0 is gone, including the purge bookkeeping
+    assert set(_counts(session("s0"), user_id).values()) == {0}
+    assert _counts(session("s0"), bystander) == bystander_before
+    assert _directory(bystander) == ("s0", False)
+
+
+def test_move_is_aborted_by_a_concurrent_write(monkeypatch, make_user, session):
+    user_id = make_user("busy@example.com", "s0")
+    _add_data(session("s0"), user_id)
+    copy = sharding._copy
+
+    def copy_then_write(source, target, copied_user_id):
+        counts = copy(source, target, copied_user_id)
+        # A request that got past the `moving` check before the drain ended
+        writer = sharding.shards["s0"].session_factory()
+        try:
+            sector = models.Sector(user_id=user_id, name="Late", sector_type="CAREER")
+            writer.add(sector)
+            writer.flush()
+            changelog.record(writer, user_id, "sector", sector.id)
+            writer.commit()
+        finally:
+            writer.close()
+        return counts
+
+    monkeypatch.setattr(sharding, "_copy", copy_then_write)
+    with pytest.raises(RuntimeError, match="changed during the copy"):
+        sharding.move_user(user_id, "s1")
+
+    assert _directory(user_id) == ("s0", False)
+    assert set(_counts(session("s1"), user_id).values()) == {0}
+    source = session("s0")
+    assert _counts(source, user_id)["sectors"] == 2
+    assert source.scalar(select(func.count()).select_from(models.Sector)
+                         .where(models.Sector.deleted_at.isnot(None))) == 0
+
+
+def test_move_waits_for_pending_jobs(make_user, session):
+    user_id = make_user("queued@example.com", "s0")
+    db = session("s0")
+    db.add(models.Job(user_id=user_id, kind="evaluate_badges", payload={}, run_at=datetime.utcnow()))
+    db.commit()
+
+    with pytest.raises(RuntimeError, match="pending jobs"):
+        sharding.move_user(user_id, "s1")
+
+    assert _directory(user_id) == ("s0", False)
+    assert session("s1").get(models.User, user_id) is None
+
+
+def test_leaderboard_names_come_from_each_users_shard(make_user, session):
+    near = make_user("near@example.com", "s0")
+    far = make_user("far@example.com", "s1")
+
+    names = leaderboard.display_names(session("s0"), [near, far, 999])
+
+    assert names == {near: "near@example.com", far: "far@example.com"}
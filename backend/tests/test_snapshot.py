@@ -0,0 +1,104 @@
+import os
+from datetime import datetime, timedelta
+
+import numpy as np
+
+import models
+import snapshot
+
+OLD = datetime.utcnow() - timedelta(seconds=snapshot.SNAPSHOT_LAG_SECONDS + 600)
+
+
+def _ids(snap: snapshot.Snapshot, table: str) -> list:
+    return sorted((snap.table(table).keys & snapshot.ID_MASK).tolist())
+
+
+def _sector_types(snap: snapshot.Snapshot) -> dict:
+    """(shard code, id) -> SectorType name of every live sector in the snapshot"""
+    sectors = snap.table("sectors")
+    labels = sectors.categories["sector_type"]
+    return {(int(key) >> snapshot.KEY_SHIFT, int(key) & snapshot.ID_MASK): labels[code]
+            for key, code in zip(sectors.keys, sectors["sector_type"])}
+
+
+def _live_sector_types(session, manifest_shards: list) -> dict:
+    found = {}
+    for code, shard in enumerate(manifest_shards):
+        for sector_id, sector_type in session(shard).query(models.Sector.id, models.Sector.sector_type):
+            found[(code, sector_id)] = sector_type.name
+    return found
+
+
+def _add_sector(db, user_id: int, sector_type: str = "HEALTH") -> models.Sector:
+    sector = models.Sector(user_id=user_id, name="s", sector_type=sector_type)
+    db.add(sector)
+    db.commit()
+    return sector
+
+
+def test_appended_rows_held_back_by_lag_are_not_skipped(tmp_path, make_user, session):
+    user_id = make_user("lag@example.com")
+    db = session()
+    sector = _add_sector(db, user_id)
+    # Ids do not follow timestamps: the middle row is still inside the lag window
+    messages = [models.Message(sector_id=sector.id, content="m", is_user=True, created_at=created_at)
+                for created_at in (OLD, datetime.utcnow(), OLD)]
+    db.add_all(messages)
+    db.commit()
+    first, young, last = (message.id for message in messages)
+
+    snapshot.export(directory=str(tmp_path))
+    assert _ids(snapshot.load(str(tmp_path)), "messages") == [first]
+
+    messages[1].created_at = OLD
+    db.commit()
+    snapshot.export(directory=str(tmp_path))
+    assert _ids(snapshot.load(str(tmp_path)), "messages") == [first, young, last]
+
+
+def test_segments_merge_updates_deletions_and_compaction(tmp_path, monkeypatch, make_user, session):
+    monkeypatch.setattr(snapshot, "SNAPSHOT_MAX_SEGMENTS", 2)
+    directory = str(tmp_path)
+    s0, s1 = session("s0"), session("s1")
+    near = make_user("near@example.com", "s0")
+    far = make_user("far@example.com", "s1")
+    kept, changed, dropped, last = (_add_sector(s0, near) for _ in range(4))
+    remote = _add_sector(s1, far)  # same ids as on s0, told apart by the shard code
+
+    report = snapshot.export(directory=directory)
+    shards = snapshot._read_manifest(directory)["shards"]
+    assert report["tables"]["sectors"]["rows"] == 5
+    assert _sector_types(snapshot.load(directory)) == _live_sector_types(session, shards)
+
+    # Second segment: one row changed, one deleted, one added
+    changed.sector_type = models.SectorType.FINANCE
+    changed.version += 1
+    s0.delete(dropped)
+    s0.commit()
+    added = _add_sector(s0, near, "CAREER")
+    report = snapshot.export(directory=directory)
+    assert report["tables"]["sectors"] == {"exported": 2, "deleted": 1, "rows": 5, "segments": 2}
+    snap = snapshot.load(directory)
+    assert _sector_types(snap) == _live_sector_types(session, shards)
+    assert _sector_types(snap)[(shards.index("s0"), changed.id)] == "FINANCE"
+
+    # A third segment goes over the limit and the table is rewritten as one
+    s0.delete(kept)
+    s0.commit()
+    remote.sector_type = models.SectorType.LEARNING
+    remote.version += 1
+    s1.commit()
+    before = set(snapshot._read_manifest(directory)["tables"]["sectors"]["segments"])
+    report = snapshot.export(directory=directory)
+    assert report["tables"]["sectors"]["segments"] == 1
+    assert report["tables"]["sectors"]["rows"] == 4
+    snap = snapshot.load(directory)
+    assert _sector_types(snap) == _live_sector_types(session, shards)
+    assert set(_sector_types(snap)) == {(shards.index("s0"), sector.id) for sector in (changed, last, added)} | {
+        (shards.index("s1"), remote.id)}
+
+    # The replaced segments are gone from disk once the new manifest is in place
+    segments = snapshot._read_manifest(directory)["tables"]["sectors"]["segments"]
+    assert not before & set(segments)
+    assert sorted(os.listdir(os.path.join(directory, "sectors"))) == segments
+    assert np.all(np.diff(snap.table("sectors").keys) > 0)
@@ -1,11 +1,58 @@
-import React, { useState } from 'react';
+import React, { useEffect, useState } from 'react';
 import { Link, useNavigate, useLocation } from 'react-router-dom';
 import { motion, AnimatePresence } from 'framer-motion';
+import toast from 'react-hot-toast';
+import { eventsAPI, notificationAPI } from '../../utils/api';
+
+const UNREAD_POLL_MS = 60000;
 
 const DashboardNav = ({ user }) => {
   const navigate = useNavigate();
   const location = useLocation();
   const [showMenu, setShowMenu] = useState(false);
+  const [showInbox, setShowInbox] = useState(false);
+  const [unread, setUnread] = useState(0);
+  const [inbox, setInbox] = useState([]);
+
+  useEffect(() => {
+    const refreshUnread = () => notificationAPI.unreadCount().then(setUnread).catch(() => {});
+    refreshUnread();
+    const timer = setInterval(refreshUnread, UNREAD_POLL_MS);
+    const unsubscribe = eventsAPI.subscribe({
+      notification: (notification) => {
+        setUnread(notification.unread);
+        setInbox((items) => [notification, ...items]);
+        toast(notification.title, { duration: 8000 });
+      },
+    });
+    return () => {
+      clearInterval(timer);
+      unsubscribe();
+    };
+  }, []);
+
+  const openInbox = async () => {
+    setShowInbox(!showInbox);
+    if (showInbox) return;
+    try {
+      const response = await notificationAPI.list({ limit: 10 });
+      setInbox(response.data.items);
+      setUnread(response.data.unread);
+    } catch (error) {
+      console.error('Error fetching notifications:', error);
+    }
+  };
+
+  const markAllRead = async () => {
+    if (inbox.length === 0) return;
+    try {
+      const response = await notificationAPI.markRead({ up_to: inbox[0].id });
+      setUnread(response.data.unread);
+      setInbox((items) => items.map((item) => ({ ...item, read_at: item.read_at || new Date().toISOString() })));
+    } catch (error) {
+      console.error('Error marking notifications read:', error);
+    }
+  };
 
   const handleLogout = () => {
     localStorage.removeItem('token');
@@ -76,6 +123,47 @@ const DashboardNav = ({ user }) => {
               </div>
             )}
 
+            {/* Notifications */}
+            <div className="relative">
+              <button
+                onClick={openInbox}
+                className="relative p-2 rounded-lg bg-white/5 border border-white/10 text-white hover:bg-white/10 transition-all"
+              >
+                <span className="text-xl leading-6">🔔</span>
+                {unread > 0 && (
+                  <span className="absolute -top-1 -right-1 min-w-5 h-5 px-1 rounded-full bg-primary text-background-dark text-xs font-bold flex items-center justify-center">
+                    {unread > 99 ? '99+' : unread}
+                  </span>
+                )}
+              </button>
+
+              {showInbox && (
+                <div className="absolute top-12 right-0 w-80 rounded-xl border border-white/10 bg-background-dark/95 backdrop-blur-md shadow-2xl overflow-hidden">
+                  <div className="flex items-center justify-between px-4 py-3 border-b border-white/10">
+                    <span className="font-medium text-white">Notifications</span>
+                    <button onClick={markAllRead} className="text-xs text-primary hover:opacity-80">
+                      Mark all read
+                    </button>
+                  </div>
+                  {inbox.length === 0 ? (
+                    <div className="px-4 py-6 text-center text-sm text-white/50">You're all caught up</div>
+                  ) : (
+                    <div className="max-h-96 overflow-y-auto">
+                      {inbox.map((item) => (
+                        <div
+                          key={item.id}
+                          className={`px-4 py-3 border-b border-white/5 ${item.read_at ? 'opacity-60' : ''}`}
+                        >
+                          <div className="text-sm font-medium text-white">{item.title}</div>
+                          {item.body && <div className="text-xs text-white/60 mt-1">{item.body}</div>}
+                        </div>
+                      ))}
+                    </div>
+                  )}
+                </div>
+              )}
+            </div>
+
             {/* More Menu Button */}
             <button
               onClick={() => setShowMenu(!showMenu)}
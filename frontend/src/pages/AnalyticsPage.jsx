@@ -1,19 +1,19 @@
 import React, { useState, useEffect } from 'react';
 import { useNavigate } from 'react-router-dom';
 import { motion } from 'framer-motion';
-import { authAPI, sectorAPI } from '../utils/api';
+import { analyticsAPI, authAPI } from '../utils/api';
 import DashboardNav from '../components/dashboard/DashboardNav';
 
 const AnalyticsPage = () => {
   const navigate = useNavigate();
   const [user, setUser] = useState(null);
-  const [sectors, setSectors] = useState([]);
+  const [analytics, setAnalytics] = useState(null);
   const [loading, setLoading] = useState(true);
   const [timeframe, setTimeframe] = useState('week');
 
   useEffect(() => {
     fetchUserData();
-    fetchSectors();
+    fetchAnalytics();
   }, []);
 
   const fetchUserData = async () => {
@@ -30,15 +30,19 @@ const AnalyticsPage = () => {
     }
   };
 
-  const fetchSectors = async () => {
+  const fetchAnalytics = async () => {
     try {
-      const response = await sectorAPI.getAll();
-      setSectors(response.data);
+      const response = await analyticsAPI.get();
+      setAnalytics(response.data);
     } catch (error) {
-      console.error('Error fetching sectors:', error);
+      console.error('Error fetching analytics:', error);
     }
   };
 
+  const sectors = analytics?.sectors || [];
+  const weeks = analytics?.weeks || [];
+  const busiestWeek = Math.max(1, ...weeks.map((week) => week.progress_updates));
+
   if (loading) {
     return (
       <div className="min-h-screen bg-background-dark flex items-center justify-center">
@@ -82,8 +86,8 @@ const AnalyticsPage = () => {
           {/* Overview Stats */}
           <div className="grid grid-cols-1 md:grid-cols-4 gap-6 mb-12">
             {[
-              { label: 'Total Activities', value: '0', icon: '📊', trend: '+0%' },
-              { label: 'Goals Completed', value: '0', icon: '✓', trend: '+0%' },
+              { label: 'Total Activities', value: weeks.reduce((sum, week) => sum + week.progress_updates, 0).toString(), icon: '📊', trend: '+0%' },
+              { label: 'Goals Completed', value: (analytics?.summary.completed ?? 0).toString(), icon: '✓', trend: '+0%' },
               { label: 'Current Streak', value: user.streak_days.toString(), icon: '🔥', trend: '+0%' },
               { label: 'Total Points', value: user.total_points.toString(), icon: '⭐', trend: '+0%' },
             ].map((stat, idx) => (
@@ -113,13 +117,28 @@ const AnalyticsPage = () => {
             animate={{ opacity: 1, y: 0 }}
           >
             <h3 className="text-2xl font-bold text-white mb-6">Activity Over Time</h3>
-            <div className="h-64 flex items-center justify-center border border-dashed border-white/10 rounded-lg">
-              <div className="text-center">
-                <div className="text-5xl mb-3">📈</div>
-                <p className="text-white/60">Activity chart coming soon</p>
-                <p className="text-sm text-white/40">Start tracking to see your progress</p>
+            {weeks.some((week) => week.progress_updates > 0) ? (
+              <div className="h-64 flex items-end gap-2">
+                {weeks.map((week) => (
+                  <div key={week.week_start} className="flex-1 flex flex-col items-center gap-2">
+                    <div
+                      className="w-full rounded-t bg-primary/70"
+                      style={{ height: `${(week.progress_updates / busiestWeek) * 200}px` }}
+                      title={`${week.progress_updates} updates, ${week.goals_completed} goals completed`}
+                    />
+                    <div className="text-xs text-white/40">{week.week_start.slice(5)}</div>
+                  </div>
+                ))}
               </div>
-            </div>
+            ) : (
+              <div className="h-64 flex items-center justify-center border border-dashed border-white/10 rounded-lg">
+                <div className="text-center">
+                  <div className="text-5xl mb-3">📈</div>
+                  <p className="text-white/60">No activity yet</p>
+                  <p className="text-sm text-white/40">Start tracking to see your progress</p>
+                </div>
+              </div>
+            )}
           </motion.div>
 
           {/* Sector Breakdown */}
@@ -144,20 +163,25 @@ const AnalyticsPage = () => {
               </div>
             ) : (
               <div className="space-y-4">
-                {sectors.map((sector, idx) => (
+                {sectors.map((sector) => (
                   <div
-                    key={sector.id}
+                    key={sector.sector_id}
                     className="flex items-center gap-4 p-4 rounded-lg bg-white/5 hover:bg-white/10 transition-all cursor-pointer"
-                    onClick={() => navigate(`/sector/${sector.id}`)}
+                    onClick={() => navigate(`/sector/${sector.sector_id}`)}
                   >
                     <div className="text-3xl">{sector.icon}</div>
                     <div className="flex-1">
                       <div className="font-medium text-white mb-1">{sector.name}</div>
-                      <div className="text-sm text-white/60">{sector.sector_type}</div>
+                      <div className="text-sm text-white/60">
+                        {sector.completed}/{sector.goals} goals completed
+                        {sector.at_risk > 0 && ` · ${sector.at_risk} at risk`}
+                      </div>
                     </div>
                     <div className="text-right">
-                      <div className="text-lg font-bold" style={{ color: sector.color }}>0</div>
-                      <div className="text-xs text-white/60">activities</div>
+                      <div className="text-lg font-bold" style={{ color: sector.color }}>
+                        {sector.average_progress === null ? '—' : `${Math.round(sector.average_progress * 100)}%`}
+                      </div>
+                      <div className="text-xs text-white/60">progress</div>
                     </div>
                   </div>
                 ))}
@@ -159,10 +159,12 @@ const BadgesPage = () => {
     );
   }
 
-  // Calculate badges with real progress
+  // Calculate badges with real progress; earned badges come from the server
   const badges = badgeDefinitions.map(badge => {
     const currentProgress = progress[badge.key];
-    const earned = currentProgress >= badge.checkValue;
+    const earned = progress.earned
+      ? progress.earned.includes(badge.key)
+      : currentProgress >= badge.checkValue;
     return {
       ...badge,
       earned,
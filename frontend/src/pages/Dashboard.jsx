@@ -58,7 +58,7 @@ const Dashboard = () => {
 
   const fetchGoals = async () => {
     try {
-      const response = await goalAPI.getAll();
+      const response = await goalAPI.getAll({ fields: 'id,title,deadline,is_completed' });
       console.log('Fetched goals:', response.data);
       setGoals(response.data || []);
     } catch (error) {
@@ -1,7 +1,7 @@
 import React, { useState, useEffect } from 'react';
 import { useNavigate } from 'react-router-dom';
 import { motion } from 'framer-motion';
-import { authAPI, goalAPI, sectorAPI } from '../utils/api';
+import { authAPI, goalAPI, relatedAPI, sectorAPI } from '../utils/api';
 import DashboardNav from '../components/dashboard/DashboardNav';
 import CreateGoalModal from '../components/dashboard/CreateGoalModal';
 
@@ -13,6 +13,7 @@ const GoalsPage = () => {
   const [loading, setLoading] = useState(true);
   const [showCreateModal, setShowCreateModal] = useState(false);
   const [filter, setFilter] = useState('all'); // all, active, completed
+  const [related, setRelated] = useState({}); // goal id -> related saved news
 
   useEffect(() => {
     fetchUserData();
@@ -34,6 +35,19 @@ const GoalsPage = () => {
     }
   };
 
+  const toggleRelated = async (goalId) => {
+    if (related[goalId]) {
+      setRelated(({ [goalId]: _, ...rest }) => rest);
+      return;
+    }
+    try {
+      const response = await relatedAPI.forGoal(goalId, { k: 3, kind: 'saved_news' });
+      setRelated((current) => ({ ...current, [goalId]: response.data }));
+    } catch (error) {
+      console.error('Error fetching related articles:', error);
+    }
+  };
+
   const fetchGoals = async () => {
     try {
       const response = await goalAPI.getAll();
@@ -284,7 +298,34 @@ const GoalsPage = () => {
                               ✓ Completed {new Date(goal.completed_at).toLocaleDateString()}
                             </div>
                           )}
+                          <button
+                            onClick={() => toggleRelated(goal.id)}
+                            className="text-primary hover:opacity-80"
+                          >
+                            {related[goal.id] ? 'Hide related' : '📰 Related articles'}
+                          </button>
                         </div>
+
+                        {/* Related Saved News */}
+                        {related[goal.id] && (
+                          <div className="mt-3 space-y-1">
+                            {related[goal.id].length === 0 ? (
+                              <div className="text-xs text-white/40">No related saved articles yet</div>
+                            ) : (
+                              related[goal.id].map((item) => (
+                                <a
+                                  key={item.id}
+                                  href={item.url}
+                                  target="_blank"
+                                  rel="noopener noreferrer"
+                                  className="block text-sm text-white/70 hover:text-primary truncate"
+                                >
+                                  {item.title}
+                                </a>
+                              ))
+                            )}
+                          </div>
+                        )}
                       </div>
 
                       {/* Delete Button */}
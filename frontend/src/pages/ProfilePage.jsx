@@ -1,7 +1,7 @@
 import React, { useState, useEffect } from 'react';
 import { useNavigate } from 'react-router-dom';
 import { motion, AnimatePresence } from 'framer-motion';
-import { authAPI, sectorAPI, goalAPI, conversationAPI } from '../utils/api';
+import { authAPI, batchAPI } from '../utils/api';
 import DashboardNav from '../components/dashboard/DashboardNav';
 import * as XLSX from 'xlsx';
 
@@ -71,10 +71,10 @@ const ProfilePage = () => {
   const handleExportData = async (format) => {
     try {
       // Fetch all data
-      const [sectorsRes, goalsRes, conversationsRes] = await Promise.all([
-        sectorAPI.getAll(),
-        goalAPI.getAll(),
-        conversationAPI.getAll()
+      const [sectorsRes, goalsRes, conversationsRes] = await batchAPI.getAll([
+        '/api/sectors',
+        '/api/goals',
+        '/api/conversations'
       ]).catch(() => [{ data: [] }, { data: [] }, { data: [] }]);
 
       const exportData = {
@@ -97,6 +97,9 @@ const SectorChatPage = () => {
     setIsTyping(true);
 
     try {
+      // Retrieve the relevant goals, statistics and history before this message is saved
+      const { data: context } = await sectorAPI.getContext(id, inputMessage);
+
       // Save user message to backend
       await sectorAPI.sendMessage(id, inputMessage);
 
@@ -110,8 +113,8 @@ const SectorChatPage = () => {
         body: JSON.stringify({
           model: 'llama-3.1-8b-instant',
           messages: [
-            { role: 'system', content: getSystemPrompt(sector.sector_type) },
-            ...messages.map(m => ({
+            { role: 'system', content: `${getSystemPrompt(sector.sector_type)}\n\nWhat you know about the user:\n${context.context}` },
+            ...context.messages.map(m => ({
               role: m.is_user ? 'user' : 'assistant',
               content: m.content
             })),
@@ -18,6 +18,13 @@ const api = axios.create({
   },
 });
 
+const MAX_RETRIES = 2;
+const RETRY_STATUSES = [502, 503, 504];
+
+const newIdempotencyKey = () => (
+  window.crypto?.randomUUID ? window.crypto.randomUUID() : `${Date.now()}-${Math.random().toString(36).slice(2)}`
+);
+
 // Request interceptor - Add token
 api.interceptors.request.use(
   (config) => {
@@ -26,6 +33,10 @@ api.interceptors.request.use(
       config.headers.Authorization = `Bearer ${token}`;
       console.log('🔑 API Request:', config.method.toUpperCase(), API_BASE_URL + config.url);
     }
+    // One key per logical request; retries reuse the config, so the server replays instead of re-running
+    if (config.method === 'post' && !config.headers['Idempotency-Key']) {
+      config.headers['Idempotency-Key'] = newIdempotencyKey();
+    }
     return config;
   },
   (error) => {
@@ -40,7 +51,18 @@ api.interceptors.response.use(
     console.log('✅ API Response:', response.config.url, response.status);
     return response;
   },
-  (error) => {
+  async (error) => {
+    const { config } = error;
+    const retriable = !error.response || RETRY_STATUSES.includes(error.response.status);
+    const idempotent = config && (config.method !== 'post' || config.headers['Idempotency-Key']);
+    if (retriable && idempotent && (config.retries || 0) < MAX_RETRIES) {
+      config.retries = (config.retries || 0) + 1;
+      const retryAfter = Number(error.response?.headers['retry-after']) || config.retries;
+      await new Promise((resolve) => setTimeout(resolve, retryAfter * 1000));
+      console.log('🔁 Retrying:', config.url, `(${config.retries}/${MAX_RETRIES})`);
+      return api(config);
+    }
+
     console.error('❌ API Error:', error.response?.status, error.response?.data);
     
     if (error.response?.status === 401) {
@@ -71,10 +93,13 @@ export const sectorAPI = {
   delete: (id) => api.delete(`/api/sectors/${id}`),
   getMessages: (id) => api.get(`/api/sectors/${id}/messages`),
   sendMessage: (id, content) => api.post(`/api/sectors/${id}/messages`, { content, is_user: true }),
+  // Goals, statistic rollups and prior messages relevant to a question, within a token budget
+  getContext: (id, q, budget) => api.get(`/api/sectors/${id}/context`, { params: { q, budget } }),
 };
 
 export const goalAPI = {
-  getAll: () => api.get('/api/goals'),
+  // params: { fields: 'id,title', include: 'sector' } to shape the response
+  getAll: (params) => api.get('/api/goals', { params }),
   getBySector: (sectorId) => api.get(`/api/sectors/${sectorId}/goals`),
   create: (sectorId, data) => api.post(`/api/sectors/${sectorId}/goals`, data),
   update: (goalId, data) => api.put(`/api/goals/${goalId}`, data),
@@ -82,6 +107,10 @@ export const goalAPI = {
   delete: (goalId) => api.delete(`/api/goals/${goalId}`),
 };
 
+export const analyticsAPI = {
+  get: () => api.get('/api/analytics'),
+};
+
 export const conversationAPI = {
   getAll: () => api.get('/api/conversations'),
   getById: (id) => api.get(`/api/conversations/${id}`),
@@ -100,6 +129,50 @@ export const savedNewsAPI = {
 
 export const badgeAPI = {
   checkProgress: () => api.get('/api/badges/check-progress'),
+  getAll: () => api.get('/api/badges'),
+  getEarned: () => api.get('/api/badges/earned'),
+};
+
+export const notificationAPI = {
+  // params: { before, limit, unread_only }; pass next_before back as before for the next page
+  list: (params) => api.get('/api/notifications', { params }),
+  // HEAD: just the X-Unread-Count header, cheap enough to poll
+  unreadCount: () => api.head('/api/notifications/unread-count')
+    .then((res) => Number(res.headers['x-unread-count'] || 0)),
+  markRead: (body = {}) => api.post('/api/notifications/read', body),
+};
+
+// Related goals and saved news from the local similarity index; params: { k, kind }
+export const relatedAPI = {
+  search: (q, params) => api.get('/api/related', { params: { q, ...params } }),
+  forGoal: (goalId, params) => api.get(`/api/related/goals/${goalId}`, { params }),
+  forSavedNews: (newsId, params) => api.get(`/api/related/saved-news/${newsId}`, { params }),
+};
+
+// Realtime events over Server-Sent Events; returns a function that closes the stream
+export const eventsAPI = {
+  subscribe: (handlers) => {
+    const token = localStorage.getItem('token');
+    if (!token) return () => {};
+    // EventSource cannot send an Authorization header
+    const source = new EventSource(
+      `${API_BASE_URL.replace(/\/$/, '')}/api/events?token=${encodeURIComponent(token)}`
+    );
+    Object.entries(handlers).forEach(([type, handler]) => {
+      source.addEventListener(type, (event) => handler(JSON.parse(event.data)));
+    });
+    return () => source.close();
+  },
+};
+
+// Several requests in one round trip; resolves to { status, data, error } per request
+export const batchAPI = {
+  run: (requests) => api.post('/api/batch', { requests })
+    .then((res) => res.data.responses.map((item) => {
+      const ok = item.status < 400;
+      return { status: item.status, data: ok ? item.body : null, error: ok ? null : item.body };
+    })),
+  getAll: (paths) => batchAPI.run(paths.map((path) => ({ method: 'GET', path }))),
 };
 
 export default api;